@@ -0,0 +1,90 @@
+require("dotenv").config();
+
+// Compiles quant_gemm_mse_enc(m, p, n) into a shape-keyed cache directory:
+//   node build_shape.js m p n key cache_dir
+// The key (shape and source hash) comes from circuit_artifacts in
+// eth/scripts/circuit_cache.py. The main is generated from lr/circuit.circom with
+// the shape swapped in; outputs are written to <cache_dir>/<key>.tmp and
+// renamed into place once complete, so a cache entry is never partial.
+
+const { execSync } = require("child_process");
+const fs = require("fs");
+const path = require("path");
+const snarkjs = require("snarkjs");
+
+if (process.argv.length !== 7) {
+  console.log("usage");
+  console.log("build_shape m p n key cache_dir");
+  process.exit(1);
+}
+
+const [m, p, n] = process.argv.slice(2, 5).map((v) => parseInt(v, 10));
+const key = process.argv[5];
+const cacheDir = process.argv[6];
+
+async function run() {
+  const logger = {
+    debug: () => { },
+    info: console.log,
+    warn: console.log,
+    error: console.log,
+  };
+
+  const out = path.join(cacheDir, key);
+  if (fs.existsSync(path.join(out, "circuit.zkey"))) {
+    console.log("> Cached " + out);
+    return;
+  }
+  const tmp = out + ".tmp";
+  fs.rmSync(tmp, { recursive: true, force: true });
+  fs.mkdirSync(tmp, { recursive: true });
+
+  // Same includes as lr/circuit.circom, so the source sits one level below
+  // circuits/ like it does
+  const source = fs.readFileSync("./lr/circuit.circom", "utf8")
+    .replace(/component main = quant_gemm_mse_enc\([^)]*\);/, `component main = quant_gemm_mse_enc(${m},${p},${n});`);
+  const sourcePath = path.join(__dirname, "shapes", key + ".circom");
+  fs.mkdirSync(path.dirname(sourcePath), { recursive: true });
+  fs.writeFileSync(sourcePath, source);
+
+  console.log("> Compiling quant_gemm_mse_enc(" + m + "," + p + "," + n + ")");
+  execSync(`npx circom ${sourcePath} --r1cs ${tmp}/circuit.r1cs --wasm ${tmp}/circuit.wasm`, {
+    stdio: "inherit",
+  });
+
+  const r1cs = fs.readFileSync(tmp + "/circuit.r1cs");
+  const ptau = fs.readdirSync(__dirname).filter((fn) => fn.endsWith(".ptau"))[0];
+  console.log("Using ptau: " + ptau);
+
+  const newKey = { type: "mem" };
+  const final_zkey = { type: "mem" };
+  await snarkjs.r1cs.info(r1cs, logger);
+  await snarkjs.zKey.newZKey(r1cs, path.join(__dirname, ptau), newKey, logger);
+  if (process.env.LR_BEACON) {
+    await snarkjs.zKey.beacon(newKey, final_zkey, undefined, process.env.LR_BEACON, 10, logger);
+  } else {
+    await snarkjs.zKey.contribute(newKey, final_zkey, undefined, `${Date.now()}`, logger);
+  }
+  fs.writeFileSync(tmp + "/circuit.zkey", final_zkey.data);
+
+  const verification_key = await snarkjs.zKey.exportVerificationKey(final_zkey);
+  fs.writeFileSync(tmp + "/verification_key.json", JSON.stringify(verification_key, null, 2));
+
+  // A new shape has its own verifier; the deployed LibVerifier only checks
+  // proofs of the shape it was exported for
+  const templates = {};
+  templates.groth16 = await fs.promises.readFile(__dirname + "/templates/verifier_groth16.sol.ejs", "utf8");
+  fs.writeFileSync(tmp + "/LibVerifier.sol",
+    await snarkjs.zKey.exportSolidityVerifier(tmp + "/circuit.zkey", templates, logger));
+
+  fs.rmSync(out, { recursive: true, force: true });
+  fs.renameSync(tmp, out);
+  console.log("> Cached " + out);
+}
+
+run()
+  .then(() => process.exit(0))
+  .catch((error) => {
+    console.error(error);
+    process.exit(1);
+  });
@@ -10,6 +10,16 @@ const wasmPath = process.argv[3];
 const inputPath = process.argv[4];
 
 async function run() {
+    // A running prover.js already has the zkey and wasm loaded
+    if (process.env.PROVER_SOCKET) {
+        const { request } = require("./prover.js");
+        const input = JSON.parse(fs.readFileSync(inputPath));
+        const result = await request(process.env.PROVER_SOCKET, "prove", { input, wasm: wasmPath, zkey: finalZkeyPath });
+        console.log("Proof took " + result.prove_seconds + " s");
+        fs.writeFileSync(process.cwd() + "/sample_calldata.json", result.calldata);
+        return;
+    }
+
     const final_zkey = fs.readFileSync(finalZkeyPath);
     const wasm = fs.readFileSync(wasmPath);
     const wtns = { type: "mem" };
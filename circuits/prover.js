@@ -0,0 +1,178 @@
+// Resident groth16 prover: keeps each circuit's zkey bytes, compiled witness
+// calculator and verification key loaded, and proves witness inputs sent as
+// line-delimited JSON-RPC on a Unix socket (the protocol of quantize.py
+// --mode serve):
+//   node prover.js socket [concurrency]
+//   {"id": 0, "method": "prove", "params": {"input": {...}, "wasm": "/abs/lr.wasm", "zkey": "/abs/lr.zkey"}}
+// Jobs queue behind `concurrency` running proofs. A response carries the
+// proof, the public signals, the collectBounty arguments and the
+// exportSolidityCallData string. `request` is the client side, used by the
+// hardhat tasks and gen_calldata.js when PROVER_SOCKET is set, and needs
+// nothing beyond node's builtins.
+
+const fs = require("fs");
+const net = require("net");
+const path = require("path");
+
+const logger = {
+  debug: () => { },
+  info: () => { },
+  warn: (x) => { console.log("WARN: " + x) },
+  error: (x) => { console.log("ERROR: " + x) },
+};
+
+// Loaded circuits by "wasm|zkey", each a promise so concurrent first jobs
+// load once
+const circuits = new Map();
+
+function loadCircuit(wasmPath, zkeyPath) {
+  const key = wasmPath + "|" + zkeyPath;
+  if (!circuits.has(key)) {
+    circuits.set(key, (async () => {
+      const snarkjs = require("snarkjs");
+      // The version snarkjs pins (package.json); older ones lack calculateWTNSBin
+      const { WitnessCalculatorBuilder } = require("circom_runtime");
+      const start = Date.now();
+      const zkey = { type: "mem", data: fs.readFileSync(zkeyPath) };
+      const calculator = await WitnessCalculatorBuilder(fs.readFileSync(wasmPath));
+      const verification_key = await snarkjs.zKey.exportVerificationKey(zkey);
+      console.log("> Loaded " + wasmPath + ", " + zkeyPath + " in " + (Date.now() - start) / 1000 + " s");
+      return { zkey, calculator, verification_key };
+    })());
+    circuits.get(key).catch(() => circuits.delete(key));
+  }
+  return circuits.get(key);
+}
+
+async function prove(params) {
+  const snarkjs = require("snarkjs");
+  const circuit = await loadCircuit(params.wasm, params.zkey);
+
+  const start = Date.now();
+  const wtns = { type: "mem", data: await circuit.calculator.calculateWTNSBin(params.input, 0) };
+  const witnessed = Date.now();
+  const { proof, publicSignals } = await snarkjs.groth16.prove(circuit.zkey, wtns, logger);
+  const proved = Date.now();
+
+  const verified = await snarkjs.groth16.verify(circuit.verification_key, publicSignals, proof, logger);
+  if (!verified) throw new Error("Could not verify the proof");
+
+  const args = [
+    [proof.pi_a[0], proof.pi_a[1]],
+    [[proof.pi_b[0][1], proof.pi_b[0][0]], [proof.pi_b[1][1], proof.pi_b[1][0]]],
+    [proof.pi_c[0], proof.pi_c[1]],
+    publicSignals,
+  ];
+  return {
+    proof,
+    publicSignals,
+    args,
+    calldata: await snarkjs.groth16.exportSolidityCallData(proof, publicSignals),
+    witness_seconds: (witnessed - start) / 1000,
+    prove_seconds: (proved - witnessed) / 1000,
+  };
+}
+
+function serve(socketPath, concurrency) {
+  const queue = [];
+  var running = 0;
+
+  function next() {
+    while (running < concurrency && queue.length > 0) {
+      const { params, resolve, reject } = queue.shift();
+      running++;
+      prove(params).then(resolve, reject).finally(() => {
+        running--;
+        next();
+      });
+    }
+  }
+
+  function handle(request) {
+    if (request.method === "prove") {
+      return new Promise((resolve, reject) => {
+        queue.push({ params: request.params, resolve, reject });
+        next();
+      });
+    } else if (request.method === "load") {
+      return loadCircuit(request.params.wasm, request.params.zkey).then(() => ({ loaded: true }));
+    } else if (request.method === "status") {
+      return Promise.resolve({ running, queued: queue.length, concurrency, circuits: [...circuits.keys()] });
+    }
+    return Promise.reject(new Error("Unknown method " + request.method));
+  }
+
+  if (fs.existsSync(socketPath)) fs.unlinkSync(socketPath);
+  const server = net.createServer((socket) => {
+    let buffer = "";
+    socket.on("error", () => { });
+    socket.on("data", (chunk) => {
+      buffer += chunk;
+      let end;
+      while ((end = buffer.indexOf("\n")) >= 0) {
+        const line = buffer.slice(0, end);
+        buffer = buffer.slice(end + 1);
+        if (!line.trim()) continue;
+        let request;
+        try {
+          request = JSON.parse(line);
+        } catch (error) {
+          socket.write(JSON.stringify({ id: null, error: error.message }) + "\n");
+          continue;
+        }
+        handle(request).then(
+          (result) => socket.write(JSON.stringify({ id: request.id, result }) + "\n"),
+          (error) => socket.write(JSON.stringify({ id: request.id, error: error.message || String(error) }) + "\n"),
+        );
+      }
+    });
+  });
+  server.listen(socketPath, () => {
+    console.log("> Proving on " + socketPath + " with concurrency " + concurrency);
+  });
+}
+
+// One JSON-RPC call to a running prover. BigInts in params are sent as
+// decimal strings; file paths are made absolute for the daemon's cwd
+function request(socketPath, method, params) {
+  function plain(value) {
+    if (typeof value === "bigint") return value.toString();
+    if (Array.isArray(value)) return value.map(plain);
+    if (value !== null && typeof value === "object") {
+      return Object.fromEntries(Object.entries(value).map(([k, v]) => [k, plain(v)]));
+    }
+    return value;
+  }
+  params = plain(params);
+  for (const key of ["wasm", "zkey"]) {
+    if (params[key]) params[key] = path.resolve(params[key]);
+  }
+
+  return new Promise((resolve, reject) => {
+    const socket = net.createConnection(socketPath);
+    let buffer = "";
+    socket.on("error", reject);
+    socket.on("data", (chunk) => {
+      buffer += chunk;
+      const end = buffer.indexOf("\n");
+      if (end < 0) return;
+      socket.end();
+      const response = JSON.parse(buffer.slice(0, end));
+      if (response.error) reject(new Error(response.error));
+      else resolve(response.result);
+    });
+    socket.write(JSON.stringify({ id: 0, method, params }) + "\n");
+  });
+}
+
+module.exports = { request };
+
+if (require.main === module) {
+  require("dotenv").config();
+  if (process.argv.length < 3) {
+    console.log("usage");
+    console.log("prover socket [concurrency]");
+    process.exit(1);
+  }
+  serve(process.argv[2], parseInt(process.argv[3] || process.env.PROVER_CONCURRENCY || "1", 10));
+}
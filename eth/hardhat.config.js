@@ -8,6 +8,270 @@ require("@nomiclabs/hardhat-web3");
 require("maci-domainobjs");
 require("maci-crypto");
 
+// Quantized witness inputs for a model or dataset. With QUANTIZE_SOCKET set,
+// they come from a running `python3 scripts/quantize.py --mode serve --socket`
+// without a process start or file round trip; otherwise the script is run
+// once and its output file is read back.
+async function quantize(mode, params) {
+  const fs = require("fs");
+  const format = process.env.QUANTIZE_FORMAT || "compact";
+
+  if (process.env.QUANTIZE_SOCKET) {
+    const net = require("net");
+    return await new Promise((resolve, reject) => {
+      const socket = net.createConnection(process.env.QUANTIZE_SOCKET);
+      let buffer = "";
+      socket.on("error", reject);
+      socket.on("data", (chunk) => {
+        buffer += chunk;
+        const end = buffer.indexOf("\n");
+        if (end < 0) return;
+        socket.end();
+        const response = JSON.parse(buffer.slice(0, end));
+        if (response.error) reject(new Error(response.error));
+        else resolve(response.result);
+      });
+      // The format only matters to files the service writes (batch inputs)
+      socket.write(JSON.stringify({ id: 0, method: mode, params: Object.assign({ format: format }, params) }) + "\n");
+    });
+  }
+
+  const { execSync } = require("child_process");
+  var args = " --mode " + mode + " --format " + format + " --cache ./artifacts/quantization/cache";
+  for (const [key, value] of Object.entries(params)) {
+    if (value === false) continue;
+    args += " --" + key.replace(/_/g, "-");
+    if (value !== true) args += " " + (Array.isArray(value) ? value.join(" ") : value);
+  }
+  const out = "./artifacts/quantization/" + {
+    model: "inputs_ml", dataset: "inputs_dataset", batch: "batch", preflight: "preflight", circuit: "circuit",
+  }[mode] + ((mode === "model" || mode === "dataset") && { container: ".zkq", binary: ".bin" }[format] || ".json");
+  // Never read back the output of an earlier run
+  fs.rmSync(out, { force: true });
+  try {
+    execSync("python3 scripts/quantize.py" + args, {
+      stdio: "inherit",
+    });
+  } catch (error) {
+    // A failing pre-flight check exits 1 for shell use, after writing the
+    // report the caller turns into its error message
+    if (mode !== "preflight" || !fs.existsSync(out)) throw error;
+  }
+  return readInputs(out);
+}
+
+// Witness inputs from a `--format container` .zkq file (see dump_container in
+// scripts/quantize.py), in the same shape as the JSON output. The int64
+// tensor blocks are viewed in place; the raw views and shapes are kept on
+// the non-enumerable `tensors` property.
+function readContainer(path) {
+  const fs = require("fs");
+  const P = 21888242871839275222246405745257275088548364400416034343698204186575808495617n;
+
+  const buffer = fs.readFileSync(path);
+  if (buffer.toString("latin1", 0, 8) !== "ZKMLQNT\0") throw new Error(path + " is not a quantized container");
+  const version = buffer.readUInt32LE(8);
+  if (version !== 1) throw new Error("unsupported container version " + version);
+  const offset = Number(buffer.readBigUInt64LE(16));
+  const length = Number(buffer.readBigUInt64LE(24));
+  const header = JSON.parse(buffer.toString("utf8", offset, offset + length));
+
+  const values = Object.assign({}, header.scalars, header.zero_points);
+  for (const [name, [numerator, denominator]] of Object.entries(header.scale_fractions)) {
+    values[name + "_numerator"] = numerator;
+    values[name + "_denominator"] = denominator;
+  }
+
+  // Field encoding as in the JSON output: negatives become P + x, and
+  // integers past Number.MAX_SAFE_INTEGER are decimal strings
+  const field = (v) => {
+    if (v < 0n) return (P + v).toString();
+    return v > BigInt(Number.MAX_SAFE_INTEGER) ? v.toString() : Number(v);
+  };
+  const nest = (view, shape, start) => {
+    if (shape.length === 0) return field(view[start]);
+    const stride = shape.slice(1).reduce((a, b) => a * b, 1);
+    const rows = new Array(shape[0]);
+    for (let i = 0; i < shape[0]; i++) rows[i] = nest(view, shape.slice(1), start + i * stride);
+    return rows;
+  };
+
+  const tensors = {};
+  for (const [name, t] of Object.entries(header.tensors)) {
+    const size = t.shape.reduce((a, b) => a * b, 1);
+    const start = buffer.byteOffset + t.offset;
+    // Small files share Node's buffer pool and may not be 8 byte aligned
+    const view = start % 8 === 0
+      ? new BigInt64Array(buffer.buffer, start, size)
+      : new BigInt64Array(buffer.buffer.slice(start, start + size * 8));
+    tensors[name] = { shape: t.shape, data: view };
+    values[name] = nest(view, t.shape, 0);
+  }
+
+  const data = {};
+  for (const key of header.keys) data[key] = values[key];
+  Object.defineProperty(data, "tensors", { value: tensors, enumerable: false });
+  return data;
+}
+
+// Witness inputs from a `--format binary` .bin file (see dump_binary in
+// scripts/quantize.py): 32 byte little-endian field elements in key order,
+// shaped by the <path>.shapes.json sidecar, in the same shape as the JSON
+// output.
+function readBinary(path) {
+  const fs = require("fs");
+
+  const buffer = fs.readFileSync(path);
+  const shapes = JSON.parse(fs.readFileSync(path.replace(/\.bin$/, "") + ".shapes.json"));
+
+  // Integers past Number.MAX_SAFE_INTEGER are decimal strings, as in JSON
+  var offset = 0;
+  const element = () => {
+    var v = 0n;
+    for (let i = 31; i >= 0; i--) v = (v << 8n) | BigInt(buffer[offset + i]);
+    offset += 32;
+    return v > BigInt(Number.MAX_SAFE_INTEGER) ? v.toString() : Number(v);
+  };
+  const nest = (shape) => {
+    if (shape.length === 0) return element();
+    return Array.from({ length: shape[0] }, () => nest(shape.slice(1)));
+  };
+
+  const data = {};
+  for (const [key, shape] of Object.entries(shapes)) data[key] = nest(shape);
+  if (offset !== buffer.length) throw new Error(path + " does not match its shapes");
+  return data;
+}
+
+// Witness inputs written by quantize.py, as .zkq, .bin or .json by
+// extension; a bare path takes the extension of the QUANTIZE_FORMAT in use
+function readInputs(path) {
+  const fs = require("fs");
+  if (!path.endsWith(".zkq") && !path.endsWith(".bin") && !path.endsWith(".json")) {
+    path += { container: ".zkq", binary: ".bin" }[process.env.QUANTIZE_FORMAT] || ".json";
+  }
+  if (path.endsWith(".zkq")) return readContainer(path);
+  if (path.endsWith(".bin")) return readBinary(path);
+  return JSON.parse(fs.readFileSync(path));
+}
+
+
+// Local index of BountyManagerV2 state in ./artifacts/index/<chain>_<address>.json,
+// brought up to date from BountyDeposited/BountyCollected/BountyRemoved logs
+// fetched `batch` blocks per eth_getLogs. The events only carry the amount,
+// so each one is matched to its bounty through the calldata of its
+// transaction; a log whose transaction cannot be decoded (a call through
+// another contract) triggers a rebuild from the contract's view functions at
+// the latest block. Views at past blocks would need an archive node.
+async function syncIndex(contract, provider, batch = 2000) {
+  const fs = require("fs");
+  const { ethers } = hre;
+
+  const { chainId } = await provider.getNetwork();
+  const path = "./artifacts/index/" + chainId + "_" + contract.address.toLowerCase() + ".json";
+  var index = { chainId: chainId, address: contract.address, lastBlock: -1, bounties: {} };
+  if (fs.existsSync(path)) {
+    index = JSON.parse(fs.readFileSync(path));
+  } else if (fs.existsSync("./artifacts/.env_contract_block")) {
+    index.lastBlock = parseInt(fs.readFileSync("./artifacts/.env_contract_block", "utf-8")) - 1;
+  }
+
+  const events = ["BountyDeposited", "BountyCollected", "BountyRemoved"];
+  const topics = [events.map((name) => contract.interface.getEventTopic(name))];
+  const hashBounty = (dataset_hash, k1, k2, mse) => ethers.utils.solidityKeccak256(
+    ["uint256", "uint256", "uint256", "uint256"], [dataset_hash, k1, k2, mse]);
+
+  async function rebuild() {
+    const datasets = await contract.getDatasets();
+    const lists = await Promise.all(datasets.map((h) => contract.queryDatasetBounties(h)));
+    const hashes = [].concat(...lists);
+    const bounties = await Promise.all(hashes.map((h) => contract.queryBountyHash(h)));
+    for (const b of Object.values(index.bounties)) if (b.status === "open") b.status = "closed";
+    hashes.forEach((h, i) => {
+      const x = bounties[i];
+      index.bounties[h] = Object.assign(index.bounties[h] || {}, {
+        dataset_hash: x[0].toString(), k1: x[1].toString(), k2: x[2].toString(), mse: x[3].toString(),
+        bounty: x[4].toString(), owner: x[5], ipfs: x[6], status: "open",
+      });
+    });
+  }
+
+  const latest = await provider.getBlockNumber();
+  for (let from = index.lastBlock + 1; from <= latest; from += batch) {
+    const to = Math.min(from + batch - 1, latest);
+    const logs = await provider.getLogs({ address: contract.address, topics: topics, fromBlock: from, toBlock: to });
+    // One getTransaction per distinct transaction, all in flight at once
+    const txHashes = [...new Set(logs.map((log) => log.transactionHash))];
+    const txs = await Promise.all(txHashes.map((h) => provider.getTransaction(h)));
+    const byHash = Object.fromEntries(txHashes.map((h, i) => [h, txs[i]]));
+
+    var stale = false;
+    for (const log of logs) {
+      const event = contract.interface.parseLog(log);
+      const tx = byHash[log.transactionHash];
+      var call = null;
+      try {
+        if (tx.to && tx.to.toLowerCase() === contract.address.toLowerCase()) {
+          call = contract.interface.parseTransaction({ data: tx.data, value: tx.value });
+        }
+      } catch (e) { }
+      if (call === null) {
+        stale = true;
+        continue;
+      }
+
+      const at = { block: log.blockNumber, tx: log.transactionHash };
+      if (event.name === "BountyDeposited" && call.name === "addBounty") {
+        const [dataset_hash, ipfs, public_key, mse_cap] = call.args;
+        const h = hashBounty(dataset_hash, public_key[0], public_key[1], mse_cap);
+        index.bounties[h] = {
+          dataset_hash: dataset_hash.toString(), k1: public_key[0].toString(), k2: public_key[1].toString(),
+          mse: mse_cap.toString(), bounty: event.args.amount.toString(), owner: tx.from, ipfs: ipfs,
+          status: "open", deposited: at,
+        };
+      } else if (event.name === "BountyRemoved" && call.name === "removeBounty") {
+        const [dataset_hash, public_key, mse_cap] = call.args;
+        const h = hashBounty(dataset_hash, public_key[0], public_key[1], mse_cap);
+        if (index.bounties[h]) Object.assign(index.bounties[h], { status: "removed", closed: at });
+        else stale = true;
+      } else if (event.name === "BountyCollected" && call.name === "collectBounty") {
+        // The contract reads the claimer's key at an offset that depends on
+        // its (m, p, n); match it against the open bounties instead
+        const input = call.args.input.map((v) => v.toString());
+        const h = Object.keys(index.bounties).find((key) => {
+          const b = index.bounties[key];
+          if (b.status !== "open" || b.dataset_hash !== input[1] || b.mse !== input[0]) return false;
+          return input.some((v, i) => v === b.k1 && input[i + 1] === b.k2);
+        });
+        if (h) Object.assign(index.bounties[h], { status: "collected", closed: at });
+        else stale = true;
+      } else {
+        stale = true;
+      }
+    }
+    // The current state covers every later log as well. It may already be
+    // past `latest`; the logs in between are read again on the next sync,
+    // and applying them again does not change the index
+    if (stale) {
+      console.log("Rebuilding the bounty index from the latest contract state");
+      await rebuild();
+    }
+
+    index.lastBlock = stale ? latest : to;
+    fs.mkdirSync("./artifacts/index", { recursive: true });
+    fs.writeFileSync(path + ".tmp", JSON.stringify(index, null, 2));
+    fs.renameSync(path + ".tmp", path);
+    if (stale) break;
+  }
+  return index;
+}
+
+// Open bounties of the index, optionally only those on one dataset
+function openBounties(index, dataset_hash) {
+  return Object.entries(index.bounties)
+    .filter(([, b]) => b.status === "open" && (dataset_hash === undefined || b.dataset_hash === dataset_hash))
+    .map(([h, b]) => Object.assign({ hash: h }, b));
+}
 
 // This is a sample Hardhat task. To learn how to create your own go to
 // https://hardhat.org/guides/create-task.html
@@ -30,47 +294,42 @@ task("balance", "Prints an account's balance")
 
 task("list_bounties", "List bounties given dataset")
   .addParam("hash", "Dataset hash", "14797455496207951391356508759149962584765968173479481191220882411966396840571")
+  .addParam("batch", "blocks per eth_getLogs when updating the local index", "2000")
   .setAction(async (taskArgs) => {
     const fs = require("fs");
     const BountyManagerV2 = await hre.ethers.getContractFactory('BountyManagerV2');
     const CONTRACT_ADDRESS = fs.readFileSync('./artifacts/.env_contract', 'utf-8');
-    const contract = await BountyManagerV2.attach(CONTRACT_ADDRESS);
     const provider = new hre.ethers.providers.JsonRpcProvider(process.env.URL);
-    const wallet_raw = new hre.ethers.Wallet(process.env.PRIVATE_KEY);
-    const wallet = wallet_raw.connect(provider);
+    const contract = BountyManagerV2.attach(CONTRACT_ADDRESS).connect(provider);
 
-    const write_contract = contract.connect(wallet);
+    const index = await syncIndex(contract, provider, parseInt(taskArgs.batch));
 
     console.log("Available bounties on dataset: " + taskArgs.hash);
-    hashes = await write_contract.queryDatasetBounties(taskArgs.hash);
-    const bounties = await Promise.all(hashes.map(async function (hash) { 
-      x = await write_contract.queryBountyHash(hash);
-      return {"PubKey1": x[1].toString(),
-              "PubKey2": x[2].toString(),
-              "MSEcap":  x[3].toString(),
-              "Bounty": ethers.utils.formatEther(x[4]).toString(),
-              "Issuer": x[5].toString(),
-              "IPFS": x[6].toString(),
-             }; 
-    }));
-    console.log(bounties);  
+    const bounties = openBounties(index, taskArgs.hash).map(function (x) {
+      return {"PubKey1": x.k1,
+              "PubKey2": x.k2,
+              "MSEcap":  x.mse,
+              "Bounty": ethers.utils.formatEther(x.bounty).toString(),
+              "Issuer": x.owner,
+              "IPFS": x.ipfs,
+             };
+    });
+    console.log(bounties);
   });
 
 task("list_datasets", "List of datasets with alias")
+  .addParam("batch", "blocks per eth_getLogs when updating the local index", "2000")
   .setAction(async (taskArgs) => {
     const fs = require("fs");
     const provider = new hre.ethers.providers.JsonRpcProvider(process.env.URL);
     const BountyManagerV2 = await hre.ethers.getContractFactory('BountyManagerV2');
     const CONTRACT_ADDRESS = fs.readFileSync('./artifacts/.env_contract', 'utf-8');
-    const contract = await BountyManagerV2.attach(CONTRACT_ADDRESS);
+    const contract = BountyManagerV2.attach(CONTRACT_ADDRESS).connect(provider);
 
-    const wallet_raw = new hre.ethers.Wallet(process.env.PRIVATE_KEY);
-    const wallet = wallet_raw.connect(provider);
+    const index = await syncIndex(contract, provider, parseInt(taskArgs.batch));
+    // The contract lists a dataset while it has at least one open bounty
+    const hashes = [...new Set(openBounties(index).map((b) => b.dataset_hash))];
 
-    const write_contract = contract.connect(wallet);
-    tx = await write_contract.getDatasets();
-    const hashes = tx.map(function (x) { return x.toString() });
-    
     console.log("Available datasets:");
     console.log(hashes);
   });
@@ -107,28 +366,21 @@ task("remove_bounty", "Remove bounty without claiming")
     tx = await write_contract.removeBounty(taskArgs.hash, pubKey, mse_cap);
   });
 
-task("claim_bounty", "Claim bounty")
-  .addParam("payment", "payment address", "0xd3162F2B88d05C882a1B26031E144753337ACDBF")
-  .addParam("publickey", "bounty issuer's publilckey", "./keys/out_public.json")
-  .addParam("model", "model path", "./model")
-  .addParam("dataset", "dataset path", "./dataset")
-  .addParam("settings", "settings", "settings.json")
-  .setAction(async (taskArgs) => {
-
-    const { execSync } = require("child_process");
+// Encrypts the quantized model in `data` for the issuer's public key with a
+// fresh claimer keypair. Returns the keypair and the full circuit input.
+function claimInput(data, publickey) {
     const fs = require("fs");
-    const snarkjs = require("snarkjs");
 
-    execSync("python3 scripts/quantize.py --mode model --settings "+ taskArgs.settings + " --model " + taskArgs.model + " --dataset " + taskArgs.dataset, {
-      stdio: "inherit",
-    });
+    if (data.estimate_only) {
+      throw new Error(data.model + ": stacked layers are only estimated, the circuit proves a single layer");
+    }
 
     const { Keypair } = require('maci-domainobjs');
     const mimc7 = require('./node_modules/circomlib/src/mimc7.js');
     //console.log(Keypair);
 
     const key = new Keypair();
-    const pubKey = JSON.parse(fs.readFileSync(taskArgs.publickey));
+    const pubKey = JSON.parse(fs.readFileSync(publickey));
     //console.log(pubKey);
     pubKey[0] = BigInt(pubKey[0]);
     pubKey[1] = BigInt(pubKey[1]);
@@ -141,79 +393,21 @@ task("claim_bounty", "Claim bounty")
 
     const sharedKey = Keypair.genEcdhSharedKey(key.privKey, key2.pubKey);
 
-    const rawdata = fs.readFileSync('./artifacts/quantization/inputs_ml.json');
-    const data = JSON.parse(rawdata);
     //console.log(data);
 
     function tobigint(value) {
       return BigInt(value);
     }
 
-    var to_hash = [];
-    var m = 20;
-    var p = 4;
-    var n = 1;
-
-    var idx = 0;
-    for (var i = 0; i < m; i++) {
-        for (var j = 0; j < p; j++) {
-            to_hash.push(data.X_q[i][j]);
-            idx = idx + 1;
-            
-        }
-    }
-
-    for (var i = 0; i < m; i++) {
-        for (var j = 0; j < n; j++) {
-            to_hash.push(data.Yt_q[i][j]);
-            idx = idx + 1;
-        }
-    }
-
-    to_hash.push(data.z_X);
-    idx = idx + 1; 
-    to_hash.push(data.z_W);
-    idx = idx + 1;
-    to_hash.push(data.z_b);
-    idx = idx + 1;
-    to_hash.push(data.z_Y);
-    idx = idx + 1;
-    to_hash.push(data.sbsY_numerator);
-    idx = idx + 1;
-    to_hash.push(data.sbsY_denominator);
-    idx = idx + 1;
-    to_hash.push(data.sXsWsY_numerator);
-    idx = idx + 1;
-    to_hash.push(data.sXsWsY_denominator);
-    idx = idx + 1;
-
-    to_hash.push(data.sYsR_numerator);
-    idx = idx + 1;
-    to_hash.push(data.sYsR_denominator);
-    idx = idx + 1;
-    to_hash.push(data.sYtsR_numerator);
-    idx = idx + 1;
-    to_hash.push(data.sYtsR_denominator);
-    idx = idx + 1;
-    to_hash.push(data.constant);
-    idx = idx + 1;
-
-    to_hash.push(data.z_R);
-    idx = idx + 1;
-    to_hash.push(data.z_Sq);
-    idx = idx + 1;
-    to_hash.push(data.sR2sSq_numerator);
-    idx = idx + 1;
-    to_hash.push(data.sR2sSq_denominator);
-    idx = idx + 1;
-
-    const hash_input = mimc7.multiHash(to_hash.map(tobigint), BigInt(0));
+    // MultiMiMC7 commitment to the quantized dataset, computed by quantize.py
+    const hash_input = BigInt(data.hash_input);
 
     const W_q_enc = data.W_q.map(function(arr) {
       return arr.slice().map(tobigint);
     });
 
-    const b_q_enc = data.b_q.slice().map(tobigint);
+    // b_q is (1, n), the circuit takes b_q_enc[n][2]
+    const b_q_enc = data.b_q.flat().map(tobigint);
 
     for (let i = 0; i < b_q_enc.length; i++) {
       var val1 = mimc7.multiHash([b_q_enc[i]], BigInt(0));
@@ -243,16 +437,53 @@ task("claim_bounty", "Claim bounty")
 
     const input = Object.assign({}, data, _input);
 
+    return { key, input };
+}
+
+// The circuit a claim can be proven with. BountyManagerV2 takes a fixed
+// uint[131] input and verifies with the LibVerifier exported by `yarn prod`
+// for lr/circuit.circom, so only that build's zkey yields proofs the
+// deployed contract accepts: other shapes, or a zkey contributed afresh by
+// build_shape.js, would always revert. Nothing is built here.
+async function claimCircuit(settings, dataset) {
+  const circuit = await quantize("circuit", { settings: settings, dataset: dataset });
+  if (circuit.key !== "lr") {
+    throw new Error("No deployed verifier for quant_gemm_mse_enc(" + circuit.m + "," + circuit.p + "," + circuit.n
+      + "): claims need the `yarn prod` build of circuits/lr (circuits/artifacts/lr.zkey) for the shape the "
+      + "contract was deployed with; another shape needs a contract deployed with its own LibVerifier.sol");
+  }
+  return circuit;
+}
+
+// Encrypts the quantized model in `data` for the issuer's public key, then
+// proves and verifies the claim with the circuit's wasm and zkey (the
+// prebuilt lr circuit unless another `quantize("circuit")` result is given).
+// Returns the claimer's fresh keypair and the collectBounty proof arguments.
+// With PROVER_SOCKET set, a running `node circuits/prover.js` with the zkey
+// and wasm already loaded does the proving.
+async function claimProof(data, publickey, inputsPath, circuit) {
+    const fs = require("fs");
+    const snarkjs = require("snarkjs");
+
+    const { key, input } = claimInput(data, publickey);
+
     BigInt.prototype.toJSON = function() { return this.toString(16)  }
 
     fs.writeFileSync(
-      './artifacts/quantization/inputs.json',
+      inputsPath,
       JSON.stringify(input, null, 2),
       () => {},
     );
 
-    const final_zkey = fs.readFileSync("../circuits/artifacts/lr.zkey");
-    const wasm = fs.readFileSync("../circuits/artifacts/lr.wasm");
+    circuit = circuit || { wasm: "../circuits/artifacts/lr.wasm", zkey: "../circuits/artifacts/lr.zkey" };
+    if (process.env.PROVER_SOCKET) {
+      const { request } = require("../circuits/prover.js");
+      const result = await request(process.env.PROVER_SOCKET, "prove", { input, wasm: circuit.wasm, zkey: circuit.zkey });
+      console.log("Witness took " + result.witness_seconds + " s, proof took " + result.prove_seconds + " s");
+      return { key, args: result.args };
+    }
+    const final_zkey = fs.readFileSync(circuit.zkey);
+    const wasm = fs.readFileSync(circuit.wasm);
     const wtns = { type: "mem" };
 
     const logger = {
@@ -272,10 +503,48 @@ task("claim_bounty", "Claim bounty")
     const verified = await snarkjs.groth16.verify(verification_key, publicSignals, proof, logger);
     if (!verified) throw new Error("Could not verify the proof");
 
-    arg0 = [proof.pi_a[0], proof.pi_a[1]];
-    arg1 = [[proof.pi_b[0][1], proof.pi_b[0][0]], [proof.pi_b[1][1], proof.pi_b[1][0]]]
-    arg2 = [proof.pi_c[0], proof.pi_c[1]];
-    arg3 = publicSignals;
+    const arg0 = [proof.pi_a[0], proof.pi_a[1]];
+    const arg1 = [[proof.pi_b[0][1], proof.pi_b[0][0]], [proof.pi_b[1][1], proof.pi_b[1][0]]]
+    const arg2 = [proof.pi_c[0], proof.pi_c[1]];
+    const arg3 = publicSignals;
+
+    return { key, args: [arg0, arg1, arg2, arg3] };
+}
+
+task("claim_bounty", "Claim bounty")
+  .addParam("payment", "payment address", "0xd3162F2B88d05C882a1B26031E144753337ACDBF")
+  .addParam("publickey", "bounty issuer's publilckey", "./keys/out_public.json")
+  .addParam("model", "model path", "./model")
+  .addParam("dataset", "dataset path", "./dataset")
+  .addParam("settings", "settings", "settings.json")
+  .addParam("mse", "bounty's mse cap, quantized (defaults to the settings' mse_target)", "")
+  .setAction(async (taskArgs) => {
+
+    const fs = require("fs");
+
+    const circuit = await claimCircuit(taskArgs.settings, taskArgs.dataset);
+
+    // Milliseconds instead of a wasted proof when the model cannot claim
+    const params = {
+      settings: taskArgs.settings,
+      model: taskArgs.model,
+      dataset: taskArgs.dataset,
+    };
+    if (taskArgs.mse) params.mse_cap = taskArgs.mse;
+    const check = await quantize("preflight", params);
+    if (!check.passed) {
+      throw new Error("Pre-flight check failed: mse_q " + check.mse_q + ", out " + check.out
+        + ", bounty cap " + check.mse_cap + ", margin " + check.margin);
+    }
+
+    const data = await quantize("model", {
+      settings: taskArgs.settings,
+      model: taskArgs.model,
+      dataset: taskArgs.dataset,
+    });
+
+    const { key, args } = await claimProof(data, taskArgs.publickey, './artifacts/quantization/inputs.json', circuit);
+    const [arg0, arg1, arg2, arg3] = args;
 
     const provider = new hre.ethers.providers.JsonRpcProvider(process.env.URL);
     const BountyManagerV2 = await hre.ethers.getContractFactory('BountyManagerV2');
@@ -304,6 +573,13 @@ task("claim_bounty", "Claim bounty")
 
     tx = await write_contract.collectBounty(taskArgs.payment, arg0, arg1, arg2, arg3);
 
+    // What the issuer needs to decrypt the model (scripts/decrypt.py): the
+    // ciphertexts are in the public signals, the claimer's key is not
+    fs.writeFileSync(
+      "./artifacts/claim.json",
+      JSON.stringify({ public_key: key.pubKey.asCircuitInputs(), signals: arg3 }, null, 2),
+    );
+
     await write_contract.on("BountyCollected", (x) => {
       console.log("Collected Bounty: " + (x.toString()));
     });
@@ -320,14 +596,243 @@ task("claim_bounty", "Claim bounty")
     console.log(ethers.utils.formatEther(balance));
   });
 
+task("batch_claim", "Rank candidate models and claim with the best one that proves")
+  .addParam("payment", "payment address", "0xd3162F2B88d05C882a1B26031E144753337ACDBF")
+  .addParam("publickey", "bounty issuer's publilckey", "./keys/out_public.json")
+  .addParam("models", "comma separated model paths", "./model,./model_shuffled")
+  .addParam("dataset", "dataset path", "./dataset")
+  .addParam("settings", "settings", "settings.json")
+  .addOptionalParam("keyfile", "file to save the claimer's private key to")
+  .setAction(async (taskArgs) => {
+
+    const fs = require("fs");
+
+    const circuit = await claimCircuit(taskArgs.settings, taskArgs.dataset);
+
+    const { ranking } = await quantize("batch", {
+      settings: taskArgs.settings,
+      models: taskArgs.models.split(","),
+      dataset: taskArgs.dataset,
+    });
+
+    const winners = ranking.filter((entry) => entry.passed);
+    if (winners.length === 0) throw new Error("No model meets the bounty's mse target");
+
+    // A bounty pays out once: prove in rank order and stop at the first
+    // proof that verifies. winner.inputs is the file batch wrote, extension
+    // included; the claim and proof files are named after it
+    var winner, claim, base;
+    for (winner of winners) {
+      base = winner.inputs.replace(/\.(zkq|bin|json)$/, "");
+      try {
+        claim = await claimProof(readInputs(winner.inputs), taskArgs.publickey, base + "_claim.json", circuit);
+        break;
+      } catch (error) {
+        console.log(winner.model + ": " + error.message);
+      }
+    }
+    if (!claim) throw new Error("No passing model produced a valid proof");
+
+    const { key, args } = claim;
+    const [arg0, arg1, arg2, arg3] = args;
+    console.log("Claiming with " + winner.model + " (mse_q " + winner.mse_q + ")");
+    fs.writeFileSync(
+      base + "_proof.json",
+      JSON.stringify({
+        model: winner.model,
+        mse_q: winner.mse_q,
+        public_key: key.pubKey.asCircuitInputs(),
+        args: args,
+      }, null, 2),
+    );
+    if (taskArgs.keyfile) {
+      fs.writeFileSync(taskArgs.keyfile, JSON.stringify(key.privKey.rawPrivKey.toString()), { mode: 0o600 });
+    }
+
+    const provider = new hre.ethers.providers.JsonRpcProvider(process.env.URL);
+    const BountyManagerV2 = await hre.ethers.getContractFactory('BountyManagerV2');
+    const CONTRACT_ADDRESS = fs.readFileSync('./artifacts/.env_contract', 'utf-8');
+    const contract = await BountyManagerV2.attach(CONTRACT_ADDRESS);
+
+    const wallet_raw = new hre.ethers.Wallet(process.env.PRIVATE_KEY);
+    const wallet = wallet_raw.connect(provider);
+
+    const write_contract = contract.connect(wallet);
+
+    tx = await write_contract.collectBounty(taskArgs.payment, arg0, arg1, arg2, arg3);
+
+    console.log("Your Public Key: ");
+    console.log(key.pubKey.rawPubKey);
+
+    balance = await provider.getBalance(taskArgs.payment);
+    console.log("Current Balance");
+    console.log(ethers.utils.formatEther(balance));
+  });
+
+// One timed proving stage for scripts/benchmark.py, which runs every stage in
+// its own process to measure its peak RSS. The witness stage writes the .wtns
+// file that the groth16 stage reads back.
+task("bench_prove", "Time witness calculation or groth16 proving for quantized inputs")
+  .addParam("stage", "witness or groth16", "witness")
+  .addParam("inputs", "quantized model inputs", "./artifacts/quantization/inputs_ml.json")
+  .addParam("publickey", "bounty issuer's publilckey", "./keys/out_public.json")
+  .addParam("wasm", "circuit wasm", "../circuits/artifacts/lr.wasm")
+  .addParam("zkey", "circuit zkey", "../circuits/artifacts/lr.zkey")
+  .addParam("wtns", "witness file", "./artifacts/benchmark/witness.wtns")
+  .addParam("out", "timing output", "./artifacts/benchmark/stage.json")
+  .setAction(async (taskArgs) => {
+    const fs = require("fs");
+    const snarkjs = require("snarkjs");
+
+    const logger = {
+        debug: () => { },
+        info: () => { },
+        warn: (x) => { console.log('WARN: ' + x) },
+        error: (x) => { console.log('ERROR: ' + x) },
+    };
+
+    var result;
+    if (taskArgs.stage === "witness") {
+      const data = readInputs(taskArgs.inputs);
+      const { input } = claimInput(data, taskArgs.publickey);
+      const wasm = fs.readFileSync(taskArgs.wasm);
+      const start = Date.now();
+      await snarkjs.wtns.calculate(input, wasm, taskArgs.wtns, logger);
+      result = { seconds: (Date.now() - start) / 1000, wtns_bytes: fs.statSync(taskArgs.wtns).size };
+    } else if (taskArgs.stage === "groth16") {
+      const final_zkey = fs.readFileSync(taskArgs.zkey);
+      const start = Date.now();
+      const { proof, publicSignals } = await snarkjs.groth16.prove(final_zkey, taskArgs.wtns, logger);
+      const seconds = (Date.now() - start) / 1000;
+      const verification_key = await snarkjs.zKey.exportVerificationKey(final_zkey);
+      const verified = await snarkjs.groth16.verify(verification_key, publicSignals, proof, logger);
+      if (!verified) throw new Error("Could not verify the proof");
+      result = { seconds: seconds, zkey_bytes: final_zkey.length };
+    } else {
+      throw new Error("Unknown stage " + taskArgs.stage);
+    }
+
+    fs.writeFileSync(taskArgs.out, JSON.stringify(result));
+  });
+
+// File size implied by an .npy header (magic, version, header length and the
+// shape/descr dict), to tell a complete download from a truncated one
+function npySize(path) {
+  const fs = require("fs");
+  const fd = fs.openSync(path, "r");
+  try {
+    const head = Buffer.alloc(12);
+    fs.readSync(fd, head, 0, 12, 0);
+    if (head.toString("latin1", 0, 6) !== "\x93NUMPY") throw new Error(path + " is not an .npy file");
+    const long = head[6] >= 2;
+    const length = long ? head.readUInt32LE(8) : head.readUInt16LE(8);
+    const offset = (long ? 12 : 10) + length;
+    const header = Buffer.alloc(length);
+    fs.readSync(fd, header, 0, length, long ? 12 : 10);
+    const text = header.toString("latin1");
+    const itemsize = parseInt(text.match(/'descr':\s*'[<>|=]?[a-zA-Z](\d+)'/)[1], 10);
+    const shape = text.match(/'shape':\s*\(([^)]*)\)/)[1].split(",").filter((x) => x.trim() !== "");
+    return offset + shape.reduce((size, x) => size * parseInt(x, 10), itemsize);
+  } finally {
+    fs.closeSync(fd);
+  }
+}
+
+// Local copy of the dataset at an IPFS CID in <cache>/<cid>/ (X.npy, Y.npy
+// and manifest.json with their sizes and sha256), fetched only when missing
+// or failing its size check. add_bounty uploads the .npy files as base64
+// text, so each one is streamed from the `cat` endpoint through a base64
+// decoder and a hash straight to disk, X and Y concurrently; the entry only
+// appears once both are complete. IPFS_API points at another endpoint (a
+// local scripts/ipfs_gateway.py for testing).
+async function fetchDataset(cid, cache = process.env.IPFS_CACHE || "./artifacts/ipfs") {
+  const fs = require("fs");
+  const path = require("path");
+  const crypto = require("crypto");
+  const { Transform, pipeline } = require("stream");
+  const axios = require("axios");
+
+  const files = ["X.npy", "Y.npy"];
+  const dir = path.join(cache, cid);
+  const manifestPath = path.join(dir, "manifest.json");
+  if (fs.existsSync(manifestPath)) {
+    const manifest = JSON.parse(fs.readFileSync(manifestPath));
+    const intact = files.every((name) => {
+      const file = path.join(dir, name);
+      return fs.existsSync(file) && fs.statSync(file).size === manifest.files[name].size;
+    });
+    if (intact) return dir;
+    console.log("> Cached " + cid + " is incomplete, fetching again");
+  }
+
+  const api = process.env.IPFS_API || "https://ipfs.infura.io:5001";
+  var auth;
+  if (fs.existsSync("./keys/ipfs.json")) {
+    const infura = JSON.parse(fs.readFileSync("./keys/ipfs.json"));
+    auth = { username: infura.id, password: infura.secret };
+  }
+
+  const tmp = dir + "." + process.pid + ".tmp";
+  fs.rmSync(tmp, { recursive: true, force: true });
+  fs.mkdirSync(tmp, { recursive: true });
+
+  async function fetchFile(name) {
+    const response = await axios.post(api + "/api/v0/cat?arg=" + cid + "/" + name, {}, {
+      auth: auth,
+      responseType: "stream",
+    });
+    const hash = crypto.createHash("sha256");
+    var size = 0;
+    var rest = "";
+    // base64 decodes in groups of 4 characters; carry the remainder over
+    const decode = new Transform({
+      transform(chunk, encoding, callback) {
+        const text = rest + chunk.toString("latin1").replace(/\s/g, "");
+        const usable = text.length - (text.length % 4);
+        rest = text.slice(usable);
+        callback(null, Buffer.from(text.slice(0, usable), "base64"));
+      },
+      flush(callback) {
+        callback(null, Buffer.from(rest, "base64"));
+      },
+    });
+    const digest = new Transform({
+      transform(chunk, encoding, callback) {
+        hash.update(chunk);
+        size += chunk.length;
+        callback(null, chunk);
+      },
+    });
+    const file = path.join(tmp, name);
+    await new Promise((resolve, reject) => {
+      pipeline(response.data, decode, digest, fs.createWriteStream(file), (error) => error ? reject(error) : resolve());
+    });
+    const expected = npySize(file);
+    if (size !== expected) throw new Error(cid + "/" + name + ": " + size + " bytes, header says " + expected);
+    return { size: size, sha256: hash.digest("hex") };
+  }
+
+  try {
+    const entries = await Promise.all(files.map(fetchFile));
+    const manifest = { cid: cid, fetched: new Date().toISOString(), files: {} };
+    files.forEach((name, i) => { manifest.files[name] = entries[i]; });
+    fs.writeFileSync(path.join(tmp, "manifest.json"), JSON.stringify(manifest, null, 2));
+    fs.rmSync(dir, { recursive: true, force: true });
+    fs.renameSync(tmp, dir);
+  } catch (error) {
+    fs.rmSync(tmp, { recursive: true, force: true });
+    throw error;
+  }
+  return dir;
+}
+
 task("download_dataset", "download dataset")
   .addParam("hash", "Dataset hash", "14797455496207951391356508759149962584765968173479481191220882411966396840571")
   .addParam("publickey", "bounty issuer's publilckey", "./keys/out_public.json")
   .addParam("mse", "mse cap, quantized", "12888")
   .addParam("path", "save path", "./ipfs_dataset")
+  .addParam("settings", "settings to check the dataset against the bounty's dataset hash", "")
   .setAction(async (taskArgs) => {
-    console.log("Downloading from IPFS to " + taskArgs.path + " ...");
-
     const provider = new hre.ethers.providers.JsonRpcProvider(process.env.URL);
     const fs = require("fs");
     const BountyManagerV2 = await hre.ethers.getContractFactory('BountyManagerV2');
@@ -347,36 +852,25 @@ task("download_dataset", "download dataset")
     const bounty = await write_contract.queryBounty(taskArgs.hash, pubKey, mse_cap);
     const cid = bounty.ipfs;
 
-    const infura = JSON.parse(fs.readFileSync('./keys/ipfs.json'));
-    const projectId = infura.id;
-    const projectSecret = infura.secret;
+    console.log("Downloading " + cid + " to " + taskArgs.path + " ...");
+    const dir = await fetchDataset(cid);
 
-    const axios = require('axios')
-    
-    var response = await axios.post("https://ipfs.infura.io:5001/api/v0/cat?arg=" + cid + "/X.npy", {}, {
-      auth: {
-        username: projectId,
-        password: projectSecret
-      }
-    });
-    
-    fs.writeFileSync(
-      taskArgs.path + "/X.npy",
-      response.data,
-      {encoding: 'base64'});
-    
-    response = await axios.post("https://ipfs.infura.io:5001/api/v0/cat?arg=" + cid + "/Y.npy", {}, {
-      auth: {
-        username: projectId,
-        password: projectSecret
-      }
-    });
-
-    fs.writeFileSync(
-      taskArgs.path + "/Y.npy",
-      response.data,
-      {encoding: 'base64'});
+    // Copy-on-write clones where the filesystem supports them, so edits to
+    // the saved dataset never reach the cache
+    fs.mkdirSync(taskArgs.path, { recursive: true });
+    for (const name of ["X.npy", "Y.npy"]) {
+      fs.copyFileSync(dir + "/" + name, taskArgs.path + "/" + name, fs.constants.COPYFILE_FICLONE);
+    }
 
+    // The contract only knows the MultiMiMC7 hash of the quantized dataset;
+    // with the bounty's settings it checks the files end to end
+    if (taskArgs.settings) {
+      const data = await quantize("dataset", { settings: taskArgs.settings, dataset: taskArgs.path });
+      if (BigInt(data.hash_input) !== BigInt(taskArgs.hash)) {
+        throw new Error("Dataset hash " + data.hash_input + " does not match the bounty's " + taskArgs.hash);
+      }
+      console.log("> Dataset matches the bounty's dataset hash");
+    }
   });
 
 task("add_bounty", "Deposit bounty") 
@@ -386,86 +880,21 @@ task("add_bounty", "Deposit bounty")
   .addParam("settings", "settings", "settings.json")
   .setAction(async (taskArgs) => {
 
-    const { execSync } = require("child_process");
     const fs = require("fs");
 
-    execSync("python3 scripts/quantize.py --mode dataset --settings "+ taskArgs.settings + " --dataset " + taskArgs.dataset, {
-      stdio: "inherit",
+    const data = await quantize("dataset", {
+      settings: taskArgs.settings,
+      dataset: taskArgs.dataset,
     });
 
     const { Keypair } = require('maci-domainobjs');
-    const mimc7 = require('./node_modules/circomlib/src/mimc7.js');
-    //console.log(mimc7)
 
     const key = new Keypair();
 
-    const rawdata = fs.readFileSync('./artifacts/quantization/inputs_dataset.json');
-    const data = JSON.parse(rawdata);
     //console.log(data);
 
-    function tobigint(value) {
-      return BigInt(value);
-    }
-
-    var to_hash = [];
-    var m = 20;
-    var p = 4;
-    var n = 1;
-
-    var idx = 0;
-    for (var i = 0; i < m; i++) {
-        for (var j = 0; j < p; j++) {
-            to_hash.push(data.X_q[i][j]);
-            idx = idx + 1;
-            
-        }
-    }
-
-    for (var i = 0; i < m; i++) {
-        for (var j = 0; j < n; j++) {
-            to_hash.push(data.Yt_q[i][j]);
-            idx = idx + 1;
-        }
-    }
-
-    to_hash.push(data.z_X);
-    idx = idx + 1; 
-    to_hash.push(data.z_W);
-    idx = idx + 1;
-    to_hash.push(data.z_b);
-    idx = idx + 1;
-    to_hash.push(data.z_Y);
-    idx = idx + 1;
-    to_hash.push(data.sbsY_numerator);
-    idx = idx + 1;
-    to_hash.push(data.sbsY_denominator);
-    idx = idx + 1;
-    to_hash.push(data.sXsWsY_numerator);
-    idx = idx + 1;
-    to_hash.push(data.sXsWsY_denominator);
-    idx = idx + 1;
-
-    to_hash.push(data.sYsR_numerator);
-    idx = idx + 1;
-    to_hash.push(data.sYsR_denominator);
-    idx = idx + 1;
-    to_hash.push(data.sYtsR_numerator);
-    idx = idx + 1;
-    to_hash.push(data.sYtsR_denominator);
-    idx = idx + 1;
-    to_hash.push(data.constant);
-    idx = idx + 1;
-
-    to_hash.push(data.z_R);
-    idx = idx + 1;
-    to_hash.push(data.z_Sq);
-    idx = idx + 1;
-    to_hash.push(data.sR2sSq_numerator);
-    idx = idx + 1;
-    to_hash.push(data.sR2sSq_denominator);
-    idx = idx + 1;
-
-    const hash_input = mimc7.multiHash(to_hash.map(tobigint), BigInt(0));
+    // MultiMiMC7 commitment to the quantized dataset, computed by quantize.py
+    const hash_input = BigInt(data.hash_input);
 
     console.log("Hashed inputs: ");
     console.log(hash_input);
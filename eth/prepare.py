@@ -1,38 +1,187 @@
-
+# Streams CSV or .npy sources into dataset/X.npy and dataset/Y.npy, the layout
+# quant_dataset reads. Sources are read chunk_rows at a time, the feature and
+# target columns are selected per chunk and each row goes to the test or train
+# split by a hash of its values, so the split does not depend on chunking or
+# row order. One pass counts the rows of each split, a second writes them
+# into preallocated memory-mapped .npy files; nothing is held whole in RAM.
+import os
 
 import numpy as np
-import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.datasets import load_iris # Load Iris Data
 
-iris = load_iris() # Creating pd DataFrames
+CHUNK_ROWS = 65536
+TEST_FRACTION = 0.13
+SEED = 101
+
+# Demo dataset: predict sepal length from the other iris measurements and
+# the species
+IRIS_TARGET = "sepal length (cm)"
+
+
+def iris_source():
+    from sklearn.datasets import load_iris
+    iris = load_iris()
+    data = np.column_stack([iris.data, iris.target]).astype(np.float64)
+    return list(iris.feature_names) + ["species"], data
+
+
+def csv_header(path, delimiter):
+    # Column names of a CSV, or None when its first line is already data
+    with open(path) as f:
+        fields = f.readline().strip().split(delimiter)
+    try:
+        [float(x) for x in fields]
+        return None, len(fields)
+    except ValueError:
+        return [x.strip().strip('"') for x in fields], len(fields)
+
+
+def csv_chunks(path, columns, chunk_rows, delimiter):
+    names, _ = csv_header(path, delimiter)
+    with open(path) as f:
+        if names is not None:
+            f.readline()
+        lines = []
+        for line in f:
+            if line.strip():
+                lines.append(line)
+            if len(lines) == chunk_rows:
+                yield np.loadtxt(lines, delimiter=delimiter, usecols=columns, ndmin=2, dtype=np.float64)
+                lines = []
+        if lines:
+            yield np.loadtxt(lines, delimiter=delimiter, usecols=columns, ndmin=2, dtype=np.float64)
+
+
+def npy_chunks(data, columns, chunk_rows):
+    # Row blocks of a (memory-mapped) 2-D array, selected columns only
+    for i in range(0, data.shape[0], chunk_rows):
+        yield np.asarray(data[i:i + chunk_rows][:, columns], dtype=np.float64)
+
+
+def source_columns(source, delimiter):
+    # Column names (or None) and count of a source: "iris", a CSV or an .npy
+    if source == "iris":
+        names, data = iris_source()
+        return names, data.shape[1]
+    if source.endswith(".npy"):
+        data = np.load(source, mmap_mode="r")
+        assert data.ndim == 2, f"{source}: expected a 2-D array, got shape {data.shape}"
+        return None, data.shape[1]
+    return csv_header(source, delimiter)
 
-iris_df = pd.DataFrame(data= iris.data, columns= iris.feature_names)
-target_df = pd.DataFrame(data= iris.target, columns= ['species'])
 
-def converter(specie):
-    if specie == 0:
-        return 'setosa'
-    elif specie == 1:
-        return 'versicolor'
+def column_index(column, names, count):
+    # A column given by name or (possibly negative) index
+    if names is not None and column in names:
+        return names.index(column)
+    try:
+        i = int(column)
+    except ValueError:
+        assert False, f"unknown column {column}, have {names}"
+    assert -count <= i < count, f"column {i} out of range for {count} columns"
+    return i % count
+
+
+def select_columns(sources, features, targets, delimiter):
+    # Feature and target column indices, the same for every source. Defaults
+    # to the last column as target and every other column as a feature
+    names, count = source_columns(sources[0], delimiter)
+    for source in sources[1:]:
+        assert source_columns(source, delimiter) == (names, count), f"{source}: columns differ from {sources[0]}"
+    if not targets:
+        targets = [IRIS_TARGET] if sources[0] == "iris" else [str(count - 1)]
+    targets = [column_index(c, names, count) for c in targets]
+    if features:
+        features = [column_index(c, names, count) for c in features]
     else:
-        return 'virginica'
+        features = [i for i in range(count) if i not in targets]
+    return features, targets
+
+
+def source_chunks(sources, columns, chunk_rows, delimiter):
+    for source in sources:
+        if source == "iris":
+            yield from npy_chunks(iris_source()[1], columns, chunk_rows)
+        elif source.endswith(".npy"):
+            yield from npy_chunks(np.load(source, mmap_mode="r"), columns, chunk_rows)
+        else:
+            yield from csv_chunks(source, columns, chunk_rows, delimiter)
+
+
+def splitmix64(x):
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def test_rows(chunk, test_fraction, seed):
+    # Rows of chunk that fall into the test split: a 64 bit hash of the seed
+    # and the row's float64 values, compared against test_fraction. Equal rows
+    # always land on the same side
+    bits = np.ascontiguousarray(chunk, dtype=np.float64).view(np.uint64)
+    h = np.full(chunk.shape[0], seed, dtype=np.uint64)
+    for j in range(bits.shape[1]):
+        h = splitmix64(h ^ bits[:, j])
+    return (h >> np.uint64(11)).astype(np.float64) / 2.0 ** 53 < test_fraction
+
+
+def ingest(sources, out="dataset", train_out=None, features=None, targets=None,
+           test_fraction=TEST_FRACTION, seed=SEED, chunk_rows=CHUNK_ROWS, delimiter=","):
+    # Writes the test split of sources to <out>/X.npy, Y.npy and, with
+    # train_out, the train split there as well. Returns the split sizes
+    features, targets = select_columns(sources, features, targets, delimiter)
+    columns = features + targets
+    p, n = len(features), len(targets)
+
+    splits = [(out, True)] + ([(train_out, False)] if train_out else [])
+    counts = {True: 0, False: 0}
+    for chunk in source_chunks(sources, columns, chunk_rows, delimiter):
+        test = test_rows(chunk, test_fraction, seed)
+        counts[True] += int(test.sum())
+        counts[False] += int((~test).sum())
+
+    files = {}
+    for path, side in splits:
+        os.makedirs(path, exist_ok=True)
+        files[side] = (
+            np.lib.format.open_memmap(f"{path}/X.npy", mode="w+", dtype=np.float64, shape=(counts[side], p)),
+            np.lib.format.open_memmap(f"{path}/Y.npy", mode="w+", dtype=np.float64, shape=(counts[side], n)),
+        )
 
-target_df['species'] = target_df['species'].apply(converter)# Concatenate the DataFrames
-iris_df = pd.concat([iris_df, target_df], axis= 1)
+    offsets = {True: 0, False: 0}
+    for chunk in source_chunks(sources, columns, chunk_rows, delimiter):
+        test = test_rows(chunk, test_fraction, seed)
+        for side, rows in ((True, test), (False, ~test)):
+            if side not in files:
+                continue
+            block = chunk[rows]
+            X, Y = files[side]
+            i = offsets[side]
+            X[i:i + len(block)] = block[:, :p]
+            Y[i:i + len(block)] = block[:, p:]
+            offsets[side] += len(block)
 
-# Converting Objects to Numerical dtype
-iris_df.drop('species', axis= 1, inplace= True)
-target_df = pd.DataFrame(columns= ['species'], data= iris.target)
-iris_df = pd.concat([iris_df, target_df], axis= 1)# Variables
-X= iris_df.drop(labels= 'sepal length (cm)', axis= 1)
-y= iris_df['sepal length (cm)']
+    for X, Y in files.values():
+        X.flush()
+        Y.flush()
+    return dict(test=counts[True], train=counts[False], p=p, n=n)
 
-# Splitting the Dataset 
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size= 0.13, random_state= 101)
 
-X = X_test.values[:]
-Yt_expected = y_test.values[:].reshape(-1, 1)
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sources", nargs="+", default=["iris"], help="CSV or .npy files, or iris")
+    parser.add_argument("--features", nargs="+", help="feature columns, by name or index")
+    parser.add_argument("--targets", nargs="+", help="target columns, by name or index")
+    parser.add_argument("--out", default="dataset")
+    parser.add_argument("--train-out")
+    parser.add_argument("--test-fraction", type=float, default=TEST_FRACTION)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--delimiter", default=",")
+    args = parser.parse_args()
 
-np.save('dataset/X.npy',X)
-np.save('dataset/Y.npy',Yt_expected)
+    sizes = ingest(args.sources, args.out, args.train_out, args.features, args.targets,
+                   args.test_fraction, args.seed, args.chunk_rows, args.delimiter)
+    print(f"> {sizes['test']} test rows to {args.out}, {sizes['train']} train rows"
+          f"{' to ' + args.train_out if args.train_out else ''} (p={sizes['p']}, n={sizes['n']})")
@@ -1 +1 @@
-from .quantize import q_model, q_dataset, quant_dataset, quant_model
\ No newline at end of file
+from .quantize import q_model, q_model_stream, q_dataset, quant_dataset, quant_model
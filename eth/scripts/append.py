@@ -0,0 +1,153 @@
+# Append-only datasets: new rows are quantized into a persistent state
+# (X_q.npy, Yt_q.npy and every tracked model's running error sums), so the
+# mse.out of a growing dataset never needs a full recomputation.
+#   python3 scripts/quantize.py --mode append --dataset new_rows --settings settings.json --models model ...
+import json
+import os
+
+import numpy as np
+
+try:
+    from .quantize import (
+        CACHE_BLOCK_ROWS, HASH_SCALARS, bound_for, combine_error_sums, dataset_hash,
+        field_elements, proc, profile_mark, quantization_arb, quantization_blocks,
+        quantization_constants, quantization_dtype, quantization_error_sums, row_blocks,
+    )
+    from .mimc7 import mimc7_multi_hash
+except ImportError:
+    from quantize import (
+        CACHE_BLOCK_ROWS, HASH_SCALARS, bound_for, combine_error_sums, dataset_hash,
+        field_elements, proc, profile_mark, quantization_arb, quantization_blocks,
+        quantization_constants, quantization_dtype, quantization_error_sums, row_blocks,
+    )
+    from mimc7 import mimc7_multi_hash
+
+
+# X_q.npy and Yt_q.npy grow in place under a fixed-size header, so appending
+# rows never moves the data
+APPEND_DIR = "./artifacts/quantization/append"
+APPEND_HEADER_BYTES = 128
+
+
+def append_header(shape):
+    # .npy version 1.0 header for an int64 array, padded to a fixed size so
+    # it can be rewritten in place whatever the row count grows to
+    header = repr(dict(descr="<i8", fortran_order=False, shape=tuple(shape)))
+    header = header.ljust(APPEND_HEADER_BYTES - 10 - 1) + "\n"
+    assert len(header) == APPEND_HEADER_BYTES - 10
+    return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1")
+
+
+def append_blocks(path, blocks, m, columns):
+    # Writes row blocks after the first m rows of an append .npy file, then
+    # its header; returns the new row count. Rows beyond m (left by an
+    # interrupted append) are overwritten
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(append_header((0, columns)))
+    with open(path, "r+b") as f:
+        f.seek(APPEND_HEADER_BYTES + m * columns * 8)
+        for block in blocks:
+            f.write(np.ascontiguousarray(block, dtype="<i8").tobytes())
+            m += block.shape[0]
+        f.truncate()
+        f.seek(0)
+        f.write(append_header((m, columns)))
+    return m
+
+
+def append_model_sums(model, state, c, X_q, Yt_q, rows, verify, dtype):
+    # Residual and squared-error sums of one tracked model over rows [i, j)
+    # of the append state, added to its running totals. A model whose files
+    # changed since it was tracked starts over from row 0
+    fingerprint = dataset_hash([f"{model}/W.npy", f"{model}/b.npy"])
+    entry = state["models"].get(model)
+    if entry is None or entry["fingerprint"] != fingerprint:
+        entry = dict(fingerprint=fingerprint, residual_sum=0, squared_error_sum=0)
+        rows = (0, rows[1])
+
+    W_q = quantization_arb(x=np.load(f"{model}/W.npy"), s=c["s_W"], z=c["z_W"])
+    b_q = quantization_arb(x=np.load(f"{model}/b.npy"), s=c["s_b"], z=c["z_b"])
+    for i in range(rows[0], rows[1], CACHE_BLOCK_ROWS):
+        j = min(i + CACHE_BLOCK_ROWS, rows[1])
+        residual_sum, squared_error_sum = quantization_error_sums(
+            np.asarray(X_q[i:j]), np.asarray(Yt_q[i:j]), W_q, b_q, c, verify, dtype
+        )
+        entry["residual_sum"] += residual_sum
+        entry["squared_error_sum"] += squared_error_sum
+    state["models"][model] = entry
+    return entry
+
+
+def quant_append(dataset, setting, models=(), state_dir=APPEND_DIR, verify="full", hash_input=False):
+    # Appends the rows of dataset/X.npy, Y.npy to the append state in
+    # state_dir: quantized rows are added to X_q.npy and Yt_q.npy, the
+    # MultiMiMC7 chain over X_q is extended, and every tracked model (plus
+    # any new one in models) adds the residual and squared-error sums of the
+    # new rows only. The sums are integers, so mean_error_q and mse_q from
+    # combine_error_sums equal a full recomputation over all rows. With
+    # hash_input, the dataset commitment is finished from the chain, which
+    # rehashes Yt_q (O(m * n)) as it comes after X_q
+    os.makedirs(state_dir, exist_ok=True)
+    state_path = f"{state_dir}/state.json"
+    settings_hash = dataset_hash([setting])
+    if os.path.exists(state_path):
+        state = json.load(open(state_path, "rb"))
+        assert state["settings"] == settings_hash, "settings changed, start a new append state"
+    else:
+        state = dict(settings=settings_hash, m=0, p=None, n=None, x_chain=0, models={})
+
+    data = json.load(open(setting, "rb"))
+    c = quantization_constants(data)
+    out = int(quantization_arb(x=data["mse_target"], s=c["s_Sq"], z=c["z_Sq"]))
+    X = np.load(f"{dataset}/X.npy", mmap_mode="r")
+    Y = np.load(f"{dataset}/Y.npy", mmap_mode="r")
+    k, p = X.shape
+    n = Y.shape[1]
+    assert Y.shape[0] == k, f"X has {k} rows, Y {Y.shape[0]}"
+    assert state["p"] in (None, p) and state["n"] in (None, n), \
+        f"appending ({k}, {p}), ({k}, {n}) rows to ({state['p']}, {state['n']}) columns"
+    m0, m = state["m"], state["m"] + k
+
+    # The chain over X_q is extended block by block as the rows are written
+    x_chain = [int(state["x_chain"])]
+
+    def chained(blocks):
+        for block in blocks:
+            x_chain[0] = mimc7_multi_hash(field_elements(block).ravel().tolist(), x_chain[0])
+            yield block
+
+    append_blocks(f"{state_dir}/X_q.npy", chained(quantization_blocks(X, c["s_X"], c["z_X"], CACHE_BLOCK_ROWS)),
+                  m0, p)
+    append_blocks(f"{state_dir}/Yt_q.npy", quantization_blocks(Y, c["s_Yt"], c["z_Yt"], CACHE_BLOCK_ROWS), m0, n)
+    profile_mark("append")
+
+    X_q = np.load(f"{state_dir}/X_q.npy", mmap_mode="r")
+    Yt_q = np.load(f"{state_dir}/Yt_q.npy", mmap_mode="r")
+    dtype = quantization_dtype(bound_for(c, m, p, n))
+    for model in dict.fromkeys(list(state["models"]) + list(models)):
+        append_model_sums(model, state, c, X_q, Yt_q, (m0, m), verify, dtype)
+
+    # Committed last: an interrupted append leaves m at the old row count,
+    # and the next one overwrites the partial rows
+    state.update(m=m, p=p, n=n, x_chain=str(x_chain[0]))
+    with open(f"{state_path}.tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{state_path}.tmp", state_path)
+
+    result = dict(m=m, appended=k, out=out, models={})
+    for model, entry in state["models"].items():
+        mean_error_q, mse_q = combine_error_sums([entry], m, n, c["z_Sq"])
+        result["models"][model] = dict(mean_error_q=mean_error_q, mse_q=mse_q, margin=out - mse_q,
+                                       passed=mse_q <= out)
+        print(f"{model}: mse_q {mse_q} over {m} rows, margin {out - mse_q}"
+              + ("" if mse_q <= out else " (fails target)"))
+    profile_mark("mse")
+    if hash_input:
+        r = x_chain[0]
+        for block in row_blocks(Yt_q, CACHE_BLOCK_ROWS):
+            r = mimc7_multi_hash(field_elements(block).ravel().tolist(), r)
+        result["hash_input"] = mimc7_multi_hash(proc([c[key] for key in HASH_SCALARS]), r)
+    with open(f"{state_dir}/append.json", "w") as f:
+        json.dump(result, f, indent=2)
+    return result
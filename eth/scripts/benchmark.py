@@ -0,0 +1,220 @@
+# Benchmarks the bounty pipeline on synthetic datasets of shape (m, p, n):
+# quant_dataset, quant_model, JSON serialization, witness calculation and
+# groth16 proving. Each stage records wall time, peak RSS and, for the
+# proving stages, the constraint count of the circuit.
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+try:
+    from .circuit_cache import circuit_artifacts as shape_circuit
+    from .quantize import peak_rss, quant_dataset, quant_model, write_inputs
+except ImportError:
+    from circuit_cache import circuit_artifacts as shape_circuit
+    from quantize import peak_rss, quant_dataset, quant_model, write_inputs
+
+
+ETH_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SHAPES = ["20,4,1", "1000,4,1", "10000,4,1", "1000,16,1", "1000,4,4"]
+
+
+def synthetic_dataset(path, m, p, n, settings, seed=0):
+    # X, Y, W, b and a settings file for (m, p, n), drawn inside the
+    # settings' ranges so that quantization does not saturate
+    rng = np.random.default_rng(seed)
+    s = dict(settings, m=m, p=p, n=n)
+
+    X = rng.uniform(s["alpha_X"], s["beta_X"], size=(m, p))
+    W = rng.uniform(0, s["beta_Yt"] / (p * max(abs(s["beta_X"]), 1)), size=(p, n))
+    b = rng.uniform(s["alpha_b"], s["beta_b"], size=(n,)) * 0.1
+    Y = np.clip(X @ W + b + rng.normal(0, 0.1, size=(m, n)), s["alpha_Yt"], s["beta_Yt"])
+
+    for name, arrays in (("dataset", dict(X=X, Y=Y)), ("model", dict(W=W, b=b))):
+        os.makedirs(f"{path}/{name}", exist_ok=True)
+        for key, value in arrays.items():
+            np.save(f"{path}/{name}/{key}.npy", value)
+    with open(f"{path}/settings.json", "w") as f:
+        json.dump(s, f, indent=2)
+
+
+def r1cs_info(path):
+    # Header section of a circom .r1cs file
+    import struct
+
+    with open(path, "rb") as f:
+        magic, _, sections = struct.unpack("<4sII", f.read(12))
+        assert magic == b"r1cs", path
+        for _ in range(sections):
+            kind, size = struct.unpack("<IQ", f.read(12))
+            if kind != 1:
+                f.seek(size, 1)
+                continue
+            field_size, = struct.unpack("<I", f.read(4))
+            f.seek(field_size, 1)
+            wires, outputs, public_inputs, private_inputs, labels, constraints = struct.unpack(
+                "<IIIIQI", f.read(28)
+            )
+            return dict(
+                constraints=constraints,
+                wires=wires,
+                outputs=outputs,
+                public_inputs=public_inputs,
+                private_inputs=private_inputs,
+                labels=labels,
+            )
+    assert False, f"{path} has no header section"
+
+
+def circuit_artifacts(circuit_dir, m, p, n):
+    # circuit.{r1cs,wasm,zkey} compiled for (m, p, n), looked up as
+    # <circuit_dir>/<m>_<p>_<n>/, or in the shape-keyed circuit cache of
+    # quantize.py (which serves (20, 4, 1) from the demo build)
+    if circuit_dir is not None:
+        paths = {ext: os.path.join(circuit_dir, f"{m}_{p}_{n}", f"circuit.{ext}") for ext in ("r1cs", "wasm", "zkey")}
+    else:
+        cached = shape_circuit(m, p, n)
+        paths = {ext: cached[ext] for ext in ("r1cs", "wasm", "zkey")}
+    return {ext: path for ext, path in paths.items() if os.path.exists(path)}
+
+
+def run_stage(cmd, cwd):
+    # Wall time and peak RSS of one child process, from its own rusage
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    seconds = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return dict(seconds=seconds, peak_rss=rusage.ru_maxrss * 1024, returncode=proc.returncode)
+
+
+def python_stages(path, out):
+    # The quantization stages, run in a fresh process per shape. peak_rss is
+    # the process high-water mark once the stage has finished
+    import contextlib
+
+    os.chdir(path)
+    records = []
+
+    def timed(stage, fn):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stderr):
+            result = fn()
+        records.append(dict(stage=stage, seconds=time.perf_counter() - start, peak_rss=peak_rss()))
+        return result
+
+    timed("quant_dataset", lambda: quant_dataset("dataset", "settings.json", fmt=None))
+    data_all = timed("quant_model", lambda: quant_model("model", "dataset", "settings.json", fmt=None))
+    os.makedirs("artifacts/quantization", exist_ok=True)
+    timed("serialize", lambda: write_inputs(data_all, "artifacts/quantization/inputs_ml", "json"))
+    records[-1]["bytes"] = os.path.getsize("artifacts/quantization/inputs_ml.json")
+
+    with open(out, "w") as f:
+        json.dump(records, f)
+
+
+def benchmark(shapes, settings, out, circuit_dir=None, publickey=None, workdir=None):
+    # Runs every stage for every "m,p,n" shape and writes the results to out
+    import platform
+    import tempfile
+
+    base = json.load(open(settings, "rb"))
+    publickey = os.path.abspath(publickey or os.path.join(ETH_DIR, "keys", "out_public.json"))
+    # The stages run with eth/ as their working directory
+    workdir = os.path.abspath(workdir or tempfile.mkdtemp(prefix="zkml_bench_"))
+    circuit_dir = circuit_dir and os.path.abspath(circuit_dir)
+
+    results = []
+    for shape in shapes:
+        m, p, n = (int(v) for v in shape.split(","))
+        path = os.path.join(workdir, f"{m}_{p}_{n}")
+        synthetic_dataset(path, m, p, n, base)
+        row = dict(m=m, p=p, n=n)
+        print(f"> Benchmarking m={m} p={p} n={n}")
+
+        stages_out = os.path.join(path, "stages.json")
+        r = run_stage([sys.executable, os.path.abspath(__file__), "--mode", "stages",
+                       "--dir", path, "--out", stages_out], ETH_DIR)
+        assert r["returncode"] == 0, f"quantization stages failed for {shape}"
+        for record in json.load(open(stages_out, "rb")):
+            results.append(dict(row, **record))
+
+        artifacts = circuit_artifacts(circuit_dir, m, p, n)
+        info = r1cs_info(artifacts["r1cs"]) if "r1cs" in artifacts else {}
+        if "wasm" not in artifacts or "zkey" not in artifacts:
+            for stage in ("witness", "groth16"):
+                results.append(dict(row, stage=stage, skipped="no circuit compiled for this shape", **info))
+            continue
+
+        for stage in ("witness", "groth16"):
+            stage_out = os.path.join(path, f"{stage}.json")
+            r = run_stage(["npx", "hardhat", "bench_prove",
+                           "--stage", stage,
+                           "--inputs", os.path.join(path, "artifacts/quantization/inputs_ml.json"),
+                           "--publickey", publickey,
+                           "--wasm", artifacts["wasm"],
+                           "--zkey", artifacts["zkey"],
+                           "--wtns", os.path.join(path, "witness.wtns"),
+                           "--out", stage_out], ETH_DIR)
+            if r["returncode"] != 0:
+                results.append(dict(row, stage=stage, failed=r["returncode"], **info))
+                break
+            # seconds is measured inside the task; process_seconds adds node start-up
+            record = json.load(open(stage_out, "rb"))
+            results.append(dict(row, stage=stage, process_seconds=r["seconds"],
+                                peak_rss=r["peak_rss"], **record, **info))
+
+    revision = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ETH_DIR,
+                              capture_output=True, text=True).stdout.strip()
+    report = dict(
+        revision=revision or None,
+        python=platform.python_version(),
+        numpy=np.__version__,
+        machine=platform.machine(),
+        results=results,
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def compare(baseline, results):
+    # Per (m, p, n, stage) time and memory ratios of results over baseline
+    def index(path):
+        report = json.load(open(path, "rb"))
+        return {(r["m"], r["p"], r["n"], r["stage"]): r for r in report["results"] if "seconds" in r}
+
+    old, new = index(baseline), index(results)
+    print(f"{'m':>8} {'p':>4} {'n':>4} {'stage':<14} {'seconds':>10} {'ratio':>7} {'peak MiB':>9} {'ratio':>7}")
+    for key in sorted(new.keys() & old.keys()):
+        a, b = old[key], new[key]
+        print(f"{key[0]:>8} {key[1]:>4} {key[2]:>4} {key[3]:<14} "
+              f"{b['seconds']:>10.3f} {b['seconds'] / max(a['seconds'], 1e-9):>7.2f} "
+              f"{b['peak_rss'] / 2 ** 20:>9.1f} {b['peak_rss'] / max(a['peak_rss'], 1):>7.2f}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", default="run", choices=["run", "stages", "compare"])
+    parser.add_argument("--settings", default="settings.json")
+    parser.add_argument("--shapes", nargs="+", default=DEFAULT_SHAPES)
+    parser.add_argument("--circuits")
+    parser.add_argument("--publickey")
+    parser.add_argument("--dir")
+    parser.add_argument("--out", default="./artifacts/benchmark/results.json")
+    parser.add_argument("--baseline")
+    args = parser.parse_args()
+
+    if args.mode == "run":
+        benchmark(args.shapes, args.settings, args.out, args.circuits, args.publickey, args.dir)
+    elif args.mode == "stages":
+        python_stages(args.dir, args.out)
+    elif args.mode == "compare":
+        compare(args.baseline, args.out)
+    else:
+        assert False
@@ -0,0 +1,191 @@
+# Calibration of the settings' alpha/beta ranges from the data: a first pass
+# collects the range of every tensor, a second measures clipping and the
+# quantized MSE each model would prove with the chosen ranges.
+#   python3 scripts/quantize.py --mode calibrate --dataset dataset --models model ... --settings settings.json
+import json
+
+import numpy as np
+
+try:
+    from .quantize import (
+        CACHE_BLOCK_ROWS, bound_for, combine_error_sums, dequantization, profile_mark,
+        quantization_arb, quantization_constants, quantization_dtype,
+        quantization_fused_error_sums,
+    )
+except ImportError:
+    from quantize import (
+        CACHE_BLOCK_ROWS, bound_for, combine_error_sums, dequantization, profile_mark,
+        quantization_arb, quantization_constants, quantization_dtype,
+        quantization_fused_error_sums,
+    )
+
+
+# Values kept per tensor for percentile calibration, and the headroom left
+# above the largest model MSE (or mse_target) in the Sq range
+CALIBRATION_SAMPLE = 2 ** 16
+CALIBRATION_MSE_HEADROOM = 1.25
+
+
+def calibration_update(stats, x, rng):
+    # Running min/max and a uniform reservoir sample of every value seen
+    x = np.asarray(x, dtype=np.float64).ravel()
+    if x.size == 0:
+        return
+    stats["min"] = min(stats["min"], float(x.min()))
+    stats["max"] = max(stats["max"], float(x.max()))
+    free = CALIBRATION_SAMPLE - stats["sample"].size
+    if free > 0:
+        stats["sample"] = np.concatenate([stats["sample"], x[:free]])
+        stats["seen"] += min(free, x.size)
+        x = x[free:]
+    if x.size:
+        slots = rng.integers(0, stats["seen"] + np.arange(1, x.size + 1))
+        keep = slots < CALIBRATION_SAMPLE
+        stats["sample"][slots[keep]] = x[keep]
+        stats["seen"] += x.size
+
+
+def calibration_range(stats, method="minmax", percentile=99.99):
+    # (alpha, beta) of one tensor: its exact min/max, or percentiles of the
+    # reservoir sample. The range always contains 0 so that the zero point
+    # lands inside [ALPHA_Q, BETA_Q] and stays a non-negative field element
+    if method == "minmax":
+        lo, hi = stats["min"], stats["max"]
+    else:
+        assert method == "percentile", method
+        lo, hi = np.percentile(stats["sample"], [100 - percentile, percentile])
+        lo, hi = max(float(lo), stats["min"]), min(float(hi), stats["max"])
+    lo, hi = min(lo, 0.0), max(hi, 0.0)
+    if hi <= lo:
+        hi = lo + 1.0
+    return lo, hi
+
+
+def calibrate(dataset, models, setting, method="minmax", percentile=99.99, out=None, block_rows=CACHE_BLOCK_ROWS):
+    # Picks alpha/beta for every tensor from the data instead of by hand.
+    # A first pass over the dataset (and each model's predictions and
+    # residuals) collects ranges; a second pass with the chosen settings
+    # measures the clipping rate per tensor and, per model, how far the
+    # circuit's quantized MSE lands from the float MSE. The settings are
+    # written to out, with m, p, n, mse_target and unlisted keys of setting
+    base = json.load(open(setting, 'rb'))
+    X = np.load(f'{dataset}/X.npy', mmap_mode="r")
+    Y = np.load(f'{dataset}/Y.npy', mmap_mode="r")
+    m, p = X.shape
+    n = Y.shape[1]
+    W = [np.load(f'{model}/W.npy') for model in models]
+    b = [np.load(f'{model}/b.npy') for model in models]
+    rng = np.random.default_rng(0)
+
+    stats = {t: dict(min=np.inf, max=-np.inf, sample=np.empty(0), seen=0) for t in ("X", "W", "b", "Y", "Yt", "R")}
+    R2_sum = [0.0] * len(models)
+    for i in range(0, m, block_rows):
+        X_block = np.asarray(X[i:i + block_rows])
+        Yt_block = np.asarray(Y[i:i + block_rows])
+        calibration_update(stats["X"], X_block, rng)
+        calibration_update(stats["Yt"], Yt_block, rng)
+        for k in range(len(models)):
+            Y_block = np.matmul(X_block, W[k]) + b[k]
+            R = Y_block - Yt_block
+            calibration_update(stats["Y"], Y_block, rng)
+            calibration_update(stats["R"], R, rng)
+            R2_sum[k] += float((R ** 2).sum())
+    for k in range(len(models)):
+        calibration_update(stats["W"], W[k], rng)
+        calibration_update(stats["b"], b[k], rng)
+    if not models:
+        # Without a model, predictions are assumed to span the labels
+        stats["Y"] = stats["Yt"]
+        span = stats["Yt"]["max"] - stats["Yt"]["min"]
+        stats["R"] = dict(min=-span, max=span, sample=np.array([-span, span]), seen=2)
+    profile_mark("calibrate")
+
+    settings = dict(base)
+    for t in ("X", "W", "b", "Y", "Yt", "R"):
+        if t in ("W", "b") and not models:
+            # Nothing to calibrate the weights on: keep the given ranges
+            continue
+        # Model weights are never clipped
+        settings[f"alpha_{t}"], settings[f"beta_{t}"] = calibration_range(
+            stats[t], "minmax" if t in ("W", "b") else method, percentile
+        )
+    mse = [R2 / (m * n) for R2 in R2_sum]
+    settings["alpha_S"] = 0
+    settings["beta_S"] = max([base["mse_target"]] + mse) * CALIBRATION_MSE_HEADROOM
+    settings.update(m=m, p=p, n=n)
+    c = quantization_constants(settings)
+
+    # Second pass: clipping and predicted quantization error
+    clipped = dict.fromkeys(stats, 0)
+    total = dict.fromkeys(stats, 0)
+
+    def clip(t, x):
+        x = np.asarray(x)
+        clipped[t] += int(((x < settings[f"alpha_{t}"]) | (x > settings[f"beta_{t}"])).sum())
+        total[t] += x.size
+
+    W_q = [quantization_arb(x=w, s=c["s_W"], z=c["z_W"]) for w in W]
+    b_q = [quantization_arb(x=v, s=c["s_b"], z=c["z_b"]) for v in b]
+    parts = [[] for _ in models]
+    dtype = quantization_dtype(bound_for(c, m, p, n))
+    for i in range(0, m, block_rows):
+        X_block = np.asarray(X[i:i + block_rows])
+        Yt_block = np.asarray(Y[i:i + block_rows])
+        clip("X", X_block)
+        clip("Yt", Yt_block)
+        X_q = quantization_arb(x=X_block, s=c["s_X"], z=c["z_X"])
+        Yt_q = quantization_arb(x=Yt_block, s=c["s_Yt"], z=c["z_Yt"])
+        for k in range(len(models)):
+            Y_block = np.matmul(X_block, W[k]) + b[k]
+            clip("Y", Y_block)
+            clip("R", Y_block - Yt_block)
+            residual_sum, squared_error_sum = quantization_fused_error_sums(X_q, W_q[k], b_q[k], Yt_q, c, dtype=dtype)
+            parts[k].append(dict(residual_sum=residual_sum, squared_error_sum=squared_error_sum))
+    for k in range(len(models)):
+        clip("W", W[k])
+        clip("b", b[k])
+    profile_mark("evaluate")
+
+    out_q = int(quantization_arb(x=base["mse_target"], s=c["s_Sq"], z=c["z_Sq"]))
+    report = dict(
+        method=method,
+        percentile=percentile if method == "percentile" else None,
+        tensors={
+            t: dict(
+                min=None if total[t] == 0 else stats[t]["min"],
+                max=None if total[t] == 0 else stats[t]["max"],
+                alpha=settings[f"alpha_{t}"],
+                beta=settings[f"beta_{t}"],
+                clip_rate=clipped[t] / total[t] if total[t] else 0.0,
+            )
+            for t in stats
+        },
+        models=[],
+        settings=out,
+    )
+    for k, model in enumerate(models):
+        mse_q = combine_error_sums(parts[k], m, n, c["z_Sq"])[1]
+        mse_simulated = float(dequantization(mse_q, s=c["s_Sq"], z=c["z_Sq"]))
+        report["models"].append(dict(
+            model=model,
+            mse=mse[k],
+            mse_simulated=mse_simulated,
+            error=mse_simulated - mse[k],
+            relative_error=(mse_simulated - mse[k]) / mse[k] if mse[k] else 0.0,
+            mse_q=mse_q,
+            margin=out_q - mse_q,
+            passed=mse_q <= out_q,
+        ))
+
+    for t, r in report["tensors"].items():
+        print(f"{t:>2}: alpha {r['alpha']:.6g} beta {r['beta']:.6g} clipped {100 * r['clip_rate']:.4f}%")
+    for r in report["models"]:
+        print(f"{r['model']}: mse {r['mse']:.6g} simulated {r['mse_simulated']:.6g} "
+              f"(error {r['relative_error']:+.3%}) mse_q {r['mse_q']} margin {r['margin']}")
+
+    if out is not None:
+        with open(out, "w") as f:
+            json.dump(settings, f, indent=2)
+    with open("./artifacts/quantization/calibration.json", "w") as f:
+        json.dump(report, f, indent=2)
+    return settings, report
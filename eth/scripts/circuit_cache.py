@@ -0,0 +1,105 @@
+# Compiled quant_gemm_mse_enc(m, p, n) circuits by shape: the prebuilt lr
+# circuit for its own shape, otherwise a per-shape cache built on demand by
+# circuits/build_shape.js.
+#   python3 scripts/quantize.py --mode circuit --settings settings.json [--dataset dataset] [--build]
+import glob
+import hashlib
+import json
+import os
+import re
+import subprocess
+
+import numpy as np
+
+try:
+    from .estimate import PTAU_POWER, estimate, load_fit
+except ImportError:
+    from estimate import PTAU_POWER, estimate, load_fit
+
+
+# Compiled quant_gemm_mse_enc(m, p, n) circuits, one directory per shape and
+# circuit source hash (see circuit_artifacts)
+CIRCUITS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "circuits")
+CIRCUIT_CACHE = os.environ.get("QUANTIZE_CIRCUIT_CACHE", os.path.join(CIRCUITS_DIR, "shapes"))
+CIRCUIT_SOURCES = (
+    "lr/circuit.circom", "math/circuit.circom", "range_proof/circuit.circom",
+    "crypto/ecdh.circom", "crypto/encrypt.circom", "package.json",
+)
+
+
+def circuit_source_hash(circuits_dir=CIRCUITS_DIR):
+    # sha256 of everything the compiled circuit depends on except its shape:
+    # the templates without the `component main` line, and package.json for
+    # the circom and circomlib versions
+    h = hashlib.sha256()
+    for name in CIRCUIT_SOURCES:
+        with open(os.path.join(circuits_dir, name), "rb") as f:
+            lines = [line for line in f.read().splitlines() if not line.lstrip().startswith(b"component main")]
+        h.update(name.encode() + b"\0" + b"\n".join(lines) + b"\0")
+    return h.hexdigest()
+
+
+def circuit_shape(setting, dataset=None):
+    # (m, p, n) of the dataset when given, of the settings otherwise
+    if dataset is not None:
+        X = np.load(f'{dataset}/X.npy', mmap_mode="r")
+        Y = np.load(f'{dataset}/Y.npy', mmap_mode="r")
+        return X.shape[0], X.shape[1], Y.shape[1] if Y.ndim > 1 else 1
+    data = json.load(open(setting, 'rb'))
+    return data['m'], data['p'], data['n']
+
+
+def circuit_artifacts(m, p, n, build=False, cache_dir=CIRCUIT_CACHE, circuits_dir=CIRCUITS_DIR):
+    # r1cs, wasm, zkey and verification key of quant_gemm_mse_enc(m, p, n),
+    # cached under <cache_dir>/<m>_<p>_<n>-<source hash>/. A missing shape is
+    # compiled by circuits/build_shape.js when build is set, after checking
+    # with estimate.py that it fits the ptau; otherwise its paths come back
+    # with built=False
+    # The shape of lr/circuit.circom is served by the `yarn prod` build, whose
+    # verifier is the deployed one. Only key "lr" can claim on-chain: cached
+    # shapes get a freshly contributed zkey that no deployed verifier matches
+    with open(os.path.join(circuits_dir, "lr", "circuit.circom")) as f:
+        main = re.search(r"component main = quant_gemm_mse_enc\((\d+),\s*(\d+),\s*(\d+)\)", f.read())
+    prebuilt = os.path.join(circuits_dir, "artifacts", "lr.zkey")
+    if main and tuple(int(v) for v in main.groups()) == (m, p, n) and os.path.exists(prebuilt):
+        return dict(
+            m=m, p=p, n=n, key="lr",
+            r1cs=os.path.join(circuits_dir, "lr", "circuit.r1cs"),
+            wasm=os.path.join(circuits_dir, "artifacts", "lr.wasm"),
+            zkey=prebuilt,
+            vkey=None,
+            verifier=os.path.join(os.path.dirname(circuits_dir), "eth", "contracts", "libraries", "LibVerifier.sol"),
+            built=True,
+        )
+
+    key = f"{m}_{p}_{n}-{circuit_source_hash(circuits_dir)[:16]}"
+    path = os.path.join(cache_dir, key)
+    result = dict(
+        m=m, p=p, n=n, key=key,
+        r1cs=os.path.join(path, "circuit.r1cs"),
+        wasm=os.path.join(path, "circuit.wasm"),
+        zkey=os.path.join(path, "circuit.zkey"),
+        vkey=os.path.join(path, "verification_key.json"),
+        verifier=os.path.join(path, "LibVerifier.sol"),
+    )
+    if not os.path.exists(result["zkey"]) and build:
+        ptau = sorted(glob.glob(os.path.join(circuits_dir, "*.ptau")))
+        assert ptau, f"no .ptau in {circuits_dir}"
+        power = int(ptau[0].rsplit("_", 1)[-1].split(".")[0]) if "_final_" in ptau[0] else PTAU_POWER
+        e = estimate(m, p, n, load_fit(), power)
+        assert e["fits"], f"quant_gemm_mse_enc({m},{p},{n}) needs about 2^{e['power']} > 2^{power} constraints"
+        print(f"> Compiling quant_gemm_mse_enc({m},{p},{n}), about {e['constraints']} constraints")
+        subprocess.run(["node", "build_shape.js", str(m), str(p), str(n), key, os.path.abspath(cache_dir)],
+                       cwd=circuits_dir, check=True)
+    result["built"] = os.path.exists(result["zkey"])
+    return result
+
+
+def circuit(setting, dataset=None, build=False, cache_dir=CIRCUIT_CACHE):
+    # Selects the compiled circuit for the dataset's shape, building it once
+    # if needed, and writes the paths to artifacts/quantization/circuit.json
+    result = circuit_artifacts(*circuit_shape(setting, dataset), build=build, cache_dir=cache_dir)
+    os.makedirs("./artifacts/quantization", exist_ok=True)
+    with open("./artifacts/quantization/circuit.json", "w") as f:
+        json.dump(result, f, indent=2)
+    return result
@@ -0,0 +1,124 @@
+# Recovers the models of collected bounties. claim_bounty encrypts every
+# quantized weight w as (iv, w + mimc7.hash(shared_key, iv)) with
+# iv = mimc7.multiHash([w], 0) and the ECDH key of the issuer and the
+# claimer; the issuer strips the pads with its private key and the claimer's
+# public key, checks each iv and dequantizes with the settings' s_W, z_W and
+# s_b, z_b.
+import json
+import os
+
+import numpy as np
+
+try:
+    from .ecdh import shared_key
+    from .mimc7 import mimc7_hash, mimc7_multi_hash
+    from .quantize import P, dequantization, generate_quantization_arb_constants
+except ImportError:
+    from ecdh import shared_key
+    from mimc7 import mimc7_hash, mimc7_multi_hash
+    from quantize import P, dequantization, generate_quantization_arb_constants
+
+
+def claim_ciphertexts(signals, m, p, n):
+    # W_q_enc (p, n, 2) and b_q_enc (n, 2) from the public signals of a claim:
+    # out, hash_input, X_q, W_q_enc, b_q_enc, public_key (the issuer's), ...
+    signals = [int(v) for v in signals]
+    offset = 2 + m * p
+    W_q_enc = np.array(signals[offset:offset + 2 * p * n], dtype=object).reshape(p, n, 2)
+    offset += 2 * p * n
+    b_q_enc = np.array(signals[offset:offset + 2 * n], dtype=object).reshape(n, 2)
+    return W_q_enc, b_q_enc
+
+
+def load_claim(path, claimer_key=None):
+    # Public signals and the claimer's public key from claim_bounty's
+    # artifacts/claim.json or a batch_claim *_proof.json; a bare list of
+    # signals needs the key passed in
+    data = json.load(open(path, "rb"))
+    if isinstance(data, dict):
+        signals = data["signals"] if "signals" in data else data["args"][3]
+        claimer_key = claimer_key or data["public_key"]
+    else:
+        signals = data
+    assert claimer_key is not None, f"{path}: no claimer public key"
+    return signals, tuple(int(v) for v in claimer_key)
+
+
+def decrypt_models(claims, private_key, settings):
+    # Plaintext W_q, b_q of every claim, with all pads of all claims computed
+    # in one elementwise MiMC7 pass. claims are (W_q_enc, b_q_enc, public_key)
+    keys = {}
+    ivs, ciphertexts, shared = [], [], []
+    for W_q_enc, b_q_enc, claimer in claims:
+        if claimer not in keys:
+            keys[claimer] = shared_key(private_key, claimer)
+        for enc in (W_q_enc, b_q_enc):
+            enc = enc.reshape(-1, 2)
+            ivs.append(enc[:, 0])
+            ciphertexts.append(enc[:, 1])
+            shared.append(np.full(len(enc), keys[claimer], dtype=object))
+    ivs, ciphertexts, shared = (np.concatenate(x) if x else np.zeros(0, dtype=object)
+                                for x in (ivs, ciphertexts, shared))
+
+    plain = (ciphertexts - mimc7_hash(shared, ivs)) % P
+    bad = [i for i, (w, iv) in enumerate(zip(plain, ivs)) if mimc7_multi_hash([w], 0) != iv]
+    assert not bad, f"{len(bad)} weights fail their iv check, wrong private key or public signals?"
+
+    # Field elements back to signed quantized values, P - x decoding to -x
+    plain[plain > P // 2] -= P
+
+    s_W, z_W = generate_quantization_arb_constants(alpha=settings["alpha_W"], beta=settings["beta_W"])
+    s_b, z_b = generate_quantization_arb_constants(alpha=settings["alpha_b"], beta=settings["beta_b"])
+    models, i = [], 0
+    for W_q_enc, b_q_enc, _ in claims:
+        p, n = W_q_enc.shape[:2]
+        W_q = plain[i:i + p * n].astype(np.int64).reshape(p, n)
+        b_q = plain[i + p * n:i + p * n + n].astype(np.int64).reshape(1, n)
+        i += p * n + n
+        models.append(dict(
+            W_q=W_q, b_q=b_q,
+            W=dequantization(W_q, s=s_W, z=z_W).astype(np.float64),
+            b=dequantization(b_q, s=s_b, z=z_b).astype(np.float64),
+        ))
+    return models
+
+
+def decrypt(paths, setting, private_key_path="./keys/out_private.json", out="./artifacts/decrypt",
+            claimer_key=None):
+    # Decrypts the claims in paths and writes each model as
+    # <out>/<name>/W.npy and b.npy, the layout quant_model reads
+    settings = json.load(open(setting, "rb"))
+    private_key = int(json.load(open(private_key_path, "rb")))
+    m, p, n = settings["m"], settings["p"], settings["n"]
+
+    claims = []
+    for path in paths:
+        signals, claimer = load_claim(path, claimer_key)
+        claims.append(claim_ciphertexts(signals, m, p, n) + (claimer,))
+    models = decrypt_models(claims, private_key, settings)
+
+    report = []
+    for path, model in zip(paths, models):
+        name = os.path.splitext(os.path.basename(path))[0]
+        os.makedirs(f"{out}/{name}", exist_ok=True)
+        np.save(f"{out}/{name}/W.npy", model["W"])
+        np.save(f"{out}/{name}/b.npy", model["b"])
+        report.append(dict(source=path, model=f"{out}/{name}",
+                           W_q=model["W_q"].tolist(), b_q=model["b_q"].tolist()))
+        print(f"> {path}: model written to {out}/{name}")
+    with open(f"{out}/models.json", "w") as f:
+        json.dump(report, f, indent=2)
+    return models
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--claims", nargs="+", required=True)
+    parser.add_argument("--claimer-key", nargs=2, help="claimer's public key, for bare signal lists")
+    parser.add_argument("--settings", default="settings.json")
+    parser.add_argument("--private-key", default="./keys/out_private.json")
+    parser.add_argument("--out", default="./artifacts/decrypt")
+    args = parser.parse_args()
+
+    decrypt(args.claims, args.settings, args.private_key, args.out, args.claimer_key)
@@ -29,6 +29,14 @@ async function main() {
     () => {},
   );
 
+  // First block the bounty index (see syncIndex) has to scan
+  const receipt = await bm.deployTransaction.wait();
+  fs.writeFileSync(
+    './artifacts/.env_contract_block',
+    receipt.blockNumber.toString(),
+    () => {},
+  );
+
 }
 
 // We recommend this pattern to be able to use async/await everywhere
@@ -0,0 +1,127 @@
+# Baby Jubjub ECDH as in maci-crypto (Keypair.genEcdhSharedKey) and the
+# circuits/crypto/ecdh.circom template: the private key is hashed with
+# BLAKE-512, pruned and shifted before the scalar multiplication
+P = 21888242871839275222246405745257275088548364400416034343698204186575808495617
+
+# Twisted Edwards curve a x^2 + y^2 = 1 + d x^2 y^2 (circomlib babyjub.js)
+A = 168700
+D = 168696
+BASE8 = (
+    5299619240641551281634865583518297030282874472190772894086521144482721001553,
+    16950150798460657717958625567821834550301663161624707787222815936182638968203,
+)
+
+MASK64 = 2 ** 64 - 1
+
+BLAKE512_IV = (
+    0x6A09E667F3BCC908, 0xBB67AE8584CAA73B, 0x3C6EF372FE94F82B, 0xA54FF53A5F1D36F1,
+    0x510E527FADE682D1, 0x9B05688C2B3E6C1F, 0x1F83D9ABFB41BD6B, 0x5BE0CD19137E2179,
+)
+BLAKE512_C = (
+    0x243F6A8885A308D3, 0x13198A2E03707344, 0xA4093822299F31D0, 0x082EFA98EC4E6C89,
+    0x452821E638D01377, 0xBE5466CF34E90C6C, 0xC0AC29B7C97C50DD, 0x3F84D5B5B5470917,
+    0x9216D5D98979FB1B, 0xD1310BA698DFB5AC, 0x2FFD72DBD01ADFB7, 0xB8E1AFED6A267E96,
+    0xBA7C9045F12C7F99, 0x24A19947B3916CF7, 0x0801F2E2858EFC16, 0x636920D871574E69,
+)
+BLAKE512_SIGMA = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15),
+    (14, 10, 4, 8, 9, 15, 13, 6, 1, 12, 0, 2, 11, 7, 5, 3),
+    (11, 8, 12, 0, 5, 2, 15, 13, 10, 14, 3, 6, 7, 1, 9, 4),
+    (7, 9, 3, 1, 13, 12, 11, 14, 2, 6, 5, 10, 4, 0, 15, 8),
+    (9, 0, 5, 7, 2, 4, 10, 15, 14, 1, 11, 12, 6, 8, 3, 13),
+    (2, 12, 6, 10, 0, 11, 8, 3, 4, 13, 7, 5, 15, 14, 1, 9),
+    (12, 5, 1, 15, 14, 13, 4, 10, 0, 7, 6, 3, 9, 2, 8, 11),
+    (13, 11, 7, 14, 12, 1, 3, 9, 5, 0, 15, 4, 8, 6, 2, 10),
+    (6, 15, 14, 9, 11, 3, 0, 8, 12, 2, 13, 7, 1, 4, 10, 5),
+    (10, 2, 8, 4, 7, 6, 1, 5, 15, 11, 9, 14, 3, 12, 13, 0),
+)
+
+
+def _rotr64(x, n):
+    return ((x >> n) | (x << (64 - n))) & MASK64
+
+
+def _blake512_compress(h, block, t):
+    m = [int.from_bytes(block[i:i + 8], "big") for i in range(0, 128, 8)]
+    c = BLAKE512_C
+    v = list(h) + list(c[:4]) + [t & MASK64 ^ c[4], t & MASK64 ^ c[5], t >> 64 ^ c[6], t >> 64 ^ c[7]]
+
+    def g(a, b, cc, d, x, y):
+        v[a] = (v[a] + v[b] + (m[x] ^ c[y])) & MASK64
+        v[d] = _rotr64(v[d] ^ v[a], 32)
+        v[cc] = (v[cc] + v[d]) & MASK64
+        v[b] = _rotr64(v[b] ^ v[cc], 25)
+        v[a] = (v[a] + v[b] + (m[y] ^ c[x])) & MASK64
+        v[d] = _rotr64(v[d] ^ v[a], 16)
+        v[cc] = (v[cc] + v[d]) & MASK64
+        v[b] = _rotr64(v[b] ^ v[cc], 11)
+
+    for r in range(16):
+        s = BLAKE512_SIGMA[r % 10]
+        g(0, 4, 8, 12, s[0], s[1])
+        g(1, 5, 9, 13, s[2], s[3])
+        g(2, 6, 10, 14, s[4], s[5])
+        g(3, 7, 11, 15, s[6], s[7])
+        g(0, 5, 10, 15, s[8], s[9])
+        g(1, 6, 11, 12, s[10], s[11])
+        g(2, 7, 8, 13, s[12], s[13])
+        g(3, 4, 9, 14, s[14], s[15])
+    return [h[i] ^ v[i] ^ v[i + 8] for i in range(8)]
+
+
+def blake512(data):
+    # BLAKE-512 (the SHA-3 finalist, not BLAKE2b), unsalted, as used by the
+    # blake-hash package
+    bits = len(data) * 8
+    padded = bytearray(data) + b"\x80"
+    padded += b"\0" * (-(len(padded) + 16) % 128)
+    padded[-1] |= 0x01
+    padded += bits.to_bytes(16, "big")
+
+    h = list(BLAKE512_IV)
+    for i in range(0, len(padded), 128):
+        # Counter of message bits up to this block, 0 for padding-only blocks
+        t = min(bits, (i + 128) * 8) if i * 8 < bits else 0
+        h = _blake512_compress(h, padded[i:i + 128], t)
+    return b"".join(x.to_bytes(8, "big") for x in h)
+
+
+def point_add(p1, p2):
+    (x1, y1), (x2, y2) = p1, p2
+    k = D * x1 * x2 * y1 * y2 % P
+    x3 = (x1 * y2 + y1 * x2) * pow(1 + k, -1, P) % P
+    y3 = (y1 * y2 - A * x1 * x2) * pow(1 - k, -1, P) % P
+    return x3, y3
+
+
+def mul_point_escalar(base, e):
+    # babyJub.mulPointEscalar, double-and-add
+    result, exp = (0, 1), base
+    while e:
+        if e & 1:
+            result = point_add(result, exp)
+        exp = point_add(exp, exp)
+        e >>= 1
+    return result
+
+
+def format_private_key(private_key):
+    # formatPrivKeyForBabyJub: BLAKE-512 of the key's big-endian bytes
+    # (maci's bigInt2Buffer, hex zero-padded to whole bytes), pruned as in
+    # circomlib eddsa, read little-endian and shifted right by 3
+    digits = format(int(private_key), "x")
+    digest = bytearray(blake512(bytes.fromhex("0" * (len(digits) % 2) + digits))[:32])
+    digest[0] &= 0xF8
+    digest[31] &= 0x7F
+    digest[31] |= 0x40
+    return int.from_bytes(digest, "little") >> 3
+
+
+def public_key(private_key):
+    return mul_point_escalar(BASE8, format_private_key(private_key))
+
+
+def shared_key(private_key, other_public_key):
+    # Keypair.genEcdhSharedKey: x coordinate of the shared point
+    x, y = (int(v) for v in other_public_key)
+    return mul_point_escalar((x, y), format_private_key(private_key))[0]
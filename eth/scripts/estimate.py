@@ -0,0 +1,192 @@
+# Analytical size and cost model of circuits/lr quant_gemm_mse_enc(m, p, n):
+# constraint count, witness size, proving key size and groth16 proving time,
+# without compiling. Template costs are counted from the circom sources;
+# the scale factors can be fitted to benchmark.py results (--mode fit).
+import json
+import math
+import os
+
+ETH_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CALIBRATION = os.path.join(ETH_DIR, "artifacts", "benchmark", "estimate.json")
+
+# Powers of tau the builder is set up with (powersOfTau28_hez_final_18.ptau)
+PTAU_POWER = 18
+MIMC_ROUNDS = 91
+# Scalars hashed after X_q and Yt_q (section totals 8 + 5 + 4)
+HASH_SCALARS = 17
+
+# Non-linear constraints per template, as counted from the circom sources
+# and circomlib 0.2.x
+NUM2BITS = lambda bits: bits + 1
+LESS_THAN = lambda bits: NUM2BITS(bits + 1)
+# Sign: CompConstant over 127 bit pairs plus its Num2Bits(135)
+SIGN = 127 + NUM2BITS(135)
+IS_NEGATIVE = NUM2BITS(254) + SIGN
+# RangeProof(128, _): two LessThan(128)
+RANGE_PROOF = 2 * LESS_THAN(128)
+# abs_dividend, dividend === divisor * quotient + remainder, three range
+# proofs and the remainder bound
+MODULO = lambda divisor_bits: IS_NEGATIVE + 2 + 3 * RANGE_PROOF + LESS_THAN(divisor_bits)
+# Four multiplications per round (t2, t4, t6, t7)
+MIMC7 = 4 * MIMC_ROUNDS
+# MultiMiMC7(1) and the MiMC7 pad
+ENCRYPT = 2 * MIMC7
+# Num2Bits(253) and EscalarMulAny(253), the latter approximate
+ECDH = NUM2BITS(253) + 2300
+
+# groth16 .zkey bytes per wire (A, B1, C in G1, B2 in G2), per domain point
+# (H in G1) and per non-zero A/B coefficient (u32 matrix, constraint and
+# signal ids, 32 byte value)
+ZKEY_WIRE_BYTES = 64 + 64 + 128 + 64
+ZKEY_DOMAIN_BYTES = 64
+ZKEY_COEFF_BYTES = 44
+# .wtns: 32 bytes per wire plus the header and section table
+WTNS_HEADER_BYTES = 76
+
+# Defaults until fitted: nothing scaled, and snarkjs proving time per
+# domain point on a laptop-class CPU
+DEFAULT_FIT = dict(
+    constraint_scale=1.0,
+    wire_scale=1.0,
+    coeffs_per_constraint=3.0,
+    seconds_per_point=4e-5,
+    seconds_offset=1.0,
+)
+
+
+def constraint_breakdown(m, p, n, divisor_bits=64):
+    # Non-linear constraints of every part of quant_gemm_mse_enc(m, p, n)
+    modulo = MODULO(divisor_bits)
+    return dict(
+        # MultiMiMC7(m*p + m*n + 17, 91) over X_q, Yt_q and the scalars
+        hash=MIMC7 * (m * p + m * n + HASH_SCALARS),
+        # mult0/mult1/mult2 chains, mult3 and the rescaling Modulo per output,
+        # the bias Modulo per column and m2
+        gemm=m * n * (3 * p + 1 + modulo) + n * (1 + modulo) + 1,
+        # Y_q_mul, Yt_q_mul and two Modulo per element
+        error=m * n * (2 + 2 * modulo),
+        # S[1], S[2] and one Modulo per element, then finaldiv
+        mse=m * n * (2 + modulo) + modulo,
+        ecdh=ECDH,
+        encrypt=ENCRYPT * (p * n + n),
+        compare=LESS_THAN(64),
+    )
+
+
+def public_inputs(m, p, n):
+    # out, hash_input, X_q, W_q_enc, b_q_enc, public_key, Yt_q and the scalars
+    return 2 + m * p + 2 * p * n + 2 * n + 2 + m * n + HASH_SCALARS
+
+
+def estimate(m, p, n, fit=None, ptau_power=PTAU_POWER):
+    # Predicted sizes and proving time of quant_gemm_mse_enc(m, p, n)
+    fit = dict(DEFAULT_FIT, **(fit or {}))
+    breakdown = constraint_breakdown(m, p, n)
+    constraints = int(sum(breakdown.values()) * fit["constraint_scale"])
+    # Every non-linear constraint introduces about one wire; inputs add theirs
+    wires = int(constraints * fit["wire_scale"]) + public_inputs(m, p, n) + p * n + n + 1
+    power = max(1, math.ceil(math.log2(constraints + public_inputs(m, p, n) + 1)))
+    domain = 2 ** power
+    return dict(
+        m=m, p=p, n=n,
+        constraints=constraints,
+        breakdown=breakdown,
+        wires=wires,
+        public_inputs=public_inputs(m, p, n),
+        power=power,
+        fits=power <= ptau_power,
+        wtns_bytes=WTNS_HEADER_BYTES + 32 * wires,
+        zkey_bytes=int(ZKEY_WIRE_BYTES * wires + ZKEY_DOMAIN_BYTES * domain
+                       + ZKEY_COEFF_BYTES * fit["coeffs_per_constraint"] * constraints),
+        prove_seconds=fit["seconds_offset"] + fit["seconds_per_point"] * domain,
+    )
+
+
+def largest_m(p, n, fit=None, ptau_power=PTAU_POWER):
+    # Largest number of rows whose circuit still fits the ptau. Constraints
+    # grow linearly in m, so solve from two points and step to the edge
+    a, b = (estimate(m, p, n, fit)["constraints"] for m in (0, 1))
+    budget = 2 ** ptau_power - 1
+    m = max(0, (budget - a) // max(b - a, 1))
+    while m > 0 and not estimate(m, p, n, fit, ptau_power)["fits"]:
+        m -= 1
+    while estimate(m + 1, p, n, fit, ptau_power)["fits"]:
+        m += 1
+    return m
+
+
+def fit_benchmarks(results, out=DEFAULT_CALIBRATION):
+    # Scale factors from a benchmark.py report: measured over predicted
+    # constraints (r1cs header), wires over constraints and proving seconds
+    # over domain size, by least squares through the default offset
+    report = json.load(open(results, "rb"))
+    fit = dict(DEFAULT_FIT)
+
+    rows = [r for r in report["results"] if r.get("stage") == "groth16" and "constraints" in r]
+    if rows:
+        ratios = [r["constraints"] / sum(constraint_breakdown(r["m"], r["p"], r["n"]).values()) for r in rows]
+        fit["constraint_scale"] = sorted(ratios)[len(ratios) // 2]
+        fit["wire_scale"] = sorted(r["wires"] / r["constraints"] for r in rows)[len(rows) // 2]
+
+        points = [(2 ** math.ceil(math.log2(r["constraints"] + r.get("public_inputs", 0) + 1)), r["seconds"])
+                  for r in rows if "seconds" in r]
+        if points:
+            x = [d for d, _ in points]
+            y = [s - fit["seconds_offset"] for _, s in points]
+            fit["seconds_per_point"] = max(sum(a * b for a, b in zip(x, y)) / sum(a * a for a in x), 0.0)
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(dict(fit, source=results, samples=len(rows)), f, indent=2)
+    return fit
+
+
+def load_fit(path=DEFAULT_CALIBRATION):
+    if path is None or not os.path.exists(path):
+        return dict(DEFAULT_FIT)
+    fit = json.load(open(path, "rb"))
+    return {k: fit[k] for k in DEFAULT_FIT if k in fit}
+
+
+def report(rows):
+    print(f"{'m':>8} {'p':>4} {'n':>4} {'constraints':>12} {'power':>5} {'fits':>5} "
+          f"{'wtns MiB':>9} {'zkey MiB':>9} {'prove s':>8}")
+    for r in rows:
+        print(f"{r['m']:>8} {r['p']:>4} {r['n']:>4} {r['constraints']:>12} {r['power']:>5} "
+              f"{'yes' if r['fits'] else 'no':>5} {r['wtns_bytes'] / 2 ** 20:>9.1f} "
+              f"{r['zkey_bytes'] / 2 ** 20:>9.1f} {r['prove_seconds']:>8.1f}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", default="estimate", choices=["estimate", "fit"])
+    parser.add_argument("--settings", default="settings.json")
+    parser.add_argument("--shapes", nargs="+")
+    parser.add_argument("--ptau-power", type=int, default=PTAU_POWER)
+    parser.add_argument("--calibration", default=DEFAULT_CALIBRATION)
+    parser.add_argument("--results", default="./artifacts/benchmark/results.json")
+    parser.add_argument("--out")
+    args = parser.parse_args()
+
+    if args.mode == "fit":
+        print(json.dumps(fit_benchmarks(args.results, args.calibration), indent=2))
+    elif args.mode == "estimate":
+        fit = load_fit(args.calibration)
+        if args.shapes:
+            shapes = [tuple(int(v) for v in shape.split(",")) for shape in args.shapes]
+        else:
+            s = json.load(open(args.settings, "rb"))
+            shapes = [(s["m"], s["p"], s["n"])]
+        rows = [estimate(m, p, n, fit, args.ptau_power) for m, p, n in shapes]
+        for r in rows:
+            r["largest_m"] = largest_m(r["p"], r["n"], fit, args.ptau_power)
+        report(rows)
+        for p, n in dict.fromkeys((r["p"], r["n"]) for r in rows):
+            m = largest_m(p, n, fit, args.ptau_power)
+            print(f"> p={p} n={n}: largest dataset within 2^{args.ptau_power} is m={m}")
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(rows, f, indent=2)
+    else:
+        assert False
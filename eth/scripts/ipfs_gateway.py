@@ -0,0 +1,83 @@
+# Local stand-in for the IPFS HTTP API `cat` endpoint that download_dataset
+# reads, for testing without Infura: POST /api/v0/cat?arg=<cid>/<name> streams
+# <root>/<cid>/<name> base64 encoded, the way add_bounty uploads .npy files.
+#   python3 scripts/ipfs_gateway.py --mode add --dataset dataset   (prints a cid)
+#   python3 scripts/ipfs_gateway.py --mode serve --port 5001
+#   IPFS_API=http://127.0.0.1:5001 npx hardhat download_dataset ...
+import base64
+import hashlib
+import os
+import shutil
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT = "./artifacts/ipfs_gateway"
+# A multiple of 3 so every chunk encodes without padding
+CHUNK_BYTES = 3 * 2 ** 18
+
+
+def add(dataset, root=ROOT):
+    # Copies dataset/X.npy, Y.npy under a content-derived id, like an upload
+    h = hashlib.sha256()
+    for name in ("X.npy", "Y.npy"):
+        with open(f"{dataset}/{name}", "rb") as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b""):
+                h.update(chunk)
+    cid = "local" + h.hexdigest()[:40]
+    os.makedirs(f"{root}/{cid}", exist_ok=True)
+    for name in ("X.npy", "Y.npy"):
+        shutil.copyfile(f"{dataset}/{name}", f"{root}/{cid}/{name}")
+    return cid
+
+
+def handler(root):
+    class Handler(BaseHTTPRequestHandler):
+        # Chunked responses need HTTP/1.1
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            url = urlparse(self.path)
+            arg = parse_qs(url.query).get("arg", [""])[0]
+            path = os.path.normpath(os.path.join(root, arg))
+            if url.path != "/api/v0/cat" or not path.startswith(os.path.abspath(root) + os.sep) \
+                    or not os.path.isfile(path):
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+                    data = base64.b64encode(chunk)
+                    self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(root=ROOT, host="127.0.0.1", port=5001):
+    root = os.path.abspath(root)
+    server = ThreadingHTTPServer((host, port), handler(root))
+    print(f"> Serving {root} at http://{host}:{port}/api/v0/cat")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", default="serve", choices=["serve", "add"])
+    parser.add_argument("--root", default=ROOT)
+    parser.add_argument("--dataset", default="dataset")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    args = parser.parse_args()
+
+    if args.mode == "add":
+        print(add(args.dataset, args.root))
+    else:
+        serve(os.path.abspath(args.root), args.host, args.port)
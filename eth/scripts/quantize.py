@@ -1,34 +1,369 @@
 # gemm.py
+import contextlib
+import hashlib
 import json
+import multiprocessing
+import os
+import shutil
+import struct
 import sys
+import tempfile
+import time
+import types
+import warnings
 from fractions import Fraction
 
 import numpy as np
-import json
+
+try:
+    from . import state
+    from .mimc7 import mimc7_multi_hash
+except ImportError:
+    import state
+    from mimc7 import mimc7_multi_hash
 
 P = 21888242871839275222246405745257275088548364400416034343698204186575808495617
 
 ALPHA_Q = 4
 BETA_Q = 2 ** 16
 LIMIT_DENOM = 2 ** 32
+VERIFY_SAMPLE_ROWS = 256
+CACHE_ENTRIES = 8
+CACHE_BLOCK_ROWS = 2 ** 16
+PARALLEL_BLOCK_ROWS = 2 ** 14
+FUSED_BLOCK_ROWS = 2 ** 12
+
+INT64_MAX = 2 ** 63 - 1
+# Largest |value| accepted by the MultiRangeProof inside the circom Modulo
+CIRCUIT_MAX_ABS = 147946756881789309620446562439722434560
+# Largest integer JSON.parse reads back exactly
+JS_MAX_SAFE_INTEGER = 2 ** 53 - 1
+
+# Functions listed in a trace with the cprofile tool (see profiling)
+PROFILE_TOP = 25
+
+# Datasets fetched by download_dataset, one directory per IPFS CID holding
+# the decoded X.npy, Y.npy and a manifest of their sizes and sha256
+IPFS_CACHE = os.environ.get(
+    "IPFS_CACHE", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "artifacts", "ipfs")
+)
+IPFS_FILES = ("X.npy", "Y.npy")
+
+# Versioned binary container (see dump_container); tensor blocks start on
+# CONTAINER_ALIGN byte boundaries so they can be memory-mapped directly
+CONTAINER_MAGIC = b"ZKMLQNT\0"
+CONTAINER_VERSION = 1
+CONTAINER_ALIGN = 64
+CONTAINER_TENSORS = ("X_q", "Yt_q", "W_q", "b_q")
+
+# Scalars hashed after X_q and Yt_q into hash_input, as in quant_gemm_mse_enc
+HASH_SCALARS = (
+    "z_X", "z_W", "z_b", "z_Y",
+    "sbsY_numerator", "sbsY_denominator", "sXsWsY_numerator", "sXsWsY_denominator",
+    "sYsR_numerator", "sYsR_denominator", "sYtsR_numerator", "sYtsR_denominator", "constant",
+    "z_R", "z_Sq", "sR2sSq_numerator", "sR2sSq_denominator",
+)
+
+
+def field_elements(x):
+    # Vectorized field encoding of quantized values, negatives map to P + x
+    x = np.asarray(x)
+    assert x.dtype.kind in "iuO", "cannot be float"
+    neg = x < 0
+    if neg.any():
+        warnings.warn("Results are negative, circom may not be happy")
+        x = x.astype(object)
+        x[neg] += P
+    return x
+
+
+def field_bytes(x):
+    # 32 byte little-endian field elements, the layout of .wtns sections
+    x = field_elements(x).ravel()
+    if x.dtype == object:
+        return b"".join(int(v).to_bytes(32, "little") for v in x)
+    out = np.zeros((x.size, 32), dtype=np.uint8)
+    out[:, :8] = x.astype("<u8").view(np.uint8).reshape(-1, 8)
+    return out.tobytes()
+
 
 def proc(l):
-    import warnings
+    return field_elements(l).tolist()
+
+
+def json_safe(value):
+    # Integers JavaScript cannot hold exactly are written as decimal strings
+    if isinstance(value, list):
+        return [json_safe(v) for v in value]
+    if isinstance(value, int) and abs(value) > JS_MAX_SAFE_INTEGER:
+        return str(value)
+    return value
+
+
+def dataset_commitment(X_q_blocks, Yt_q_blocks, scalars):
+    # hash_input: MultiMiMC7 over X_q, Yt_q and HASH_SCALARS. The chain is
+    # fed block by block, so shapes come from the data rather than settings
+    r = 0
+    for blocks in (X_q_blocks, Yt_q_blocks):
+        for block in blocks:
+            r = mimc7_multi_hash(field_elements(block).ravel().tolist(), r)
+    return mimc7_multi_hash(proc([scalars[k] for k in HASH_SCALARS]), r)
+
+
+def dump_stream(data_all, f, indent=2):
+    # Same bytes as json.dump(data_all, f, indent=indent), except that
+    # generator values are written block by block as they are produced
+    def dumps(value, depth):
+        if isinstance(value, np.ndarray):
+            if value.dtype == object or (value.size and np.abs(value).max() > JS_MAX_SAFE_INTEGER):
+                value = json_safe(value.tolist())
+            else:
+                value = value.tolist()
+        value = json_safe(value) if isinstance(value, int) else value
+        if indent is None:
+            return json.dumps(value, separators=(",", ":"))
+        return json.dumps(value, indent=indent).replace("\n", "\n" + " " * depth)
+
+    f.write("{")
+    for i, (key, value) in enumerate(data_all.items()):
+        f.write(("," if i else "") + ("" if indent is None else "\n  ") + json.dumps(key) + ":")
+        f.write("" if indent is None else " ")
+        if not isinstance(value, types.GeneratorType):
+            f.write(dumps(value, 2))
+            continue
+        empty = True
+        for block in value:
+            if indent is None:
+                if len(block):
+                    f.write(("[" if empty else ",") + dumps(block, 0)[1:-1])
+                    empty = False
+                continue
+            for row in block:
+                f.write(("[" if empty else ",") + "\n    " + dumps(row, 4))
+                empty = False
+        f.write("[]" if empty else ("]" if indent is None else "\n  ]"))
+    f.write("}" if indent is None else "\n}")
+
+
+def dump_binary(data_all, f):
+    # Raw field elements in key order; returns the shape of every entry
+    shapes = {}
+    for key, value in data_all.items():
+        if not isinstance(value, types.GeneratorType):
+            value = [np.asarray(value)]
+        shape = None
+        for block in value:
+            block = np.asarray(block)
+            f.write(field_bytes(block))
+            if shape is None:
+                shape = list(block.shape)
+            elif block.ndim:
+                shape[0] += block.shape[0]
+        shapes[key] = shape
+    return shapes
+
+
+def container_int64(block):
+    # Field elements back to signed int64, P + x decoding to x
+    block = np.asarray(block)
+    if block.dtype == object:
+        block = block.copy()
+        block[block > P // 2] -= P
+        assert all(abs(int(v)) <= INT64_MAX for v in block.ravel()), "tensor does not fit int64"
+    return block.astype("<i8")
+
+
+def dump_container(data_all, f):
+    # Versioned container: a 32 byte preamble (magic, u32 version, u32
+    # reserved, u64 header offset, u64 header length), the tensor blocks as
+    # contiguous C-order little-endian int64 at CONTAINER_ALIGN offsets, then
+    # the JSON header with shapes, offsets, zero points and scale fractions.
+    # The header goes last so generator values can be streamed block by block
+    f.write(b"\0" * CONTAINER_ALIGN)
+    tensors, scalars = {}, {}
+    for key, value in data_all.items():
+        if key not in CONTAINER_TENSORS:
+            scalars[key] = value
+            continue
+        if not isinstance(value, types.GeneratorType):
+            value = [value]
+        offset, shape = f.tell(), None
+        for block in value:
+            block = container_int64(block)
+            f.write(block.tobytes())
+            if shape is None:
+                shape = list(block.shape)
+            elif block.ndim:
+                shape[0] += block.shape[0]
+        tensors[key] = dict(dtype="<i8", shape=shape, offset=offset)
+        f.write(b"\0" * (-f.tell() % CONTAINER_ALIGN))
+
+    names = [k[:-len("_numerator")] for k in scalars if k.endswith("_numerator")]
+    header = dict(
+        version=CONTAINER_VERSION,
+        keys=list(data_all),
+        tensors=tensors,
+        zero_points={k: scalars.pop(k) for k in list(scalars) if k.startswith("z_")},
+        scale_fractions={k: [scalars.pop(f"{k}_numerator"), scalars.pop(f"{k}_denominator")] for k in names},
+        scalars=scalars,
+    )
+    header = json.dumps(json_safe_tree(header), separators=(",", ":")).encode()
+    offset = f.tell()
+    f.write(header)
+    f.seek(0)
+    f.write(struct.pack("<8sIIQQ", CONTAINER_MAGIC, CONTAINER_VERSION, 0, offset, len(header)))
+    return tensors
+
+
+def json_safe_tree(value):
+    # json_safe through dicts as well as lists
+    if isinstance(value, dict):
+        return {k: json_safe_tree(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [json_safe_tree(v) for v in value]
+    return json_safe(value)
+
+
+def load_container(path, mmap=True):
+    # Witness inputs from a dump_container file, in the original key order.
+    # Tensors are read-only np.memmap views (or arrays with mmap=False) of the
+    # signed int64 values; field_elements gives the circuit encoding
+    with open(path, "rb") as f:
+        magic, version, _, offset, length = struct.unpack("<8sIIQQ", f.read(32))
+        assert magic == CONTAINER_MAGIC, f"{path} is not a quantized container"
+        assert version == CONTAINER_VERSION, f"unsupported container version {version}"
+        f.seek(offset)
+        header = json.loads(f.read(length))
+
+    values = dict(header["scalars"], **header["zero_points"])
+    for name, (numerator, denominator) in header["scale_fractions"].items():
+        values[f"{name}_numerator"], values[f"{name}_denominator"] = numerator, denominator
+    for name, t in header["tensors"].items():
+        if mmap and np.prod(t["shape"]):
+            values[name] = np.memmap(path, dtype=t["dtype"], mode="r", offset=t["offset"], shape=tuple(t["shape"]))
+        else:
+            with open(path, "rb") as f:
+                f.seek(t["offset"])
+                values[name] = np.fromfile(f, dtype=t["dtype"], count=int(np.prod(t["shape"]))).reshape(t["shape"])
+    return {k: int(v) if isinstance(v, str) else v for k, v in ((k, values[k]) for k in header["keys"])}
+
+
+def write_inputs(data_all, path, fmt="json"):
+    # Witness inputs as pretty JSON (default), compact JSON, raw binary with
+    # a <path>.shapes.json sidecar giving the shape of every entry, or a
+    # memory-mappable <path>.zkq container (see dump_container); fmt=None
+    # keeps them in memory only. Returns the file written, or None
+    assert fmt in (None, "json", "compact", "binary", "container"), fmt
+    if fmt is None:
+        return None
+    if fmt == "container":
+        with open(f"{path}.zkq", "wb") as f:
+            dump_container(data_all, f)
+        return f"{path}.zkq"
+    if fmt == "binary":
+        with open(f"{path}.bin", "wb") as f:
+            shapes = dump_binary(data_all, f)
+        with open(f"{path}.shapes.json", "w") as f:
+            json.dump(shapes, f)
+        return f"{path}.bin"
+    with open(f"{path}.json", "w") as f:
+        dump_stream(data_all, f, indent=2 if fmt == "json" else None)
+    return f"{path}.json"
+
+
+def current_rss():
+    # Resident set size of this process in bytes
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def profile_mark(stage):
+    # Ends the current stage of an active trace: the time, RSS change and
+    # traced allocation peak since the previous mark go to `stage`. Stages
+    # marked repeatedly (row blocks) accumulate. A no-op when not profiling
+    if state.profile is None:
+        return
+    now, rss = time.perf_counter(), current_rss()
+    record = state.profile["stages"].setdefault(stage, dict(calls=0, seconds=0.0, rss_delta=0))
+    record["calls"] += 1
+    record["seconds"] += now - state.profile["last"]
+    record["rss_delta"] += rss - state.profile["rss"]
+    record["rss"] = rss
+    if "tracemalloc" in state.profile["tools"]:
+        import tracemalloc
+        peak = tracemalloc.get_traced_memory()[1]
+        record["traced_peak"] = max(record.get("traced_peak", 0), peak)
+        tracemalloc.reset_peak()
+    state.profile["last"], state.profile["rss"] = now, rss
+
+
+def profiling(path=None, tools=None, **meta):
+    # Context manager tracing everything run inside it into the JSON file at
+    # path (default state.PROFILE); nothing is traced when no path is set. With
+    # "cprofile" in tools the cProfile stats go to <path>.prof and the top
+    # PROFILE_TOP functions into the trace
+    path = path or state.PROFILE
+    tools = state.PROFILE_TOOLS if tools is None else tools
+    assert set(tools) <= {"cprofile", "tracemalloc"}, tools
+
+    @contextlib.contextmanager
+    def trace():
+        if path is None or state.profile is not None:
+            yield
+            return
+
+        if "tracemalloc" in tools:
+            import tracemalloc
+            tracemalloc.start()
+        if "cprofile" in tools:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        started = time.time()
+        state.profile = dict(tools=tools, stages={}, last=time.perf_counter(), rss=current_rss())
+        start = state.profile["last"]
+        try:
+            yield
+        finally:
+            profile_mark("other")
+            stages, state.profile = state.profile["stages"], None
+            report = dict(
+                meta,
+                pid=os.getpid(),
+                argv=sys.argv,
+                started=started,
+                seconds=time.perf_counter() - start,
+                peak_rss=peak_rss(),
+                stages=[dict(stage=k, **v) for k, v in stages.items()],
+            )
+            if "tracemalloc" in tools:
+                tracemalloc.stop()
+            if "cprofile" in tools:
+                import pstats
+                profiler.disable()
+                profiler.dump_stats(f"{path}.prof")
+                stats = pstats.Stats(profiler).stats
+                top = sorted(stats.items(), key=lambda kv: kv[1][3], reverse=True)[:PROFILE_TOP]
+                report["cprofile"] = dict(stats=f"{path}.prof", top=[
+                    dict(function=f"{f}:{line}({name})", calls=nc, tottime=tt, cumtime=ct)
+                    for (f, line, name), (_, nc, tt, ct, _) in top
+                ])
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+    return trace()
 
-    def proc_int(x):
-        if x < 0:
-            warnings.warn("Results are negative, circom may not be happy")
-            return P-x
-        return int(x)
 
-    if type(l) is int:
-        return proc_int(l)
-    elif type(l) is float:
-        assert False, "cannot be float"
-    elif type(l[0]) is int:
-        return [proc_int(x) for x in l]
+def peak_rss():
+    # High-water mark of this process in bytes (ru_maxrss is KiB on Linux)
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
 
-    return [[proc_int(x) for x in j] for j in l]
 
 def quantization(x, s, z, alpha_q, beta_q):
 
@@ -48,12 +383,33 @@ def quantization_arb(x, s, z):
 
 def dequantization(x_q, s, z):
 
-    x = s * (x_q - z)
+    x = s * (np.asarray(x_q) - z)
     x = x.astype(np.float128)
 
     return x
 
 
+def row_blocks(x, block_rows):
+    # In-memory copies of consecutive row blocks of a (memory-mapped) matrix
+    for i in range(0, x.shape[0], block_rows):
+        yield np.asarray(x[i:i + block_rows])
+
+
+def quantization_blocks(x, s, z, block_rows):
+    # Quantize a (memory-mapped) matrix a block of rows at a time
+    for block in row_blocks(x, block_rows):
+        yield quantization_arb(x=block, s=s, z=z)
+
+
+def quantized_rows(x, s, z, block_rows=None, x_q=None):
+    # quantization_arb(x), or row blocks of it; x_q is a cached quantization
+    if block_rows is None:
+        return quantization_arb(x=x, s=s, z=z) if x_q is None else np.asarray(x_q)
+    if x_q is None:
+        return quantization_blocks(x, s, z, block_rows)
+    return row_blocks(x_q, block_rows)
+
+
 def generate_quantization_constants(alpha, beta, alpha_q, beta_q):
 
     # Affine quantization mapping
@@ -75,14 +431,219 @@ def generate_quantization_arb_constants(alpha, beta):
     return s, z
 
 
+def quantization_bound(m, p, n,
+                       s_X, z_X,
+                       s_W, z_W,
+                       s_b, z_b,
+                       s_Y, z_Y,
+                       s_Yt, z_Yt,
+                       s_R, z_R,
+                       s_Sq, z_Sq):
+    # Worst-case magnitude of every intermediate in the gemm -> error -> mse
+    # pipeline, for quantized inputs anywhere in [ALPHA_Q, BETA_Q]
+    sbsY = Fraction(s_b / s_Y).limit_denominator(LIMIT_DENOM)
+    sXsWsY = Fraction(s_X * s_W / s_Y).limit_denominator(LIMIT_DENOM)
+    sYsR = Fraction(s_Y / s_R).limit_denominator(LIMIT_DENOM)
+    sYtsR = Fraction(s_Yt / s_R).limit_denominator(LIMIT_DENOM)
+    sR2sSq = Fraction((s_R ** 2) / s_Sq).limit_denominator(LIMIT_DENOM)
+    constant = z_R - int(z_Y * s_Y / s_R) + int(z_Yt * s_Yt / s_R)
+
+    q = BETA_Q
+    acc = p * (q + abs(z_X)) * (q + abs(z_W))
+    bias = q + abs(z_b)
+    Y = (
+        acc * sXsWsY.numerator // sXsWsY.denominator
+        + bias * sbsY.numerator // sbsY.denominator
+        + abs(z_Y)
+        + 2
+    )
+    R = (
+        abs(constant)
+        + Y * sYsR.numerator // sYsR.denominator
+        + q * sYtsR.numerator // sYtsR.denominator
+        + 2
+    )
+    S = (R + abs(z_R)) ** 2 * sR2sSq.numerator // sR2sSq.denominator + abs(z_Sq) + 1
+
+    return max(
+        acc * sXsWsY.numerator,
+        bias * sbsY.numerator,
+        Y * sYsR.numerator,
+        q * sYtsR.numerator,
+        (R + abs(z_R)) ** 2 * sR2sSq.numerator,
+        m * n * R,
+        m * n * S,
+    )
+
+
+def bound_for(c, m, p, n):
+    # quantization_bound of an (m, p, n) run with the constants c
+    return quantization_bound(m, p, n,
+                              c["s_X"], c["z_X"], c["s_W"], c["z_W"], c["s_b"], c["z_b"],
+                              c["s_Y"], c["z_Y"], c["s_Yt"], c["z_Yt"], c["s_R"], c["z_R"],
+                              c["s_Sq"], c["z_Sq"])
+
+
+def quantization_dtype(bound):
+    # int64 when every intermediate provably fits, exact Python ints otherwise
+    if bound > CIRCUIT_MAX_ABS:
+        warnings.warn("Intermediates exceed the circuit range proof, circom may not be happy")
+    if bound > INT64_MAX:
+        return object
+    return np.int64
+
+
+def quantization_constants(settings):
+    # Every scale, zero point and limited ratio the circuit consumes
+    c = {}
+    for t, a in (("X", "X"), ("W", "W"), ("b", "b"), ("Y", "Y"), ("Yt", "Yt"), ("R", "R"), ("Sq", "S")):
+        c[f"s_{t}"], c[f"z_{t}"] = generate_quantization_arb_constants(
+            alpha=settings[f"alpha_{a}"], beta=settings[f"beta_{a}"]
+        )
+
+    ratios = dict(
+        sbsY=c["s_b"] / c["s_Y"],
+        sXsWsY=c["s_X"] * c["s_W"] / c["s_Y"],
+        sYsR=c["s_Y"] / c["s_R"],
+        sYtsR=c["s_Yt"] / c["s_R"],
+        sR2sSq=(c["s_R"] ** 2) / c["s_Sq"],
+    )
+    for name, ratio in ratios.items():
+        f = Fraction(ratio).limit_denominator(LIMIT_DENOM)
+        c[f"{name}_numerator"], c[f"{name}_denominator"] = f.numerator, f.denominator
+
+    c["constant"] = (
+        c["z_R"] - int(c["z_Y"] * c["s_Y"] / c["s_R"]) + int(c["z_Yt"] * c["s_Yt"] / c["s_R"])
+    )
+    return c
+
+
+def quantization_layer_constants(s_X, z_X, settings):
+    # GEMM constants of one affine layer fed by inputs at scale s_X, z_X,
+    # with its W, b and Y ranges taken from settings
+    c = dict(s_X=s_X, z_X=z_X)
+    for t in ("W", "b", "Y"):
+        c[f"s_{t}"], c[f"z_{t}"] = generate_quantization_arb_constants(
+            alpha=settings[f"alpha_{t}"], beta=settings[f"beta_{t}"]
+        )
+    for name, ratio in (("sbsY", c["s_b"] / c["s_Y"]), ("sXsWsY", s_X * c["s_W"] / c["s_Y"])):
+        f = Fraction(ratio).limit_denominator(LIMIT_DENOM)
+        c[f"{name}_numerator"], c[f"{name}_denominator"] = f.numerator, f.denominator
+    return c
+
+
+def dataset_key(setting, dataset):
+    # Content hash of the settings file and the dataset it quantizes,
+    # remembered per file stat so a long-lived process hashes each once
+    paths = (setting, f"{dataset}/X.npy", f"{dataset}/Y.npy")
+    stat = tuple((os.path.abspath(p), os.stat(p).st_mtime_ns, os.stat(p).st_size) for p in paths)
+    if stat not in state.dataset_keys:
+        state.dataset_keys[stat] = dataset_hash(paths)
+    return state.dataset_keys[stat]
+
+
+def dataset_hash(paths):
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_evict(cache_dir, entries=CACHE_ENTRIES):
+    # Drop least recently used entries beyond the first `entries`
+    paths = [
+        os.path.join(cache_dir, d) for d in os.listdir(cache_dir) if not d.endswith(".tmp")
+    ]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[entries:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def cache_dataset(cache_dir, setting, dataset):
+    # Constants and quantized X/Yt for (settings, dataset), computed once and
+    # memory-mapped from cache_dir on every later call
+    path = os.path.join(cache_dir, dataset_key(setting, dataset))
+    if not os.path.isdir(path):
+        c = quantization_constants(json.load(open(setting, "rb")))
+        tmp = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(tmp, exist_ok=True)
+        for name, t in (("X_q", "X"), ("Yt_q", "Yt")):
+            x = np.load(f"{dataset}/{'X' if t == 'X' else 'Y'}.npy", mmap_mode="r")
+            out = np.lib.format.open_memmap(f"{tmp}/{name}.npy", mode="w+", dtype=np.int64, shape=x.shape)
+            for i, block in enumerate(quantization_blocks(x, c[f"s_{t}"], c[f"z_{t}"], CACHE_BLOCK_ROWS)):
+                out[i * CACHE_BLOCK_ROWS:i * CACHE_BLOCK_ROWS + block.shape[0]] = block
+            out.flush()
+            del out
+        c["hash_input"] = dataset_commitment(
+            row_blocks(np.load(f"{tmp}/X_q.npy", mmap_mode="r"), CACHE_BLOCK_ROWS),
+            row_blocks(np.load(f"{tmp}/Yt_q.npy", mmap_mode="r"), CACHE_BLOCK_ROWS),
+            c,
+        )
+        with open(f"{tmp}/constants.json", "w") as f:
+            json.dump(c, f, indent=2)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Another process filled the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+        cache_evict(cache_dir)
+
+    os.utime(path)
+    if path not in state.cache_entries:
+        c = json.load(open(f"{path}/constants.json", "rb"))
+        X_q = np.load(f"{path}/X_q.npy", mmap_mode="r")
+        Yt_q = np.load(f"{path}/Yt_q.npy", mmap_mode="r")
+        if "hash_input" not in c:
+            # Entry written before hash_input was cached
+            c["hash_input"] = dataset_commitment(
+                row_blocks(X_q, CACHE_BLOCK_ROWS), row_blocks(Yt_q, CACHE_BLOCK_ROWS), c
+            )
+            with open(f"{path}/constants.json", "w") as f:
+                json.dump(c, f, indent=2)
+        state.cache_entries[path] = (c, X_q, Yt_q)
+    return state.cache_entries[path]
+
+
+def npy_size(path):
+    # File size implied by an .npy header: header length plus the array bytes
+    with open(path, "rb") as f:
+        if np.lib.format.read_magic(f) == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+        return f.tell() + int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+
+
+def ipfs_dataset_dir(cid, cache_dir=IPFS_CACHE, verify=False):
+    # Cache directory of a fetched dataset, after checking it against its
+    # manifest: file sizes (and the .npy headers) always, sha256 with verify
+    path = os.path.join(cache_dir, cid)
+    manifest_path = os.path.join(path, "manifest.json")
+    assert os.path.exists(manifest_path), f"{cid} is not cached in {cache_dir}, run download_dataset"
+    manifest = json.load(open(manifest_path, "rb"))
+    for name in IPFS_FILES:
+        entry, file = manifest["files"][name], os.path.join(path, name)
+        size = os.path.getsize(file)
+        assert size == entry["size"] == npy_size(file), f"{file}: {size} bytes, expected {entry['size']}"
+        if verify:
+            digest = dataset_hash([file])
+            assert digest == entry["sha256"], f"{file}: sha256 {digest}, expected {entry['sha256']}"
+    return path
+
+
+def ipfs_dataset(cid, cache_dir=IPFS_CACHE, verify=False):
+    # Memory-mapped X and Y of a dataset fetched by CID
+    path = ipfs_dataset_dir(cid, cache_dir, verify)
+    return tuple(np.load(f"{path}/{name}", mmap_mode="r") for name in IPFS_FILES)
+
+
 # This function can be encoded as a circom circuit
-def quantization_error(Y_q, Yt_q, s_R, z_R, s_Y, z_Y, s_Yt, z_Yt):
-    # print(z_Y, z_Yt, z_R)
+def quantization_error(Y_q, Yt_q, s_R, z_R, s_Y, z_Y, s_Yt, z_Yt, dtype=np.int64):
     sYsR = Fraction(s_Y / s_R).limit_denominator(LIMIT_DENOM)
     sYtsR = Fraction(s_Yt / s_R).limit_denominator(LIMIT_DENOM)
 
-    # print(sYsR)
-    # print(sYtsR)
     """
     R_q_true = (
         z_R
@@ -94,15 +655,14 @@ def quantization_error(Y_q, Yt_q, s_R, z_R, s_Y, z_Y, s_Yt, z_Yt):
     """
     R_q = (
         z_R
-        + (Y_q * sYsR.numerator // sYsR.denominator).astype(np.int64)
-        - (Yt_q * sYtsR.numerator // sYtsR.denominator).astype(np.int64)
+        + (Y_q.astype(dtype) * sYsR.numerator // sYsR.denominator)
+        - (Yt_q.astype(dtype) * sYtsR.numerator // sYtsR.denominator)
         - int(z_Y * s_Y / s_R)
         + int(z_Yt * s_Yt / s_R)
     )
     constant = z_R - int(z_Y * s_Y / s_R) + int(z_Yt * s_Yt / s_R)
-    # print(R_q - R_q_true)
     return (
-        R_q.astype(np.int64),
+        R_q.astype(dtype),
         sYsR.numerator,
         sYsR.denominator,
         sYtsR.numerator,
@@ -111,14 +671,11 @@ def quantization_error(Y_q, Yt_q, s_R, z_R, s_Y, z_Y, s_Yt, z_Yt):
     )
 
 
-def quant_error_circuit(Y_q, Yt_q, s_R, z_R, s_Y, z_Y, s_Yt, z_Yt, m, n):
-    # print(z_Y, z_Yt, z_R)
+def quant_error_circuit(Y_q, Yt_q, s_R, z_R, s_Y, z_Y, s_Yt, z_Yt, m, n, dtype=np.int64):
     sYsR = Fraction(s_Y / s_R).limit_denominator(LIMIT_DENOM)
     sYtsR = Fraction(s_Yt / s_R).limit_denominator(LIMIT_DENOM)
 
-    # print(Y_q.shape)
-    # print("mxn")
-    R_q = np.zeros((m, n)).astype(np.int64)
+    R_q = np.zeros((m, n), dtype=dtype)
 
     constant = z_R - int(z_Y * s_Y / s_R) + int(z_Yt * s_Yt / s_R)
 
@@ -126,123 +683,111 @@ def quant_error_circuit(Y_q, Yt_q, s_R, z_R, s_Y, z_Y, s_Yt, z_Yt, m, n):
         for j in range(n):
             R_q[i, j] = (
                 constant
-                + (Y_q[i, j] * sYsR.numerator // sYsR.denominator).astype(np.int64)
-                - (Yt_q[i, j] * sYtsR.numerator // sYtsR.denominator).astype(np.int64)
-            ).astype(np.int64)
-
-    R_q_true = (
-        z_R
-        + (Y_q * sYsR.numerator // sYsR.denominator).astype(np.int64)
-        - (Yt_q * sYtsR.numerator // sYtsR.denominator).astype(np.int64)
-        - int(z_Y * s_Y / s_R)
-        + int(z_Yt * s_Yt / s_R)
-    )
-    #print(R_q - R_q_true)
+                + int(Y_q[i, j]) * sYsR.numerator // sYsR.denominator
+                - int(Yt_q[i, j]) * sYtsR.numerator // sYtsR.denominator
+            )
 
     return R_q
 
 
 # This function can be encoded as a circom circuit
-def quantization_mean_error(Y_q, Yt_q, s_R, z_R, s_Y, z_Y, s_Yt, z_Yt, m):
-    # print(z_Y, z_Yt, z_R)
+def quantization_mean_error(Y_q, Yt_q, s_R, z_R, s_Y, z_Y, s_Yt, z_Yt, m, dtype=np.int64):
     sYsR = Fraction(s_Y / s_R).limit_denominator(LIMIT_DENOM)
     sYtsR = Fraction(s_Yt / s_R).limit_denominator(LIMIT_DENOM)
 
-    # print(sYsR)
-    # print(sYtsR)
     # R_q_true = z_R + (s_Y / s_R * Y_q).astype(np.int64) - (s_Yt / s_R * Yt_q).astype(np.int64) - (z_Y * s_Y / s_R) + (z_Yt * s_Yt / s_R)
     R_q = (
         z_R
-        + (Y_q * sYsR.numerator // sYsR.denominator).astype(np.int64)
-        - (Yt_q * sYtsR.numerator // sYtsR.denominator).astype(np.int64)
+        + (Y_q.astype(dtype) * sYsR.numerator // sYsR.denominator)
+        - (Yt_q.astype(dtype) * sYtsR.numerator // sYtsR.denominator)
         - int(z_Y * s_Y / s_R)
         + int(z_Yt * s_Yt / s_R)
     )
-    # print(R_q - R_q_true)
-    return R_q.astype(np.int64).sum() // m
+    return R_q.astype(dtype).sum() // m
 
 
-# This function can be encoded as a circom circuit
-def quantization_mean_squared_error(R_q, s_R, s_Sq, z_R, z_Sq, m, n):
+def quantization_squared_error_sum(R_q, s_R, s_Sq, z_R, dtype=np.int64):
+    # Partial sum of the floored squared errors, combined by the final division
     sR2sSq = Fraction((s_R ** 2) / s_Sq).limit_denominator(LIMIT_DENOM)
-    # print(sR2sSq)
-    S_true = (z_Sq + (s_R ** 2) / s_Sq * np.square(R_q - z_R)).astype(np.int64)
-    S = (z_Sq + np.square(R_q - z_R) * sR2sSq.numerator // sR2sSq.denominator).astype(
-        np.int64
+    S = (np.square(R_q.astype(dtype) - z_R) * sR2sSq.numerator // sR2sSq.denominator).astype(
+        dtype
     )
 
-    # print(S_true, S)
-    # print("diff mse", abs(S_true - S).T)
-    return S.sum() // (m * n), sR2sSq.numerator, sR2sSq.denominator
+    return S.sum()
+
+
+# This function can be encoded as a circom circuit
+def quantization_mean_squared_error(R_q, s_R, s_Sq, z_R, z_Sq, m, n, dtype=np.int64):
+    sR2sSq = Fraction((s_R ** 2) / s_Sq).limit_denominator(LIMIT_DENOM)
+    S_sum = quantization_squared_error_sum(R_q, s_R, s_Sq, z_R, dtype) + m * n * z_Sq
 
+    return S_sum // (m * n), sR2sSq.numerator, sR2sSq.denominator
 
-def quant_mse(R_q, s_R, s_Sq, z_R, z_Sq, m, n):
+
+def quant_mse(R_q, s_R, s_Sq, z_R, z_Sq, m, n, dtype=np.int64):
     sR2sSq = Fraction((s_R ** 2) / s_Sq).limit_denominator(LIMIT_DENOM)
-    # print(sR2sSq)
 
-    S = np.zeros((m, n)).astype(np.int64)
+    S = np.zeros((m, n), dtype=dtype)
 
     for i in range(m):
         for j in range(n):
             S[i, j] = (
-                (
-                    (R_q[i, j] - z_R)
-                    * (R_q[i, j] - z_R)
-                    * sR2sSq.numerator
-                    // sR2sSq.denominator
-                ).astype(np.int64)
-            ).astype(np.int64)
+                (int(R_q[i, j]) - z_R)
+                * (int(R_q[i, j]) - z_R)
+                * sR2sSq.numerator
+                // sR2sSq.denominator
+            )
 
     # _S = (z_Sq + np.square(R_q - z_R) * sR2sSq.numerator // sR2sSq.denominator).astype(
     #    np.int64
     # )
 
-    # print(S - _S)
-    return ((S.sum() // (m * n)).astype(np.int64) + z_Sq).astype(np.int64)
+    return np.array(S.sum() // (m * n) + z_Sq, dtype=dtype)
+
+
+def quantization_gemm_terms(W_q, b_q, c, dtype=np.int64):
+    # W_q cast once, with the row-independent terms of the GEMM: the column
+    # sums z_X * sum(W_q) folded into p * z_X * z_W, and the rescaled bias
+    W_q = np.asarray(W_q).astype(dtype, copy=False)
+    p, n = W_q.shape
+    col = p * c["z_X"] * c["z_W"] - c["z_X"] * W_q.sum(axis=0, keepdims=True)
+    bias = c["z_Y"] + (np.asarray(b_q).astype(dtype).reshape(1, n) - c["z_b"]) * c["sbsY_numerator"] // c["sbsY_denominator"]
+    return W_q, col, bias
+
+
+def quantization_gemm_block(x, terms, c, out):
+    # Y_q of one block of rows, written into out (rows, n); x is already
+    # cast, and its row sums z_W * sum(x) are formed once per block
+    W_q, col, bias = terms
+    np.matmul(x, W_q, out=out)
+    out -= c["z_W"] * x.sum(axis=1, keepdims=True)
+    out += col
+    out *= c["sXsWsY_numerator"]
+    out //= c["sXsWsY_denominator"]
+    out += bias
+    return out
 
 
 # This function can be encoded as a circom circuit
 def quantization_matrix_multiplication_arb(
-    X_q, W_q, b_q, s_X, z_X, s_W, z_W, s_b, z_b, s_Y, z_Y
+    X_q, W_q, b_q, s_X, z_X, s_W, z_W, s_b, z_b, s_Y, z_Y, dtype=np.int64
 ):
 
     p = W_q.shape[0]
-    # print('p', p)
     sbsY = Fraction(s_b / s_Y).limit_denominator(LIMIT_DENOM)
     sXsWsY = Fraction(s_X * s_W / s_Y).limit_denominator(LIMIT_DENOM)
+    c = dict(
+        z_X=z_X, z_W=z_W, z_b=z_b, z_Y=z_Y,
+        sbsY_numerator=sbsY.numerator, sbsY_denominator=sbsY.denominator,
+        sXsWsY_numerator=sXsWsY.numerator, sXsWsY_denominator=sXsWsY.denominator,
+    )
 
-    Y_q_simulated = (
-        z_Y
-        + (s_b / s_Y * (b_q.astype(np.int64) - z_b)).astype(np.int64)
-        + (
-            (s_X * s_W / s_Y)
-            * (
-                np.matmul(X_q.astype(np.int64), W_q.astype(np.int64))
-                - z_W * np.sum(X_q.astype(np.int64), axis=1, keepdims=True)
-                - z_X * np.sum(W_q.astype(np.int64), axis=0, keepdims=True)
-                + p * z_X * z_W
-            )
-        ).astype(np.int64)
-    ).astype(np.int64)
-
-    Y_q_simulated_q = (
-        z_Y
-        + ((b_q.astype(np.int64) - z_b)).astype(np.int64)
-        * sbsY.numerator
-        // sbsY.denominator
-        + (
-            (
-                np.matmul(X_q.astype(np.int64), W_q.astype(np.int64))
-                - z_W * np.sum(X_q.astype(np.int64), axis=1, keepdims=True)
-                - z_X * np.sum(W_q.astype(np.int64), axis=0, keepdims=True)
-                + p * z_X * z_W
-            )
-            * sXsWsY.numerator
-            // sXsWsY.denominator
-        ).astype(np.int64)
-    ).astype(np.int64)
-
-    #print("diff quant matmul: ", abs(Y_q_simulated_q - Y_q_simulated).mean())
+    # Cache-blocked over the rows, each operand cast once
+    X_q = np.asarray(X_q).astype(dtype, copy=False)
+    terms = quantization_gemm_terms(W_q, b_q, c, dtype)
+    Y_q_simulated_q = np.empty((X_q.shape[0], terms[0].shape[1]), dtype=dtype)
+    for i in range(0, X_q.shape[0], FUSED_BLOCK_ROWS):
+        quantization_gemm_block(X_q[i:i + FUSED_BLOCK_ROWS], terms, c, Y_q_simulated_q[i:i + FUSED_BLOCK_ROWS])
 
     return (
         Y_q_simulated_q,
@@ -269,92 +814,136 @@ def quant_matmul_circuit(
     sbsY_denominator,
     sXsWsY_numerator,
     sXsWsY_denominator,
+    rows=None,
+    dtype=np.int64,
 ):
-    t = (
-        X_q,
-        W_q,
-        b_q,
-        z_X,
-        z_W,
-        z_b,
-        z_Y,
-        sbsY_numerator,
-        sbsY_denominator,
-        sXsWsY_numerator,
-        sXsWsY_denominator,
-    )
+    # Integer-only mirror of the circom quant_matmul_circuit template. The
+    # accumulators follow the mult0/mult1/mult2 signal chains over k, and
+    # integer floor division matches the quotient produced by Modulo.
+    if rows is not None:
+        X_q = X_q[rows]
+    X_q, W_q = X_q.astype(dtype, copy=False), W_q.astype(dtype, copy=False)
+
+    b0 = (b_q.astype(dtype).reshape(1, n) - z_b) * sbsY_numerator // sbsY_denominator + z_Y
+
+    mult = np.zeros((X_q.shape[0], n), dtype=dtype)
+    for k in range(p):
+        mult += X_q[:, k:k + 1] * W_q[k:k + 1, :]
+    for k in range(p):
+        mult -= z_W * X_q[:, k:k + 1]
+    for k in range(p):
+        mult -= z_X * W_q[k:k + 1, :]
 
-    string = "GEMM Input Type"
-    ct = 0
-    for i in t:
-        if type(i) is not int:
-            dim1, dim2 = i.shape
-
-            def det(d):
-                if d == m:
-                    return "m"
-                elif d == n:
-                    return "n"
-                elif d == p:
-                    return "p"
-                return str(d)
-
-            string += f" ({det(dim1)},{det(dim2)})"
-        else:
-            string += f" int{ct}"
-            ct += 1
-    #print(string)
-
-    b0 = b_q.astype(np.int64)
-    for i0 in range(n):
-        b0[0, i0] = (b0[0, i0] - z_b) * sbsY_numerator // sbsY_denominator + z_Y
-
-    #print(b0 - z_b)
-    #print("b0 ", b0)
-    # b0 = z_Y
-    # b0 += (b_q.astype(np.int64) - z_b).astype(np.int64) * sbsY_numerator // sbsY_denominator
-    # print(b0)
-
-    mult0 = np.zeros((m, n))
-    X_q, W_q = X_q.astype(np.int64), W_q.astype(np.int64)
-
-    for i1 in range(m):
-        for j1 in range(n):
-            for k1 in range(p):
-                mult0[i1, j1] += X_q[i1][k1] * W_q[k1][j1]
-
-    mult = mult0.astype(np.int64)
-
-    # print(mult.shape, W_q.shape)
-    # print(np.sum(W_q.astype(np.int64), axis=0, keepdims=True).shape)
-
-    for i2 in range(m):
-        for j2 in range(p):
-            for k2 in range(n):
-                mult[i2, k2] -= z_W * X_q[i2, j2]
-
-    for i3 in range(m):
-        for j3 in range(p):
-            for k3 in range(n):
-                mult[i3, k3] -= z_X * W_q[j3, k3]
-
-    # print((z_W * np.sum(X_q.astype(np.int64), axis=1, keepdims=True)).shape)
-    # mult -= z_W * np.sum(X_q.astype(np.int64), axis=1, keepdims=True)
-    # for i3 in range(p):
-
-    #    mult
-    # print((z_X * np.sum(W_q.astype(np.int64), axis=0, keepdims=True)).shape)
-    # mult -= z_X * np.sum(W_q.astype(np.int64), axis=0, keepdims=True)
     mult += p * z_X * z_W
     mult = mult * sXsWsY_numerator // sXsWsY_denominator
 
-    # print(b0.shape)
-    # print(mult.shape)
-    for l1 in range(m):
-        for l2 in range(n):
-            mult[l1, l2] += b0[0, l2]
+    return mult + b0
+
+
+def quantization_fused_error_sums(X_q, W_q, b_q, Yt_q, c, block_rows=FUSED_BLOCK_ROWS, dtype=np.int64,
+                                  hidden=(), marks=True):
+    # Residual sum and floored squared-error sum in one blocked sweep over the
+    # rows. The exact integer steps of quantization_matrix_multiplication_arb,
+    # quantization_error and quantization_squared_error_sum run in place in
+    # two (block_rows, n) buffers, so memory is O(block_rows * n) whatever m is.
+    # hidden holds (W_q, b_q, constants) of stacked affine layers applied
+    # to X_q first (see quantization_layers), each in its own block buffer.
+    # Each block's time goes to the gemm and error profile stages
+    m, p = X_q.shape
+    n = W_q.shape[1]
+
+    # Row-independent terms of every GEMM, formed once
+    layers = [(quantization_gemm_terms(w, b, lc, dtype), lc) for w, b, lc in hidden]
+    buffers = [np.empty((block_rows, terms[0].shape[1]), dtype=dtype) for terms, _ in layers]
+    terms = quantization_gemm_terms(W_q, b_q, c, dtype)
+
+    acc = np.empty((block_rows, n), dtype=dtype)
+    tmp = np.empty((block_rows, n), dtype=dtype)
+    residual_sum = squared_error_sum = 0
+    for i in range(0, m, block_rows):
+        x = np.asarray(X_q[i:i + block_rows]).astype(dtype, copy=False)
+        rows = x.shape[0]
+        y, t = acc[:rows], tmp[:rows]
+
+        # Hidden activations, requantized into [ALPHA_Q, BETA_Q]
+        for (layer, lc), buffer in zip(layers, buffers):
+            x = quantization_gemm_block(x, layer, lc, buffer[:rows])
+            np.clip(x, ALPHA_Q, BETA_Q, out=x)
+
+        # Y_q
+        quantization_gemm_block(x, terms, c, y)
+        if marks:
+            profile_mark("gemm")
+
+        # R_q
+        y *= c["sYsR_numerator"]
+        y //= c["sYsR_denominator"]
+        t[...] = np.asarray(Yt_q[i:i + block_rows])
+        t *= c["sYtsR_numerator"]
+        t //= c["sYtsR_denominator"]
+        y -= t
+        y += c["constant"]
+        residual_sum += int(y.sum())
+
+        # S
+        y -= c["z_R"]
+        y *= y
+        y *= c["sR2sSq_numerator"]
+        y //= c["sR2sSq_denominator"]
+        squared_error_sum += int(y.sum())
+        if marks:
+            profile_mark("error")
+
+    return residual_sum, squared_error_sum
+
+
+def quantization_circuit_check(X_q, W_q, b_q, Yt_q, c, rows, dtype=np.int64):
+    # Re-checks the given rows against the circuit references: the GEMM
+    # against quant_matmul_circuit, the residual against quant_error_circuit
+    # and the fused sums against quant_mse
+    if len(rows) == 0:
+        return
+    X_q, Yt_q = np.asarray(X_q[rows]).astype(dtype, copy=False), np.asarray(Yt_q[rows])
+    W_q = np.asarray(W_q).astype(dtype, copy=False)
+    m, n = Yt_q.shape
+
+    Y_q = quantization_matrix_multiplication_arb(
+        X_q, W_q, b_q,
+        c["s_X"], c["z_X"], c["s_W"], c["z_W"], c["s_b"], c["z_b"], c["s_Y"], c["z_Y"],
+        dtype,
+    )[0]
+    _Y_q = quant_matmul_circuit(
+        X_q, W_q, b_q, c["z_X"], c["z_W"], c["z_b"], c["z_Y"], m, n, W_q.shape[0],
+        c["sbsY_numerator"], c["sbsY_denominator"], c["sXsWsY_numerator"], c["sXsWsY_denominator"],
+        None, dtype,
+    )
+    assert (Y_q == _Y_q).all()
+    profile_mark("gemm_check")
+
+    R_q = quantization_error(
+        Y_q, Yt_q, c["s_R"], c["z_R"], c["s_Y"], c["z_Y"], c["s_Yt"], c["z_Yt"], dtype
+    )[0]
+    _R_q = quant_error_circuit(
+        Y_q, Yt_q, c["s_R"], c["z_R"], c["s_Y"], c["z_Y"], c["s_Yt"], c["z_Yt"], m, n, dtype
+    )
+    assert (R_q == _R_q).all()
+
+    residual_sum, squared_error_sum = quantization_fused_error_sums(X_q, W_q, b_q, Yt_q, c, dtype=dtype, marks=False)
+    assert residual_sum == int(R_q.sum())
+    _Sq_q = quant_mse(R_q, c["s_R"], c["s_Sq"], c["z_R"], c["z_Sq"], m, n, dtype)
+    assert _Sq_q == (squared_error_sum + m * n * c["z_Sq"]) // (m * n), (_Sq_q, squared_error_sum)
+    profile_mark("error_check")
+
+
+def verification_rows(m, verify):
+    # Rows of the GEMM that are re-checked against the circuit reference
+    assert verify in ("full", "sample", "skip"), verify
+    if verify == "skip":
+        return np.arange(0)
+    if verify == "sample" and m > VERIFY_SAMPLE_ROWS:
+        return np.sort(np.random.choice(m, size=VERIFY_SAMPLE_ROWS, replace=False))
+    return np.arange(m)
 
-    return mult
 
 def q_model(m, p, n, 
              alpha_X, beta_X,
@@ -364,7 +953,8 @@ def q_model(m, p, n,
              alpha_Yt, beta_Yt,
              alpha_R, beta_R,
              alpha_S, beta_S,
-             X, W, b, Yt_expected, mse):
+             X, W, b, Yt_expected, mse, verify="full", fmt="json",
+             X_q_cached=None, Yt_q_cached=None, hash_input=None):
 
     # Set random seed for reproducibility
     random_seed = 0
@@ -372,7 +962,7 @@ def q_model(m, p, n,
 
     # X
     s_X, z_X = generate_quantization_arb_constants(alpha=alpha_X, beta=beta_X)
-    X_q = quantization_arb(x=X, s=s_X, z=z_X)
+    X_q = quantized_rows(X, s_X, z_X, x_q=X_q_cached)
 
     # W
     s_W, z_W = generate_quantization_arb_constants(alpha=alpha_W, beta=beta_W)
@@ -385,142 +975,217 @@ def q_model(m, p, n,
     # Y
     s_Y, z_Y = generate_quantization_arb_constants(alpha=alpha_Y, beta=beta_Y)
     Y_expected = np.matmul(X, W) + b
-    Y_q_expected = quantization_arb(x=Y_expected, s=s_Y, z=z_Y)
 
     # Y_true
     s_Yt, z_Yt = generate_quantization_arb_constants(alpha=alpha_Yt, beta=beta_Yt)
-    Yt_q_expected = quantization_arb(x=Yt_expected, s=s_Yt, z=z_Yt)
+    Yt_q_expected = quantized_rows(Yt_expected, s_Yt, z_Yt, x_q=Yt_q_cached)
 
     # Y_res
     s_R, z_R = generate_quantization_arb_constants(alpha=alpha_R, beta=beta_R)
 
     # Squared Error
     s_Sq, z_Sq = generate_quantization_arb_constants(alpha=alpha_S, beta=beta_S)
+    profile_mark("quantize")
 
     R = Y_expected - Yt_expected
     Mr = R.mean()
     Sq = (R ** 2).mean()
 
     Sq_q = quantization_arb(x=Sq, s=s_Sq, z=z_Sq)
-    R_q = quantization_arb(x=R, s=s_R, z=z_R)
     Mr_q = quantization_arb(x=Mr, s=s_R, z=z_R)
+    profile_mark("reference")
+
+    # Pick the arithmetic backend before any quantized intermediate is formed
+    c = quantization_constants(dict(
+        alpha_X=alpha_X, beta_X=beta_X,
+        alpha_W=alpha_W, beta_W=beta_W,
+        alpha_b=alpha_b, beta_b=beta_b,
+        alpha_Y=alpha_Y, beta_Y=beta_Y,
+        alpha_Yt=alpha_Yt, beta_Yt=beta_Yt,
+        alpha_R=alpha_R, beta_R=beta_R,
+        alpha_S=alpha_S, beta_S=beta_S,
+    ))
+    dtype = quantization_dtype(bound_for(c, m, p, n))
+
+    # Sanity Check
+    quantization_circuit_check(X_q, W_q, b_q, Yt_q_expected, c, verification_rows(m, verify), dtype)
+
+    residual_sum, squared_error_sum = quantization_fused_error_sums(X_q, W_q, b_q, Yt_q_expected, c, dtype=dtype)
+    Mr_q_simulated, Sq_q_simulated = combine_error_sums(
+        [dict(residual_sum=residual_sum, squared_error_sum=squared_error_sum)], m, n, z_Sq
+    )
+    profile_mark("mse")
 
     (
-        Y_q_simulated,
         sbsY_numerator,
         sbsY_denominator,
         sXsWsY_numerator,
         sXsWsY_denominator,
-        p,
-    ) = quantization_matrix_multiplication_arb(
-        X_q=X_q,
-        W_q=W_q,
-        b_q=b_q,
-        s_X=s_X,
-        z_X=z_X,
-        s_W=s_W,
-        z_W=z_W,
-        s_b=s_b,
-        z_b=z_b,
-        s_Y=s_Y,
-        z_Y=z_Y,
+        sYsR_numerator,
+        sYsR_denominator,
+        sYtsR_numerator,
+        sYtsR_denominator,
+        constant,
+        sR2sSq_numerator,
+        sR2sSq_denominator,
+    ) = (
+        c["sbsY_numerator"],
+        c["sbsY_denominator"],
+        c["sXsWsY_numerator"],
+        c["sXsWsY_denominator"],
+        c["sYsR_numerator"],
+        c["sYsR_denominator"],
+        c["sYtsR_numerator"],
+        c["sYtsR_denominator"],
+        c["constant"],
+        c["sR2sSq_numerator"],
+        c["sR2sSq_denominator"],
     )
 
-    # Sanity Check
-    _Y_q_simulated = quant_matmul_circuit(
-        X_q=X_q,
-        W_q=W_q,
-        b_q=b_q,
-        z_X=z_X,
-        z_W=z_W,
-        z_b=z_b,
-        z_Y=z_Y,
-        m=m,
-        n=n,
-        p=p,
-        sbsY_numerator=sbsY_numerator,
-        sbsY_denominator=sbsY_denominator,
-        sXsWsY_numerator=sXsWsY_numerator,
-        sXsWsY_denominator=sXsWsY_denominator,
-    )
-    assert (Y_q_simulated == _Y_q_simulated).all()
-    #print("gemm assertion passed")
-    #print("_Y_q_simulated", _Y_q_simulated)
+    Mr_simulated = dequantization(Mr_q_simulated, s=s_R, z=z_R)
+    Sq_simulated = dequantization(Sq_q_simulated, s=s_Sq, z=z_Sq)
+
+    print("Mean Squared Error actual: ", Sq)
+    print("... quantized ", Sq_q)
+    print("Mean Squared Error simulated: ", Sq_simulated)
+    print("... quantized ", quantization_arb(x=Sq_simulated, s=s_Sq, z=z_Sq))
+
+    Sq_q_quant = quantization_arb(x=mse, s=s_Sq, z=z_Sq)
+
+    data_all = dict(
+        #out=proc(int(Sq_q_simulated)),
+        out=proc(int(Sq_q_quant)),
+        sR2sSq_numerator=proc(sR2sSq_numerator),
+        sR2sSq_denominator=proc(sR2sSq_denominator),
+        z_R=proc(z_R),
+        z_Sq=proc(z_Sq),
+        Yt_q=field_elements(Yt_q_expected),
+        sYsR_numerator=proc(sYsR_numerator),
+        sYsR_denominator=proc(sYsR_denominator),
+        sYtsR_numerator=proc(sYtsR_numerator),
+        sYtsR_denominator=proc(sYtsR_denominator),
+        constant=proc(constant),
+        X_q=field_elements(X_q),
+        W_q=field_elements(W_q),
+        b_q=field_elements(b_q),
+        z_X=proc(z_X),
+        z_W=proc(z_W),
+        z_b=proc(z_b),
+        z_Y=proc(z_Y),
+        sbsY_numerator=proc(sbsY_numerator),
+        sbsY_denominator=proc(sbsY_denominator),
+        sXsWsY_numerator=proc(sXsWsY_numerator),
+        sXsWsY_denominator=proc(sXsWsY_denominator),
+    )
+
+    if hash_input is None:
+        hash_input = dataset_commitment([X_q], [Yt_q_expected], data_all)
+    data_all["hash_input"] = hash_input
+    profile_mark("hash")
+
+    write_inputs(data_all, "./artifacts/quantization/inputs_ml", fmt)
+    profile_mark("serialize")
+
+    return data_all
+
+
+def q_model_stream(m, p, n,
+             alpha_X, beta_X,
+             alpha_W, beta_W,
+             alpha_b, beta_b,
+             alpha_Y, beta_Y,
+             alpha_Yt, beta_Yt,
+             alpha_R, beta_R,
+             alpha_S, beta_S,
+             X, W, b, Yt_expected, mse, block_rows, verify="full", fmt="json",
+             X_q_cached=None, Yt_q_cached=None, hash_input=None):
+    # Same as q_model, but X and Yt_expected may be memory-mapped: only one
+    # block of rows and the running sums are held in memory at a time
+
+    # Set random seed for reproducibility
+    random_seed = 0
+    np.random.seed(random_seed)
+
+    s_X, z_X = generate_quantization_arb_constants(alpha=alpha_X, beta=beta_X)
+    s_W, z_W = generate_quantization_arb_constants(alpha=alpha_W, beta=beta_W)
+    W_q = quantization_arb(x=W, s=s_W, z=z_W)
+    s_b, z_b = generate_quantization_arb_constants(alpha=alpha_b, beta=beta_b)
+    b_q = quantization_arb(x=b, s=s_b, z=z_b)
+    s_Y, z_Y = generate_quantization_arb_constants(alpha=alpha_Y, beta=beta_Y)
+    s_Yt, z_Yt = generate_quantization_arb_constants(alpha=alpha_Yt, beta=beta_Yt)
+    s_R, z_R = generate_quantization_arb_constants(alpha=alpha_R, beta=beta_R)
+    s_Sq, z_Sq = generate_quantization_arb_constants(alpha=alpha_S, beta=beta_S)
+
+    c = quantization_constants(dict(
+        alpha_X=alpha_X, beta_X=beta_X,
+        alpha_W=alpha_W, beta_W=beta_W,
+        alpha_b=alpha_b, beta_b=beta_b,
+        alpha_Y=alpha_Y, beta_Y=beta_Y,
+        alpha_Yt=alpha_Yt, beta_Yt=beta_Yt,
+        alpha_R=alpha_R, beta_R=beta_R,
+        alpha_S=alpha_S, beta_S=beta_S,
+    ))
+    dtype = quantization_dtype(bound_for(c, m, p, n))
+
+    R2_sum = 0.0
+    parts = []
+    for i in range(0, m, block_rows):
+        X_block = np.asarray(X[i:i + block_rows])
+        Yt_block = np.asarray(Yt_expected[i:i + block_rows])
+        if X_q_cached is None:
+            X_q = quantization_arb(x=X_block, s=s_X, z=z_X)
+            Yt_q_expected = quantization_arb(x=Yt_block, s=s_Yt, z=z_Yt)
+        else:
+            X_q = np.asarray(X_q_cached[i:i + block_rows])
+            Yt_q_expected = np.asarray(Yt_q_cached[i:i + block_rows])
+        profile_mark("quantize")
+
+        R = np.matmul(X_block, W) + b - Yt_block
+        R2_sum += (R ** 2).sum()
+        profile_mark("reference")
+
+        # Sanity Check
+        quantization_circuit_check(
+            X_q, W_q, b_q, Yt_q_expected, c, verification_rows(X_q.shape[0], verify), dtype
+        )
+
+        residual_sum, squared_error_sum = quantization_fused_error_sums(
+            X_q, W_q, b_q, Yt_q_expected, c, dtype=dtype
+        )
+        parts.append(dict(residual_sum=residual_sum, squared_error_sum=squared_error_sum))
 
     (
-        R_q_simulated,
+        sbsY_numerator,
+        sbsY_denominator,
+        sXsWsY_numerator,
+        sXsWsY_denominator,
         sYsR_numerator,
         sYsR_denominator,
         sYtsR_numerator,
         sYtsR_denominator,
         constant,
-    ) = quantization_error(
-        Y_q=Y_q_simulated,
-        Yt_q=Yt_q_expected,
-        s_R=s_R,
-        z_R=z_R,
-        s_Y=s_Y,
-        z_Y=z_Y,
-        s_Yt=s_Yt,
-        z_Yt=z_Yt,
-    )
-
-    _R_q_simulated = quant_error_circuit(
-        Y_q=Y_q_simulated,
-        Yt_q=Yt_q_expected,
-        s_R=s_R,
-        z_R=z_R,
-        s_Y=s_Y,
-        z_Y=z_Y,
-        s_Yt=s_Yt,
-        z_Yt=z_Yt,
-        m=m,
-        n=n,
-    )
-
-    assert (_R_q_simulated == R_q_simulated).all()
-    #print("error assertion passed")
-    (
-        Sq_q_simulated,
         sR2sSq_numerator,
         sR2sSq_denominator,
-    ) = quantization_mean_squared_error(R_q_simulated, s_R, s_Sq, z_R, z_Sq, m, n)
-
-    Mr_q_simulated = quantization_mean_error(
-        Y_q=Y_q_simulated,
-        Yt_q=Yt_q_expected,
-        s_R=s_R,
-        z_R=z_R,
-        s_Y=s_Y,
-        z_Y=z_Y,
-        s_Yt=s_Yt,
-        z_Yt=z_Yt,
-        m=m,
+    ) = (
+        c["sbsY_numerator"],
+        c["sbsY_denominator"],
+        c["sXsWsY_numerator"],
+        c["sXsWsY_denominator"],
+        c["sYsR_numerator"],
+        c["sYsR_denominator"],
+        c["sYtsR_numerator"],
+        c["sYtsR_denominator"],
+        c["constant"],
+        c["sR2sSq_numerator"],
+        c["sR2sSq_denominator"],
     )
+    _, Sq_q_simulated = combine_error_sums(parts, m, n, z_Sq)
+    profile_mark("mse")
 
-    _Sq_q_simulated = quant_mse(R_q_simulated, s_R, s_Sq, z_R, z_Sq, m, n)
-
-    assert (_Sq_q_simulated == Sq_q_simulated).all(), (_Sq_q_simulated, Sq_q_simulated)
-    #print("mse assertion passed")
-
-    Mr_simulated = dequantization(Mr_q_simulated, s=s_R, z=z_R)
+    Sq = R2_sum / (m * n)
+    Sq_q = quantization_arb(x=Sq, s=s_Sq, z=z_Sq)
     Sq_simulated = dequantization(Sq_q_simulated, s=s_Sq, z=z_Sq)
-    Y_simulated = dequantization(x_q=Y_q_simulated, s=s_Y, z=z_Y)
-
-    #print("Args")
-    #print(sbsY_numerator, sbsY_denominator, sXsWsY_numerator, sXsWsY_denominator)
-    #print(sYsR_numerator, sYsR_denominator, sYtsR_numerator, sYtsR_denominator)
-    #print(sR2sSq_numerator, sR2sSq_denominator)
-
-    #print("Sq actual ", Sq_q.T)
-    #print("Sq computed ", Sq_q_simulated.T)
-    #print("R_q actual ", R_q.T)
-    #print("R_q computed ", R_q_simulated.T)
-    #print("R_q diff ", R_q.T - R_q_simulated.T)
-    #print("Mr_q actual ", Mr_q)
-    #print("Mr_q computed ", Mr_q_simulated)
-    #print("Mean Error actual: ", Mr)
-    #print("Mean Error simulated: ", Mr_simulated)
+
     print("Mean Squared Error actual: ", Sq)
     print("... quantized ", Sq_q)
     print("Mean Squared Error simulated: ", Sq_simulated)
@@ -529,21 +1194,23 @@ def q_model(m, p, n,
     Sq_q_quant = quantization_arb(x=mse, s=s_Sq, z=z_Sq)
 
     data_all = dict(
-        #out=proc(int(_Sq_q_simulated)),
         out=proc(int(Sq_q_quant)),
         sR2sSq_numerator=proc(sR2sSq_numerator),
         sR2sSq_denominator=proc(sR2sSq_denominator),
         z_R=proc(z_R),
         z_Sq=proc(z_Sq),
-        Yt_q=proc(Yt_q_expected),
+        Yt_q=(
+            field_elements(yt_q)
+            for yt_q in quantized_rows(Yt_expected, s_Yt, z_Yt, block_rows, Yt_q_cached)
+        ),
         sYsR_numerator=proc(sYsR_numerator),
         sYsR_denominator=proc(sYsR_denominator),
         sYtsR_numerator=proc(sYtsR_numerator),
         sYtsR_denominator=proc(sYtsR_denominator),
         constant=proc(constant),
-        X_q=proc(X_q),
-        W_q=proc(W_q),
-        b_q=proc(b_q),
+        X_q=(field_elements(x_q) for x_q in quantized_rows(X, s_X, z_X, block_rows, X_q_cached)),
+        W_q=field_elements(W_q),
+        b_q=field_elements(b_q),
         z_X=proc(z_X),
         z_W=proc(z_W),
         z_b=proc(z_b),
@@ -554,8 +1221,19 @@ def q_model(m, p, n,
         sXsWsY_denominator=proc(sXsWsY_denominator),
     )
 
-    with open("./artifacts/quantization/inputs_ml.json", "w") as f:
-        json.dump(data_all, f, indent=2)
+    if hash_input is None:
+        hash_input = dataset_commitment(
+            quantized_rows(X, s_X, z_X, block_rows, X_q_cached),
+            quantized_rows(Yt_expected, s_Yt, z_Yt, block_rows, Yt_q_cached),
+            data_all,
+        )
+    data_all["hash_input"] = hash_input
+    profile_mark("hash")
+
+    write_inputs(data_all, "./artifacts/quantization/inputs_ml", fmt)
+    profile_mark("serialize")
+
+    return data_all
 
 
 def q_dataset(
@@ -566,7 +1244,8 @@ def q_dataset(
              alpha_Yt, beta_Yt,
              alpha_R, beta_R,
              alpha_S, beta_S,
-             X, Yt_expected, mse):
+             X, Yt_expected, mse, block_rows=None, fmt="json",
+             X_q_cached=None, Yt_q_cached=None, hash_input=None):
 
     # Set random seed for reproducibility
     random_seed = 0
@@ -574,7 +1253,11 @@ def q_dataset(
 
     # X
     s_X, z_X = generate_quantization_arb_constants(alpha=alpha_X, beta=beta_X)
-    X_q = quantization_arb(x=X, s=s_X, z=z_X)
+    X_q = quantized_rows(X, s_X, z_X, block_rows, X_q_cached)
+    if block_rows is None:
+        X_q = field_elements(X_q)
+    else:
+        X_q = (field_elements(x_q) for x_q in X_q)
 
     # W
     s_W, z_W = generate_quantization_arb_constants(alpha=alpha_W, beta=beta_W)
@@ -587,7 +1270,11 @@ def q_dataset(
 
     # Y_true
     s_Yt, z_Yt = generate_quantization_arb_constants(alpha=alpha_Yt, beta=beta_Yt)
-    Yt_q_expected = quantization_arb(x=Yt_expected, s=s_Yt, z=z_Yt)
+    Yt_q_expected = quantized_rows(Yt_expected, s_Yt, z_Yt, block_rows, Yt_q_cached)
+    if block_rows is None:
+        Yt_q_expected = field_elements(Yt_q_expected)
+    else:
+        Yt_q_expected = (field_elements(yt_q) for yt_q in Yt_q_expected)
 
     # Y_res
     s_R, z_R = generate_quantization_arb_constants(alpha=alpha_R, beta=beta_R)
@@ -595,6 +1282,12 @@ def q_dataset(
     # Squared Error
     s_Sq, z_Sq = generate_quantization_arb_constants(alpha=alpha_S, beta=beta_S)
     Sq_q_quant = quantization_arb(x=mse, s=s_Sq, z=z_Sq)
+    profile_mark("quantize")
+
+    # Warn up front if models on this dataset would overflow the circuit
+    c = dict(s_X=s_X, z_X=z_X, s_W=s_W, z_W=z_W, s_b=s_b, z_b=z_b, s_Y=s_Y, z_Y=z_Y,
+             s_Yt=s_Yt, z_Yt=z_Yt, s_R=s_R, z_R=z_R, s_Sq=s_Sq, z_Sq=z_Sq)
+    quantization_dtype(bound_for(c, X.shape[0], X.shape[1], Yt_expected.shape[1]))
 
     sbsY = Fraction(s_b / s_Y).limit_denominator(LIMIT_DENOM)
     sXsWsY = Fraction(s_X * s_W / s_Y).limit_denominator(LIMIT_DENOM)
@@ -629,7 +1322,6 @@ def q_dataset(
     
     sR2sSq = Fraction((s_R ** 2) / s_Sq).limit_denominator(LIMIT_DENOM)
 
-
     (
         sR2sSq_numerator,
         sR2sSq_denominator,
@@ -644,13 +1336,13 @@ def q_dataset(
         sR2sSq_denominator=proc(sR2sSq_denominator),
         z_R=proc(z_R),
         z_Sq=proc(z_Sq),
-        Yt_q=proc(Yt_q_expected),
+        Yt_q=Yt_q_expected,
         sYsR_numerator=proc(sYsR_numerator),
         sYsR_denominator=proc(sYsR_denominator),
         sYtsR_numerator=proc(sYtsR_numerator),
         sYtsR_denominator=proc(sYtsR_denominator),
         constant=proc(constant),
-        X_q=proc(X_q),
+        X_q=X_q,
         z_X=proc(z_X),
         z_W=proc(z_W),
         z_b=proc(z_b),
@@ -661,11 +1353,28 @@ def q_dataset(
         sXsWsY_denominator=proc(sXsWsY_denominator),
     )
 
-    with open("./artifacts/quantization/inputs_dataset.json", "w") as f:
-        json.dump(data_all, f, indent=2)
+    if hash_input is None:
+        if block_rows is None:
+            hash_input = dataset_commitment([X_q], [Yt_q_expected], data_all)
+        else:
+            hash_input = dataset_commitment(
+                quantized_rows(X, s_X, z_X, block_rows, X_q_cached),
+                quantized_rows(Yt_expected, s_Yt, z_Yt, block_rows, Yt_q_cached),
+                data_all,
+            )
+    data_all["hash_input"] = hash_input
+    profile_mark("hash")
+
+    write_inputs(data_all, "./artifacts/quantization/inputs_dataset", fmt)
+    profile_mark("serialize")
+
+    return data_all
 
 
-def quant_dataset(dataset, setting):
+def quant_dataset(dataset, setting, block_rows=None, fmt="json", cache_dir=None, workers=None):
+
+    if workers is not None and workers > 1:
+        return quant_dataset_parallel(dataset, setting, workers, block_rows, fmt, cache_dir)
 
     data = json.load(open(setting, 'rb'))
 
@@ -692,10 +1401,17 @@ def quant_dataset(dataset, setting):
 
     mse_target = data['mse_target']
 
-    X = np.load(f'{dataset}/X.npy')
-    Y = np.load(f'{dataset}/Y.npy')
+    X_q_cached = Yt_q_cached = hash_input = None
+    if cache_dir is not None:
+        c, X_q_cached, Yt_q_cached = cache_dataset(cache_dir, setting, dataset)
+        hash_input = c["hash_input"]
+
+    mmap_mode = None if block_rows is None and cache_dir is None else "r"
+    X = np.load(f'{dataset}/X.npy', mmap_mode=mmap_mode)
+    Y = np.load(f'{dataset}/Y.npy', mmap_mode=mmap_mode)
+    profile_mark("load")
 
-    q_dataset(
+    return q_dataset(
          alpha_X, beta_X,
          alpha_W, beta_W,
          alpha_b, beta_b,
@@ -703,10 +1419,16 @@ def quant_dataset(dataset, setting):
          alpha_Yt, beta_Yt,
          alpha_R, beta_R,
          alpha_S, beta_S,
-         X, Y, mse_target)
+         X, Y, mse_target, block_rows, fmt, X_q_cached, Yt_q_cached, hash_input)
 
 
-def quant_model(model, dataset, setting):
+def quant_model(model, dataset, setting, verify="full", block_rows=None, fmt="json", cache_dir=None,
+                workers=None):
+
+    assert os.path.exists(f"{model}/W.npy"), \
+        f"{model}: stacked layers can only be estimated (--mode layers), the circuit proves a single layer"
+    if workers is not None and workers > 1:
+        return quant_model_parallel(model, dataset, setting, workers, block_rows, verify, fmt, cache_dir)
 
     data = json.load(open(setting, 'rb'))
 
@@ -736,12 +1458,35 @@ def quant_model(model, dataset, setting):
 
     mse_target = data['mse_target']
 
-    X = np.load(f'{dataset}/X.npy')
     W = np.load(f'{model}/W.npy')
     b = np.load(f'{model}/b.npy')
+
+    X_q_cached = Yt_q_cached = hash_input = None
+    if cache_dir is not None:
+        c, X_q_cached, Yt_q_cached = cache_dataset(cache_dir, setting, dataset)
+        hash_input = c["hash_input"]
+
+    if block_rows is not None:
+        X = np.load(f'{dataset}/X.npy', mmap_mode="r")
+        Y = np.load(f'{dataset}/Y.npy', mmap_mode="r")
+        profile_mark("load")
+
+        return q_model_stream(m, p, n,
+             alpha_X, beta_X,
+             alpha_W, beta_W,
+             alpha_b, beta_b,
+             alpha_Y, beta_Y,
+             alpha_Yt, beta_Yt,
+             alpha_R, beta_R,
+             alpha_S, beta_S,
+             X, W, b, Y, mse_target, block_rows, verify, fmt,
+             X_q_cached, Yt_q_cached, hash_input)
+
+    X = np.load(f'{dataset}/X.npy')
     Y = np.load(f'{dataset}/Y.npy')
+    profile_mark("load")
 
-    q_model(m, p, n, 
+    return q_model(m, p, n,
          alpha_X, beta_X,
          alpha_W, beta_W,
          alpha_b, beta_b,
@@ -749,22 +1494,500 @@ def quant_model(model, dataset, setting):
          alpha_Yt, beta_Yt,
          alpha_R, beta_R,
          alpha_S, beta_S,
-         X, W, b, Y, mse_target)
+         X, W, b, Y, mse_target, verify, fmt,
+         X_q_cached, Yt_q_cached, hash_input)
+
+
+def load_layers(model):
+    # (W, b) of every layer of a model: W.npy and b.npy, or W_0.npy, b_0.npy,
+    # W_1.npy, ... for stacked affine layers
+    if os.path.exists(f"{model}/W.npy"):
+        return [(np.load(f"{model}/W.npy"), np.load(f"{model}/b.npy"))]
+    layers = []
+    while os.path.exists(f"{model}/W_{len(layers)}.npy"):
+        layers.append((np.load(f"{model}/W_{len(layers)}.npy"), np.load(f"{model}/b_{len(layers)}.npy")))
+    assert layers, f"{model} has neither W.npy nor W_0.npy"
+    return layers
+
+
+def quantization_layers(layers, settings):
+    # Quantized weights and constants of stacked affine layers. The hidden
+    # layers take their W, b and Y ranges from settings["layers"], in order;
+    # the last layer uses the top-level ranges, so its constants c are the
+    # ones the error and MSE stages consume
+    ranges = settings.get("layers", [])
+    assert len(ranges) == len(layers) - 1, "settings need W, b and Y ranges for every hidden layer"
+
+    s_X, z_X = generate_quantization_arb_constants(alpha=settings["alpha_X"], beta=settings["beta_X"])
+    hidden = []
+    for (W, b), r in zip(layers[:-1], ranges):
+        lc = quantization_layer_constants(s_X, z_X, r)
+        hidden.append((quantization_arb(x=W, s=lc["s_W"], z=lc["z_W"]),
+                       quantization_arb(x=b, s=lc["s_b"], z=lc["z_b"]), lc))
+        s_X, z_X = lc["s_Y"], lc["z_Y"]
+
+    c = dict(quantization_constants(settings), **quantization_layer_constants(s_X, z_X, settings))
+    W, b = layers[-1]
+    W_q = quantization_arb(x=W, s=c["s_W"], z=c["z_W"])
+    b_q = quantization_arb(x=b, s=c["s_b"], z=c["z_b"])
+    return hidden, W_q, b_q, c
+
+
+def quant_model_layers(model, dataset, setting, block_rows=None, cache_dir=None):
+    # Quantized MSE (mse.out) of a model of stacked affine layers, written to
+    # artifacts/quantization/layers.json. Hidden activations are requantized
+    # to their Y range between layers. The circuit proves a single layer, so
+    # the result is an estimate only: no witness inputs are written and
+    # nothing here can be claimed
+    data = json.load(open(setting, 'rb'))
+    layers = load_layers(model)
+    hidden, W_q, b_q, c = quantization_layers(layers, data)
 
-    return 
+    X = np.load(f'{dataset}/X.npy', mmap_mode="r")
+    Y = np.load(f'{dataset}/Y.npy', mmap_mode="r")
+    if cache_dir is not None:
+        _, X_q, Yt_q = cache_dataset(cache_dir, setting, dataset)
+    else:
+        # c["s_X"] is the scale of the last hidden layer, not of the dataset
+        s_X, z_X = generate_quantization_arb_constants(alpha=data["alpha_X"], beta=data["beta_X"])
+        X_q = quantization_arb(x=np.asarray(X), s=s_X, z=z_X)
+        Yt_q = quantization_arb(x=np.asarray(Y), s=c["s_Yt"], z=c["z_Yt"])
+    m, n = Yt_q.shape
+    profile_mark("quantize")
+
+    # Float reference of the same stack
+    squared = 0.0
+    for x, yt in zip(row_blocks(X, CACHE_BLOCK_ROWS), row_blocks(Y, CACHE_BLOCK_ROWS)):
+        for W, b in layers:
+            x = np.matmul(x, W) + b
+        squared += float(((x - yt) ** 2).sum())
+    mse = squared / (m * n)
+    profile_mark("reference")
+
+    bound = 0
+    for w, _, lc in hidden + [(W_q, b_q, c)]:
+        # The layer's own X, W, b and Y constants, the output's Yt, R and Sq
+        bound = max(bound, bound_for(dict(c, **lc), m, w.shape[0], w.shape[1]))
+    residual_sum, squared_error_sum = quantization_fused_error_sums(
+        X_q, W_q, b_q, Yt_q, c, block_rows or FUSED_BLOCK_ROWS, quantization_dtype(bound), hidden
+    )
+    _, mse_q = combine_error_sums(
+        [dict(residual_sum=residual_sum, squared_error_sum=squared_error_sum)], m, n, c["z_Sq"]
+    )
+    profile_mark("mse")
+
+    out = int(quantization_arb(x=data["mse_target"], s=c["s_Sq"], z=c["z_Sq"]))
+    print("Mean Squared Error actual: ", mse)
+    print("Mean Squared Error simulated: ", dequantization(mse_q, s=c["s_Sq"], z=c["z_Sq"]))
+    print("... quantized ", int(mse_q))
+
+    result = dict(
+        model=model,
+        shapes=[list(W.shape) for W, _ in layers],
+        mse=mse,
+        mse_q=int(mse_q),
+        out=out,
+        passed=int(mse_q) <= out,
+        estimate_only=True,
+    )
+    print("... estimate only, the circuit proves a single layer")
+    os.makedirs("./artifacts/quantization", exist_ok=True)
+    with open("./artifacts/quantization/layers.json", "w") as f:
+        json.dump(result, f, indent=2)
+    profile_mark("serialize")
+    return result
+
+
+def quantization_batch_mse(X_q, W_q, b_q, Yt_q, c, dtype=np.int64):
+    # Circuit mse.out for a stack of k models at once: W_q (k, p, n) and
+    # b_q (k, 1, n) against the shared X_q (m, p) and Yt_q (m, n)
+    m, p = X_q.shape
+    n = Yt_q.shape[1]
+    X_q, W_q, b_q, Yt_q = X_q.astype(dtype), W_q.astype(dtype), b_q.astype(dtype), Yt_q.astype(dtype)
+
+    Y_q = (
+        c["z_Y"]
+        + (b_q - c["z_b"]) * c["sbsY_numerator"] // c["sbsY_denominator"]
+        + (
+            np.matmul(X_q, W_q)
+            - c["z_W"] * np.sum(X_q, axis=1, keepdims=True)
+            - c["z_X"] * np.sum(W_q, axis=-2, keepdims=True)
+            + p * c["z_X"] * c["z_W"]
+        )
+        * c["sXsWsY_numerator"]
+        // c["sXsWsY_denominator"]
+    )
+    R_q = (
+        c["constant"]
+        + Y_q * c["sYsR_numerator"] // c["sYsR_denominator"]
+        - Yt_q * c["sYtsR_numerator"] // c["sYtsR_denominator"]
+    )
+    S = np.square(R_q - c["z_R"]) * c["sR2sSq_numerator"] // c["sR2sSq_denominator"]
 
-if __name__ == "__main__":
+    return (S.sum(axis=(1, 2)) + m * n * c["z_Sq"]) // (m * n)
+
+
+def quant_models(models, dataset, setting, verify="full", fmt="json", cache_dir=None):
+    # Rank candidate models by their circuit mse.out in one batched pass and
+    # write witness inputs only for those meeting the settings' mse_target
+    data = json.load(open(setting, 'rb'))
+    m, p, n = data['m'], data['p'], data['n']
+    c = quantization_constants(data)
+
+    if cache_dir is None:
+        X = np.load(f'{dataset}/X.npy')
+        Y = np.load(f'{dataset}/Y.npy')
+        X_q = quantization_arb(x=X, s=c["s_X"], z=c["z_X"])
+        Yt_q = quantization_arb(x=Y, s=c["s_Yt"], z=c["z_Yt"])
+    else:
+        _, X_q, Yt_q = cache_dataset(cache_dir, setting, dataset)
+
+    W = np.stack([np.load(f'{model}/W.npy') for model in models])
+    b = np.stack([np.load(f'{model}/b.npy') for model in models])
+    W_q = quantization_arb(x=W, s=c["s_W"], z=c["z_W"])
+    b_q = quantization_arb(x=b, s=c["s_b"], z=c["z_b"])
+
+    dtype = quantization_dtype(bound_for(c, m, p, n))
+    Sq_q = quantization_batch_mse(np.asarray(X_q), W_q, b_q, np.asarray(Yt_q), c, dtype)
+    Sq_q_quant = int(quantization_arb(x=data['mse_target'], s=c["s_Sq"], z=c["z_Sq"]))
+
+    ranking = []
+    for rank, i in enumerate(sorted(range(len(models)), key=lambda i: (Sq_q[i], i))):
+        entry = dict(
+            model=models[i],
+            mse_q=int(Sq_q[i]),
+            margin=Sq_q_quant - int(Sq_q[i]),
+            passed=bool(Sq_q[i] <= Sq_q_quant),
+            inputs=None,
+        )
+        if entry["passed"]:
+            data_all = quant_model(models[i], dataset, setting, verify, None, None, cache_dir)
+            # Keyed by rank as well, as models in different directories may
+            # share a name
+            name = os.path.basename(os.path.normpath(models[i]))
+            entry["inputs"] = write_inputs(data_all, f"./artifacts/quantization/inputs_ml_{rank}_{name}", fmt)
+        ranking.append(entry)
+        print(f"{entry['model']}: mse_q {entry['mse_q']} margin {entry['margin']}"
+              + ("" if entry["passed"] else " (fails target)"))
+
+    with open("./artifacts/quantization/batch.json", "w") as f:
+        json.dump(dict(ranking=ranking), f, indent=2)
+    return ranking
+
+
+def quantization_error_sums(X_q, Yt_q, W_q, b_q, c, verify="full", dtype=np.int64):
+    # Residual sum and floored squared-error sum of one row shard, with the
+    # verified rows checked against the circuit references like q_model.
+    # Adding them over shards and dividing once reproduces the mean error
+    # and finaldiv
+    quantization_circuit_check(X_q, W_q, b_q, Yt_q, c, verification_rows(X_q.shape[0], verify), dtype)
+    return quantization_fused_error_sums(X_q, W_q, b_q, Yt_q, c, dtype=dtype)
+
+
+def combine_error_sums(parts, m, n, z_Sq):
+    # Quantized mean error and MSE (mse.out) from per-shard sums
+    residual_sum = sum(part["residual_sum"] for part in parts)
+    squared_error_sum = sum(part["squared_error_sum"] for part in parts)
+    return residual_sum // m, (squared_error_sum + m * n * z_Sq) // (m * n)
+
+
+def witness_inputs(c, out, X_q, Yt_q, W_q=None, b_q=None, hash_input=None):
+    # Circuit inputs in the key order of q_model, or of q_dataset without a model
+    data_all = dict(
+        out=proc(int(out)),
+        sR2sSq_numerator=proc(c["sR2sSq_numerator"]),
+        sR2sSq_denominator=proc(c["sR2sSq_denominator"]),
+        z_R=proc(c["z_R"]),
+        z_Sq=proc(c["z_Sq"]),
+        Yt_q=field_elements(Yt_q),
+        sYsR_numerator=proc(c["sYsR_numerator"]),
+        sYsR_denominator=proc(c["sYsR_denominator"]),
+        sYtsR_numerator=proc(c["sYtsR_numerator"]),
+        sYtsR_denominator=proc(c["sYtsR_denominator"]),
+        constant=proc(c["constant"]),
+        X_q=field_elements(X_q),
+    )
+    if W_q is not None:
+        data_all.update(W_q=field_elements(W_q), b_q=field_elements(b_q))
+    for key in ("z_X", "z_W", "z_b", "z_Y",
+                "sbsY_numerator", "sbsY_denominator", "sXsWsY_numerator", "sXsWsY_denominator"):
+        data_all[key] = proc(c[key])
+    if hash_input is None:
+        hash_input = dataset_commitment([X_q], [Yt_q], c)
+    data_all["hash_input"] = hash_input
+    return data_all
+
+
+def shard_ranges(m, shard_rows):
+    return [(i, min(i + shard_rows, m)) for i in range(0, m, shard_rows)]
+
+
+def _quantize_block(task):
+    # Pool worker: quantizes rows i:j of the .npy at src into the shared
+    # .npy memmap at dst; nothing but the paths and row range is pickled
+    src, dst, s, z, i, j = task
+    out = np.load(dst, mmap_mode="r+")
+    out[i:j] = quantization_arb(x=np.asarray(np.load(src, mmap_mode="r")[i:j]), s=s, z=z)
+    out.flush()
+
+
+def _error_block(task):
+    # Pool worker: error sums and float reference sum of rows i:j
+    X_path, Y_path, X_q_path, Yt_q_path, W, b, W_q, b_q, c, verify, dtype, i, j = task
+    np.random.seed(i)
+    X_q = np.asarray(np.load(X_q_path, mmap_mode="r")[i:j])
+    Yt_q = np.asarray(np.load(Yt_q_path, mmap_mode="r")[i:j])
+    R = np.matmul(np.asarray(np.load(X_path, mmap_mode="r")[i:j]), W) + b - np.load(Y_path, mmap_mode="r")[i:j]
+    return quantization_error_sums(X_q, Yt_q, W_q, b_q, c, verify, dtype) + (float((R ** 2).sum()),)
+
+
+def parallel_quantized(pool, dataset, c, tmp_dir, block_rows=PARALLEL_BLOCK_ROWS):
+    # X_q and Yt_q of the dataset as .npy files in tmp_dir, filled by the
+    # pool block by block. Returns their paths
+    paths = {}
+    tasks = []
+    for name, t, src in (("X_q", "X", "X"), ("Yt_q", "Yt", "Y")):
+        x = np.load(f"{dataset}/{src}.npy", mmap_mode="r")
+        paths[name] = os.path.join(tmp_dir, f"{name}.npy")
+        np.lib.format.open_memmap(paths[name], mode="w+", dtype=np.int64, shape=x.shape).flush()
+        tasks += [(f"{dataset}/{src}.npy", paths[name], c[f"s_{t}"], c[f"z_{t}"], i, j)
+                  for i, j in shard_ranges(x.shape[0], block_rows)]
+    pool.map(_quantize_block, tasks)
+    return paths
+
+
+def quant_model_parallel(model, dataset, setting, workers, block_rows=None, verify="full", fmt="json",
+                         cache_dir=None):
+    # quant_model on a process pool: workers quantize and evaluate row blocks
+    # of the memory-mapped dataset, writing X_q/Yt_q into shared .npy
+    # memmaps (or reading the cache's), and the exact integer partial sums
+    # are merged in block order. Writes the same bytes as quant_model
+    data = json.load(open(setting, 'rb'))
+    c = quantization_constants(data)
+    m, p, n = data['m'], data['p'], data['n']
+    W = np.load(f'{model}/W.npy')
+    b = np.load(f'{model}/b.npy')
+    W_q = quantization_arb(x=W, s=c["s_W"], z=c["z_W"])
+    b_q = quantization_arb(x=b, s=c["s_b"], z=c["z_b"])
+    dtype = quantization_dtype(bound_for(c, m, p, n))
+    rows = block_rows or PARALLEL_BLOCK_ROWS
+
+    with tempfile.TemporaryDirectory() as tmp_dir, multiprocessing.Pool(workers) as pool:
+        hash_input = None
+        if cache_dir is None:
+            paths = parallel_quantized(pool, dataset, c, tmp_dir, rows)
+        else:
+            cached = cache_dataset(cache_dir, setting, dataset)
+            paths = dict(X_q=cached[1].filename, Yt_q=cached[2].filename)
+            hash_input = cached[0]["hash_input"]
+        profile_mark("quantize")
+
+        sums = pool.map(_error_block, [
+            (f"{dataset}/X.npy", f"{dataset}/Y.npy", paths["X_q"], paths["Yt_q"],
+             W, b, W_q, b_q, c, verify, dtype, i, j)
+            for i, j in shard_ranges(m, rows)
+        ])
+        # The workers' gemm, checks and error sums, seen from here
+        profile_mark("error")
+
+        parts = [dict(residual_sum=r, squared_error_sum=s) for r, s, _ in sums]
+        _, Sq_q_simulated = combine_error_sums(parts, m, n, c["z_Sq"])
+        profile_mark("mse")
+        Sq = sum(r2 for _, _, r2 in sums) / (m * n)
+        print("Mean Squared Error actual: ", Sq)
+        print("... quantized ", quantization_arb(x=Sq, s=c["s_Sq"], z=c["z_Sq"]))
+        print("Mean Squared Error simulated: ", dequantization(Sq_q_simulated, s=c["s_Sq"], z=c["z_Sq"]))
+        print("... quantized ", Sq_q_simulated)
+
+        X_q = np.load(paths["X_q"], mmap_mode="r")
+        Yt_q = np.load(paths["Yt_q"], mmap_mode="r")
+        if hash_input is None:
+            hash_input = dataset_commitment(row_blocks(X_q, rows), row_blocks(Yt_q, rows), c)
+        profile_mark("hash")
+
+        out = quantization_arb(x=data['mse_target'], s=c["s_Sq"], z=c["z_Sq"])
+        data_all = witness_inputs(c, out, X_q, Yt_q, W_q, b_q, hash_input)
+        if block_rows is not None:
+            data_all["X_q"] = (field_elements(x_q) for x_q in row_blocks(X_q, block_rows))
+            data_all["Yt_q"] = (field_elements(yt_q) for yt_q in row_blocks(Yt_q, block_rows))
+        write_inputs(data_all, "./artifacts/quantization/inputs_ml", fmt)
+        profile_mark("serialize")
+
+    return data_all
+
+
+def quant_dataset_parallel(dataset, setting, workers, block_rows=None, fmt="json", cache_dir=None):
+    # quant_dataset with the quantization of X and Yt spread over a process
+    # pool; the MiMC7 chain of hash_input stays sequential
+    data = json.load(open(setting, 'rb'))
+    c = quantization_constants(data)
+    rows = block_rows or PARALLEL_BLOCK_ROWS
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        hash_input = None
+        if cache_dir is None:
+            with multiprocessing.Pool(workers) as pool:
+                paths = parallel_quantized(pool, dataset, c, tmp_dir, rows)
+        else:
+            cached = cache_dataset(cache_dir, setting, dataset)
+            paths = dict(X_q=cached[1].filename, Yt_q=cached[2].filename)
+            hash_input = cached[0]["hash_input"]
+        profile_mark("quantize")
+
+        X_q = np.load(paths["X_q"], mmap_mode="r")
+        Yt_q = np.load(paths["Yt_q"], mmap_mode="r")
+        if hash_input is None:
+            hash_input = dataset_commitment(row_blocks(X_q, rows), row_blocks(Yt_q, rows), c)
+        profile_mark("hash")
+
+        out = quantization_arb(x=data['mse_target'], s=c["s_Sq"], z=c["z_Sq"])
+        data_all = witness_inputs(c, out, X_q, Yt_q, hash_input=hash_input)
+        if block_rows is not None:
+            data_all["X_q"] = (field_elements(x_q) for x_q in row_blocks(X_q, block_rows))
+            data_all["Yt_q"] = (field_elements(yt_q) for yt_q in row_blocks(Yt_q, block_rows))
+        write_inputs(data_all, "./artifacts/quantization/inputs_dataset", fmt)
+        profile_mark("serialize")
+
+    return data_all
+
+
+def preflight(model, dataset, setting, mse_cap=None, verify="skip", cache_dir=None):
+    # Cheap claim check before any witness or proof: the exact mse.out the
+    # circuit will compute, against the bounty's quantized mse_cap. The claim
+    # proves mse.out <= out with out the quantized mse_target, and the
+    # contract finds the bounty by out, so both must hold
+    data = json.load(open(setting, 'rb'))
+    c = quantization_constants(data)
+    if cache_dir is None:
+        X = np.load(f'{dataset}/X.npy', mmap_mode="r")
+        Y = np.load(f'{dataset}/Y.npy', mmap_mode="r")
+        X_q = quantization_blocks(X, c["s_X"], c["z_X"], CACHE_BLOCK_ROWS)
+        Yt_q = quantization_blocks(Y, c["s_Yt"], c["z_Yt"], CACHE_BLOCK_ROWS)
+    else:
+        _, X, Y = cache_dataset(cache_dir, setting, dataset)
+        X_q, Yt_q = row_blocks(X, CACHE_BLOCK_ROWS), row_blocks(Y, CACHE_BLOCK_ROWS)
+    m, p = X.shape
+    n = Y.shape[1]
+
+    assert os.path.exists(f'{model}/W.npy'), \
+        f"{model}: stacked layers can only be estimated (--mode layers), the circuit proves a single layer"
+    W_q = quantization_arb(x=np.load(f'{model}/W.npy'), s=c["s_W"], z=c["z_W"])
+    b_q = quantization_arb(x=np.load(f'{model}/b.npy'), s=c["s_b"], z=c["z_b"])
+    dtype = quantization_dtype(bound_for(c, m, p, n))
+    np.random.seed(0)
+    parts = []
+    for x_q, yt_q in zip(X_q, Yt_q):
+        quantization_circuit_check(x_q, W_q, b_q, yt_q, c, verification_rows(x_q.shape[0], verify), dtype)
+        residual_sum, squared_error_sum = quantization_fused_error_sums(x_q, W_q, b_q, yt_q, c, dtype=dtype)
+        parts.append(dict(residual_sum=residual_sum, squared_error_sum=squared_error_sum))
+    mse_q = combine_error_sums(parts, m, n, c["z_Sq"])[1]
+    profile_mark("mse")
+
+    out = int(quantization_arb(x=data['mse_target'], s=c["s_Sq"], z=c["z_Sq"]))
+    mse_cap = out if mse_cap is None else int(mse_cap)
+    result = dict(
+        model=model,
+        mse_q=mse_q,
+        out=out,
+        mse_cap=mse_cap,
+        margin=mse_cap - mse_q,
+        matches_bounty=out == mse_cap,
+        passed=mse_q <= out and out == mse_cap,
+    )
+    print(f"{model}: mse_q {mse_q} mse_cap {mse_cap} margin {result['margin']}"
+          + ("" if mse_q <= mse_cap else " (model fails the cap)")
+          + ("" if result["matches_bounty"] else f" (settings give out {out}, not the bounty's cap)"))
+    with open("./artifacts/quantization/preflight.json", "w") as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+def main():
+    # The command line. The modes kept in their own modules import this one,
+    # so they are imported here
     import argparse
+
+    try:
+        from .append import APPEND_DIR, quant_append
+        from .calibrate import calibrate
+        from .circuit_cache import circuit
+        from .service import serve
+        from .shard import combine_shards, quant_model_shards
+    except ImportError:
+        from append import APPEND_DIR, quant_append
+        from calibrate import calibrate
+        from circuit_cache import circuit
+        from service import serve
+        from shard import combine_shards, quant_model_shards
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--mode")
     parser.add_argument("--settings")
     parser.add_argument("--model")
+    parser.add_argument("--models", nargs="+")
     parser.add_argument("--dataset")
+    parser.add_argument("--verify", choices=["full", "sample", "skip"])
+    parser.add_argument("--block-rows", type=int)
+    parser.add_argument("--format", default="json", choices=["json", "compact", "binary", "container"])
+    parser.add_argument("--cache")
+    parser.add_argument("--socket")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--shard-rows", type=int)
+    parser.add_argument("--shards", nargs="+")
+    parser.add_argument("--calibration", default="minmax", choices=["minmax", "percentile"])
+    parser.add_argument("--percentile", type=float, default=99.99)
+    parser.add_argument("--out")
+    parser.add_argument("--mse-cap", type=int)
+    parser.add_argument("--build", action="store_true")
+    parser.add_argument("--hash", action="store_true")
+    parser.add_argument("--profile", default=state.PROFILE)
+    parser.add_argument("--profile-tools", nargs="*", default=state.PROFILE_TOOLS, choices=["cprofile", "tracemalloc"])
     args = parser.parse_args()
-
-    if args.mode == "model":
-        quant_model(args.model, args.dataset, args.settings)
-    elif args.mode == "dataset":
-        quant_dataset(args.dataset, args.settings)
+    state.PROFILE, state.PROFILE_TOOLS = args.profile, args.profile_tools
+    if args.dataset and args.dataset.startswith("ipfs:"):
+        # A dataset from download_dataset's cache, by CID
+        args.dataset = ipfs_dataset_dir(args.dataset[len("ipfs:"):])
+    # The pre-flight check is meant to be cheap, so it skips verification unless asked
+    args.verify = args.verify or ("skip" if args.mode == "preflight" else "full")
+
+    if args.mode == "serve":
+        # One trace per request, each overwriting the last
+        serve(args.socket, args.cache)
     else:
-        assert False
+        with profiling(mode=args.mode):
+            if args.mode == "model":
+                quant_model(args.model, args.dataset, args.settings, args.verify, args.block_rows, args.format,
+                            args.cache, args.workers)
+            elif args.mode == "layers":
+                quant_model_layers(args.model, args.dataset, args.settings, args.block_rows, args.cache)
+            elif args.mode == "dataset":
+                quant_dataset(args.dataset, args.settings, args.block_rows, args.format, args.cache, args.workers)
+            elif args.mode == "batch":
+                quant_models(args.models, args.dataset, args.settings, args.verify, args.format, args.cache)
+            elif args.mode == "shard":
+                shards = None if args.shards is None else [int(k) for k in args.shards]
+                quant_model_shards(args.model, args.dataset, args.settings, args.shard_rows, shards,
+                                   args.verify, args.cache)
+            elif args.mode == "combine":
+                combine_shards(args.shards)
+            elif args.mode == "append":
+                quant_append(args.dataset, args.settings, args.models or ([args.model] if args.model else []),
+                             args.out or APPEND_DIR, args.verify, args.hash)
+            elif args.mode == "preflight":
+                if not preflight(args.model, args.dataset, args.settings, args.mse_cap, args.verify,
+                                 args.cache)["passed"]:
+                    sys.exit(1)
+            elif args.mode == "circuit":
+                result = circuit(args.settings, args.dataset, args.build)
+                print(f"> quant_gemm_mse_enc({result['m']},{result['p']},{result['n']}): "
+                      + (os.path.dirname(result["zkey"]) if result["built"] else "not built"))
+            elif args.mode == "calibrate":
+                models = args.models or ([args.model] if args.model else [])
+                calibrate(args.dataset, models, args.settings, args.calibration, args.percentile, args.out,
+                          args.block_rows or CACHE_BLOCK_ROWS)
+            else:
+                assert False
+
+
+if __name__ == "__main__":
+    main()
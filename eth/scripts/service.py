@@ -0,0 +1,108 @@
+# Long-lived quantization service: the methods of quantize.py answered as
+# line-delimited JSON-RPC, {"id", "method", "params"} to {"id", "result"} or
+# {"id", "error"}, so callers skip the process start and file round trip.
+#   python3 scripts/quantize.py --mode serve [--socket /tmp/zkml_quantize.sock]
+import contextlib
+import io
+import json
+import os
+import socketserver
+import sys
+
+try:
+    from .quantize import (
+        dump_stream, preflight, profiling, quant_dataset, quant_model, quant_model_layers, quant_models,
+    )
+    from .append import APPEND_DIR, quant_append
+    from .circuit_cache import circuit
+except ImportError:
+    from quantize import (
+        dump_stream, preflight, profiling, quant_dataset, quant_model, quant_model_layers, quant_models,
+    )
+    from append import APPEND_DIR, quant_append
+    from circuit_cache import circuit
+
+
+def handle_request(request, cache_dir=None):
+    # One call of the quantization service, answered as a compact JSON line:
+    # {"id", "method": "model" | "layers" | "dataset" | "batch" | "preflight" | "circuit" | "append" | "ping",
+    #  "params": {...}}
+    method = request.get("method")
+    params = request.get("params", {})
+    cache_dir = params.get("cache", cache_dir)
+
+    if method == "model":
+        data_all = quant_model(
+            params["model"], params["dataset"], params["settings"],
+            params.get("verify", "full"), params.get("block_rows"), None, cache_dir, params.get("workers")
+        )
+    elif method == "layers":
+        data_all = quant_model_layers(
+            params["model"], params["dataset"], params["settings"], params.get("block_rows"), cache_dir
+        )
+    elif method == "dataset":
+        data_all = quant_dataset(
+            params["dataset"], params["settings"], params.get("block_rows"), None, cache_dir,
+            params.get("workers")
+        )
+    elif method == "batch":
+        data_all = dict(ranking=quant_models(
+            params["models"], params["dataset"], params["settings"],
+            params.get("verify", "full"), params.get("format", "json"), cache_dir
+        ))
+    elif method == "preflight":
+        data_all = preflight(
+            params["model"], params["dataset"], params["settings"], params.get("mse_cap"),
+            params.get("verify", "skip"), cache_dir
+        )
+    elif method == "circuit":
+        data_all = circuit(params["settings"], params.get("dataset"), params.get("build", False))
+    elif method == "append":
+        data_all = quant_append(
+            params["dataset"], params["settings"], params.get("models", []), params.get("state", APPEND_DIR),
+            params.get("verify", "full"), params.get("hash", False)
+        )
+    elif method == "ping":
+        data_all = {}
+    else:
+        raise ValueError(f"unknown method {method}")
+
+    f = io.StringIO()
+    dump_stream(data_all, f, indent=None)
+    return '{"id":' + json.dumps(request.get("id")) + ',"result":' + f.getvalue() + "}"
+
+
+def serve(socket_path=None, cache_dir=None):
+    # Long-lived quantization service speaking line-delimited JSON-RPC on a
+    # Unix socket, or on stdin/stdout when no socket is given. numpy, the
+    # dataset cache and the hashed dataset keys stay warm across calls.
+    def respond(line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return json.dumps(dict(id=None, error=str(e)))
+        try:
+            # Progress prints must not interleave with responses on stdout
+            with contextlib.redirect_stdout(sys.stderr), profiling(request=request):
+                return handle_request(request, cache_dir)
+        except Exception as e:
+            return json.dumps(dict(id=request.get("id"), error=repr(e)))
+
+    if socket_path is None:
+        for line in sys.stdin:
+            if line.strip():
+                sys.stdout.write(respond(line) + "\n")
+                sys.stdout.flush()
+        return
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if line.strip():
+                    self.wfile.write((respond(line) + "\n").encode())
+                    self.wfile.flush()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    with socketserver.UnixStreamServer(socket_path, Handler) as server:
+        server.serve_forever()
@@ -0,0 +1,109 @@
+# Sharded model evaluation: the dataset's rows are split into fixed-size
+# shards whose residual and squared-error sums are computed independently
+# (in separate processes or on separate machines) and merged into the
+# dataset's mse.out, exactly as a single run would compute it.
+#   python3 scripts/quantize.py --mode shard --shard-rows R [--shards 0 1 ...]
+#   python3 scripts/quantize.py --mode combine --shards shards/shard_*.json
+import json
+import os
+
+import numpy as np
+
+try:
+    from .quantize import (
+        bound_for, cache_dataset, combine_error_sums, profile_mark, quantization_arb,
+        quantization_constants, quantization_dtype, quantization_error_sums,
+        shard_ranges,
+    )
+except ImportError:
+    from quantize import (
+        bound_for, cache_dataset, combine_error_sums, profile_mark, quantization_arb,
+        quantization_constants, quantization_dtype, quantization_error_sums,
+        shard_ranges,
+    )
+
+
+def quant_model_shards(model, dataset, setting, shard_rows, shards=None, verify="full", cache_dir=None,
+                       out_dir="./artifacts/quantization/shards"):
+    # Evaluates the model on fixed-size row shards of the dataset. Every
+    # shard writes a shard_<k>.json with its partial sums, so shards can run
+    # in separate processes or on separate machines and be merged by
+    # combine_shards. Only the given shard indices are run; with all of them,
+    # the result is combined here. No witness inputs are written per shard:
+    # the bounty's out and hash_input cover the whole dataset, so only
+    # --mode model on all rows gives a claimable proof
+    data = json.load(open(setting, 'rb'))
+    c = quantization_constants(data)
+    X = np.load(f'{dataset}/X.npy', mmap_mode="r")
+    Y = np.load(f'{dataset}/Y.npy', mmap_mode="r")
+    if cache_dir is not None:
+        _, X_q_cached, Yt_q_cached = cache_dataset(cache_dir, setting, dataset)
+    m, p = X.shape
+    n = Y.shape[1]
+
+    assert os.path.exists(f'{model}/W.npy'), \
+        f"{model}: stacked layers can only be estimated (--mode layers), the circuit proves a single layer"
+    W_q = quantization_arb(x=np.load(f'{model}/W.npy'), s=c["s_W"], z=c["z_W"])
+    b_q = quantization_arb(x=np.load(f'{model}/b.npy'), s=c["s_b"], z=c["z_b"])
+    out = quantization_arb(x=data['mse_target'], s=c["s_Sq"], z=c["z_Sq"])
+    dtype = quantization_dtype(bound_for(c, m, p, n))
+
+    os.makedirs(out_dir, exist_ok=True)
+    ranges = shard_ranges(m, shard_rows)
+    parts = []
+    for k in (range(len(ranges)) if shards is None else shards):
+        i, j = ranges[k]
+        if cache_dir is None:
+            X_q = quantization_arb(x=np.asarray(X[i:j]), s=c["s_X"], z=c["z_X"])
+            Yt_q = quantization_arb(x=np.asarray(Y[i:j]), s=c["s_Yt"], z=c["z_Yt"])
+        else:
+            X_q, Yt_q = np.asarray(X_q_cached[i:j]), np.asarray(Yt_q_cached[i:j])
+
+        residual_sum, squared_error_sum = quantization_error_sums(X_q, Yt_q, W_q, b_q, c, verify, dtype)
+        part = dict(
+            index=k,
+            rows=[i, j],
+            m=m,
+            n=n,
+            z_Sq=c["z_Sq"],
+            out=int(out),
+            residual_sum=residual_sum,
+            squared_error_sum=squared_error_sum,
+        )
+        with open(f"{out_dir}/shard_{k}.json", "w") as f:
+            json.dump(part, f, indent=2)
+        parts.append(part)
+        profile_mark("shard")
+
+    if len(parts) == len(ranges):
+        return combine_shards(parts)
+    return parts
+
+
+def combine_shards(parts, path="./artifacts/quantization/shards.json"):
+    # Merges shard_<k>.json records (dicts or paths) into the dataset-wide
+    # mean error and mse.out, checking that the shards cover every row once
+    parts = [json.load(open(part, "rb")) if isinstance(part, str) else part for part in parts]
+    parts = sorted(parts, key=lambda part: part["index"])
+    m, n, z_Sq, out = parts[0]["m"], parts[0]["n"], parts[0]["z_Sq"], parts[0]["out"]
+    assert [part["index"] for part in parts] == list(range(len(parts))), "missing shards"
+    assert parts[0]["rows"][0] == 0 and parts[-1]["rows"][1] == m, "shards do not cover the dataset"
+    assert all(a["rows"][1] == b["rows"][0] for a, b in zip(parts, parts[1:])), "shards overlap"
+
+    mean_error_q, mse_q = combine_error_sums(parts, m, n, z_Sq)
+    result = dict(
+        m=m,
+        n=n,
+        shards=len(parts),
+        mean_error_q=mean_error_q,
+        mse_q=mse_q,
+        out=out,
+        margin=out - mse_q,
+        passed=mse_q <= out,
+        rows=[part["rows"] for part in parts],
+    )
+    print(f"mse_q {mse_q} over {len(parts)} shards, margin {result['margin']}"
+          + ("" if result["passed"] else " (fails target)"))
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    return result
@@ -0,0 +1,20 @@
+# state.py
+# State shared by quantize.py and the modes kept in their own modules
+# (shard.py, append.py, ...). Running quantize.py as a script loads it twice,
+# as __main__ and as quantize, so its state lives here where both copies see
+# the same one
+import os
+
+# Stage trace of every run, written as JSON to this path when set; tools may
+# add cprofile and/or tracemalloc (see quantize.profiling)
+PROFILE = os.environ.get("QUANTIZE_PROFILE")
+PROFILE_TOOLS = [t for t in os.environ.get("QUANTIZE_PROFILE_TOOLS", "").split(",") if t]
+
+# The trace being recorded, None when not profiling
+profile = None
+
+# Dataset content hashes by file stat (quantize.dataset_key)
+dataset_keys = {}
+
+# Cache entries loaded by this process, by path (quantize.cache_dataset)
+cache_entries = {}
@@ -0,0 +1,48 @@
+# The scripts are run as `python3 scripts/<name>.py` from eth/, so the tests
+# import them the same way. Each test runs in its own directory, where the
+# scripts write their ./artifacts
+import json
+import os
+import sys
+
+ETH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Witness inputs written by the baseline scripts for model/, dataset/ and
+# settings.json
+BASELINE = os.path.join(ETH, "tests", "data", "baseline")
+sys.path.insert(0, os.path.join(ETH, "scripts"))
+sys.path.insert(0, ETH)
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("artifacts/quantization")
+    return tmp_path
+
+
+@pytest.fixture
+def synthetic(workdir):
+    # dataset/, model/ and settings.json of a noisy linear model of shape
+    # (m, p, n), with the repo's quantization ranges
+    def make(m, p, n, seed=0, name=""):
+        rng = np.random.default_rng(seed)
+        X = rng.random((m, p))
+        W = rng.normal(0, 0.3, (p, n))
+        b = rng.random((1, n)) * 0.5
+        Y = np.clip(X @ W + b + rng.normal(0, 0.05, (m, n)), 0, 8)
+        dataset, model, setting = (str(workdir / f"{x}{name}") for x in ("dataset", "model", "settings.json"))
+        os.makedirs(dataset)
+        os.makedirs(model)
+        np.save(f"{dataset}/X.npy", X)
+        np.save(f"{dataset}/Y.npy", Y)
+        np.save(f"{model}/W.npy", W)
+        np.save(f"{model}/b.npy", b)
+        settings = json.load(open(f"{ETH}/settings.json"))
+        settings.update(m=m, p=p, n=n)
+        with open(setting, "w") as f:
+            json.dump(settings, f)
+        return model, dataset, setting
+    return make
@@ -0,0 +1,77 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from append import quant_append
+from quantize import preflight, quant_dataset
+
+
+def chunks(dataset, *bounds):
+    # dataset split into row ranges, as separate dataset directories
+    X, Y = np.load(f"{dataset}/X.npy"), np.load(f"{dataset}/Y.npy")
+    paths = []
+    for k, (i, j) in enumerate(zip((0,) + bounds, bounds + (len(X),))):
+        os.makedirs(f"chunk_{k}")
+        np.save(f"chunk_{k}/X.npy", X[i:j])
+        np.save(f"chunk_{k}/Y.npy", Y[i:j])
+        paths.append(f"chunk_{k}")
+    return paths
+
+
+def test_appends_match_the_full_run(synthetic):
+    model, dataset, setting = synthetic(230, 5, 2)
+    full = preflight(model, dataset, setting)
+    hash_input = quant_dataset(dataset, setting)["hash_input"]
+
+    for path in chunks(dataset, 1, 100, 101):
+        result = quant_append(path, setting, [model], hash_input=True)
+    assert result["m"] == 230
+    assert result["models"][model]["mse_q"] == full["mse_q"]
+    assert result["hash_input"] == hash_input
+    assert np.load("artifacts/quantization/append/Yt_q.npy").shape == (230, 2)
+
+
+def test_models_tracked_later_or_changed_start_over(synthetic):
+    model, dataset, setting = synthetic(150, 3, 1)
+    other, _, _ = synthetic(150, 3, 1, seed=1, name="_other")
+    first, second = chunks(dataset, 60)
+    quant_append(first, setting, [model])
+    result = quant_append(second, setting, [other])
+    for m in (model, other):
+        assert result["models"][m]["mse_q"] == preflight(m, dataset, setting)["mse_q"]
+
+    np.save(f"{model}/W.npy", np.load(f"{model}/W.npy") * 2)
+    os.makedirs("empty")
+    np.save("empty/X.npy", np.zeros((0, 3)))
+    np.save("empty/Y.npy", np.zeros((0, 1)))
+    result = quant_append("empty", setting)
+    assert result["m"] == 150 and result["models"][model]["mse_q"] == preflight(model, dataset, setting)["mse_q"]
+
+
+def test_interrupted_append_is_overwritten(synthetic):
+    model, dataset, setting = synthetic(90, 3, 1)
+    first, second = chunks(dataset, 40)
+    quant_append(first, setting, [model])
+    state = open("artifacts/quantization/append/state.json").read()
+    quant_append(second, setting, [model])
+    # The rows were written but the state was not committed
+    with open("artifacts/quantization/append/state.json", "w") as f:
+        f.write(state)
+    result = quant_append(second, setting, [model])
+    assert result["m"] == 90
+    assert result["models"][model]["mse_q"] == preflight(model, dataset, setting)["mse_q"]
+
+
+def test_settings_and_columns_must_match(synthetic):
+    model, dataset, setting = synthetic(30, 3, 1)
+    quant_append(dataset, setting, [model])
+    _, wide, _ = synthetic(30, 4, 1, name="_wide")
+    with pytest.raises(AssertionError, match="columns"):
+        quant_append(wide, setting)
+    with open(setting, "a") as f:
+        f.write("\n")
+    with pytest.raises(AssertionError, match="settings changed"):
+        quant_append(dataset, setting)
+    assert json.load(open("artifacts/quantization/append/state.json"))["m"] == 30
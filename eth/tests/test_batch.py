@@ -0,0 +1,49 @@
+import json
+import os
+
+import numpy as np
+
+from quantize import preflight, quant_model, quant_models
+
+
+def test_ranking_matches_single_runs(synthetic):
+    model, dataset, setting = synthetic(150, 5, 2)
+    models = [model]
+    for k, scale in enumerate((3.0, 0.0, 1.5)):
+        os.makedirs(f"model_{k}")
+        np.save(f"model_{k}/W.npy", np.load(f"{model}/W.npy") * scale)
+        np.save(f"model_{k}/b.npy", np.load(f"{model}/b.npy"))
+        models.append(f"model_{k}")
+
+    ranking = quant_models(models, dataset, setting)
+    single = {m: preflight(m, dataset, setting, verify="full") for m in models}
+    assert sorted(e["model"] for e in ranking) == sorted(models)
+    assert [e["mse_q"] for e in ranking] == sorted(e["mse_q"] for e in ranking)
+    for entry in ranking:
+        assert entry["mse_q"] == single[entry["model"]]["mse_q"]
+        assert entry["passed"] == single[entry["model"]]["passed"]
+        assert (entry["inputs"] is not None) == entry["passed"]
+        if entry["passed"]:
+            assert entry["inputs"].endswith(".json") and os.path.exists(entry["inputs"])
+    assert {e["passed"] for e in ranking} == {True, False}
+    assert json.load(open("artifacts/quantization/batch.json"))["ranking"] == ranking
+
+
+def test_same_named_models_keep_their_inputs(synthetic):
+    # a/model and b/model both pass; neither overwrites the other's inputs
+    model, dataset, setting = synthetic(40, 4, 1)
+    for d, scale in (("a", 0.9), ("b", 0.85)):
+        os.makedirs(f"{d}/model")
+        np.save(f"{d}/model/W.npy", np.load(f"{model}/W.npy") * scale)
+        np.save(f"{d}/model/b.npy", np.load(f"{model}/b.npy"))
+
+    ranking = quant_models(["a/model", "b/model"], dataset, setting, fmt="container")
+    assert all(e["passed"] for e in ranking)
+    assert len({e["inputs"] for e in ranking}) == 2
+    for entry in ranking:
+        assert entry["inputs"].endswith(".zkq")
+        with open(entry["inputs"], "rb") as f:
+            written = f.read()
+        quant_model(entry["model"], dataset, setting, fmt="container")
+        with open("artifacts/quantization/inputs_ml.zkq", "rb") as f:
+            assert written == f.read()
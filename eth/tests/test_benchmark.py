@@ -0,0 +1,27 @@
+import json
+import os
+
+from benchmark import benchmark, compare
+from conftest import ETH
+
+
+def test_stages_per_shape(capsys):
+    os.makedirs("circuits")
+    report = benchmark(["20,4,1", "30,3,2"], f"{ETH}/settings.json", "results.json", "circuits", workdir="bench")
+    capsys.readouterr()
+    assert json.load(open("results.json")) == report
+
+    stages = [(r["m"], r["p"], r["n"], r["stage"]) for r in report["results"]]
+    assert stages == [shape + (stage,) for shape in ((20, 4, 1), (30, 3, 2))
+                      for stage in ("quant_dataset", "quant_model", "serialize", "witness", "groth16")]
+    for r in report["results"]:
+        if r["stage"] in ("witness", "groth16"):
+            assert r["skipped"] == "no circuit compiled for this shape"
+        else:
+            assert r["seconds"] > 0 and r["peak_rss"] > 0
+    inputs = json.load(open("bench/30_3_2/artifacts/quantization/inputs_ml.json"))
+    assert len(inputs["X_q"]) == 30 and len(inputs["W_q"][0]) == 2
+
+    compare("results.json", "results.json")
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1 + 6 and all(line.split()[-1] == "1.00" for line in lines[1:])
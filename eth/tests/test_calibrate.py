@@ -0,0 +1,44 @@
+import numpy as np
+
+from calibrate import CALIBRATION_SAMPLE, calibrate, calibration_range, calibration_update
+from quantize import preflight
+
+
+def test_minmax_ranges_never_clip(synthetic):
+    model, dataset, setting = synthetic(200, 5, 2)
+    settings, report = calibrate(dataset, [model], setting, out="calibrated.json")
+    for t, r in report["tensors"].items():
+        assert r["clip_rate"] == 0.0
+        assert r["alpha"] <= min(r["min"], 0) and r["beta"] >= max(r["max"], 0)
+    assert (settings["m"], settings["p"], settings["n"]) == (200, 5, 2)
+
+    # The reported mse_q is the one a claim with the calibrated settings proves
+    [entry] = report["models"]
+    assert entry["mse_q"] == preflight(model, dataset, "calibrated.json")["mse_q"]
+    assert abs(entry["relative_error"]) < 0.05
+
+    _, blocked = calibrate(dataset, [model], setting, block_rows=7)
+    assert blocked["models"] == report["models"]
+
+
+def test_percentile_ranges_stay_inside_minmax(synthetic):
+    model, dataset, setting = synthetic(500, 3, 1)
+    _, minmax = calibrate(dataset, [model], setting)
+    _, report = calibrate(dataset, [model], setting, method="percentile", percentile=99)
+    for t in ("X", "Y", "Yt", "R"):
+        r, full = report["tensors"][t], minmax["tensors"][t]
+        assert full["alpha"] <= r["alpha"] and r["beta"] <= full["beta"]
+        assert 0 < r["clip_rate"] < 0.03
+
+
+def test_reservoir_sample():
+    stats = dict(min=np.inf, max=-np.inf, sample=np.empty(0), seen=0)
+    rng = np.random.default_rng(0)
+    values = np.arange(3 * CALIBRATION_SAMPLE, dtype=np.float64)
+    for block in np.array_split(values, 7):
+        calibration_update(stats, block, rng)
+    assert stats["seen"] == values.size and stats["sample"].size == CALIBRATION_SAMPLE
+    assert (stats["min"], stats["max"]) == (0, values[-1])
+    # Uniform over everything seen, not just the first blocks
+    assert abs(stats["sample"].mean() - values.mean()) < 0.02 * values.mean()
+    assert calibration_range(stats) == (0.0, values[-1])
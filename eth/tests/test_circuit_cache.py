@@ -0,0 +1,58 @@
+import os
+import shutil
+
+import pytest
+
+from circuit_cache import CIRCUIT_SOURCES, CIRCUITS_DIR, circuit_artifacts, circuit_shape, circuit_source_hash
+
+
+@pytest.fixture
+def circuits(workdir):
+    # The circuit sources, without any build
+    for name in CIRCUIT_SOURCES:
+        os.makedirs(os.path.dirname(f"circuits/{name}"), exist_ok=True)
+        shutil.copyfile(os.path.join(CIRCUITS_DIR, name), f"circuits/{name}")
+    return str(workdir / "circuits")
+
+
+def edit(path, old, new):
+    source = open(path).read()
+    assert old in source
+    with open(path, "w") as f:
+        f.write(source.replace(old, new))
+
+
+def test_source_hash_ignores_the_shape(circuits):
+    digest = circuit_source_hash(circuits)
+    edit(f"{circuits}/lr/circuit.circom", "quant_gemm_mse_enc(20,4,1)", "quant_gemm_mse_enc(30,5,2)")
+    assert circuit_source_hash(circuits) == digest
+    with open(f"{circuits}/math/circuit.circom", "a") as f:
+        f.write("\n// changed\n")
+    assert circuit_source_hash(circuits) != digest
+
+
+def test_only_the_prebuilt_shape_is_claimable(circuits):
+    cached = circuit_artifacts(20, 4, 1, cache_dir="shapes", circuits_dir=circuits)
+    assert cached["key"] == f"20_4_1-{circuit_source_hash(circuits)[:16]}" and not cached["built"]
+
+    os.makedirs(f"{circuits}/artifacts")
+    open(f"{circuits}/artifacts/lr.zkey", "w").close()
+    assert circuit_artifacts(20, 4, 1, cache_dir="shapes", circuits_dir=circuits)["key"] == "lr"
+
+    other = circuit_artifacts(40, 4, 1, cache_dir="shapes", circuits_dir=circuits)
+    assert other["key"] != "lr" and not other["built"]
+    os.makedirs(f"shapes/{other['key']}")
+    open(other["zkey"], "w").close()
+    assert circuit_artifacts(40, 4, 1, cache_dir="shapes", circuits_dir=circuits)["built"]
+
+
+def test_shapes_beyond_the_ptau_are_not_built(circuits):
+    open(f"{circuits}/pot_final_12.ptau", "w").close()
+    with pytest.raises(AssertionError, match="2\\^12"):
+        circuit_artifacts(1000, 4, 1, build=True, cache_dir="shapes", circuits_dir=circuits)
+    assert not os.path.exists("shapes")
+
+
+def test_shape_from_the_dataset(synthetic):
+    model, dataset, setting = synthetic(33, 5, 2)
+    assert circuit_shape(setting) == circuit_shape(setting, dataset) == (33, 5, 2)
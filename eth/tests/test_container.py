@@ -0,0 +1,46 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from conftest import BASELINE, ETH
+from quantize import CONTAINER_ALIGN, P, dump_container, field_elements, load_container, quant_model
+
+
+@pytest.mark.parametrize("block_rows", [None, 7])
+@pytest.mark.parametrize("mmap", [True, False])
+def test_round_trip_matches_the_baseline(block_rows, mmap):
+    quant_model(f"{ETH}/model", f"{ETH}/dataset", f"{ETH}/settings.json", block_rows=block_rows, fmt="container")
+    data = load_container("artifacts/quantization/inputs_ml.zkq", mmap)
+    expected = json.load(open(f"{BASELINE}/inputs_ml.json"))
+    assert list(data) == list(expected) + ["hash_input"]
+    for key, value in expected.items():
+        assert field_elements(data[key]).tolist() == value, key
+    assert isinstance(data["X_q"], np.memmap) == mmap
+
+
+def test_negatives_and_alignment():
+    # W_q as field elements (P + x), b_q as signed values
+    W_q = np.array([[-3, 5], [7, -2 ** 40]])
+    with pytest.warns(UserWarning, match="negative"):
+        encoded = field_elements(W_q)
+    data_all = dict(out=12, X_q=np.arange(15).reshape(5, 3), W_q=encoded, b_q=np.array([[-1, 1]]),
+                    z_X=-4, sbsY_numerator=3, sbsY_denominator=2 ** 60, hash_input=P - 1)
+    f = io.BytesIO()
+    tensors = dump_container(data_all, f)
+    assert all(t["offset"] % CONTAINER_ALIGN == 0 for t in tensors.values())
+
+    with open("inputs.zkq", "wb") as out:
+        out.write(f.getvalue())
+    data = load_container("inputs.zkq")
+    assert list(data) == list(data_all)
+    assert data["W_q"].tolist() == W_q.tolist() and data["b_q"].tolist() == [[-1, 1]]
+    assert (data["z_X"], data["sbsY_denominator"], data["hash_input"]) == (-4, 2 ** 60, P - 1)
+
+
+def test_rejects_other_files():
+    with open("inputs.zkq", "wb") as f:
+        f.write(b"\0" * 64)
+    with pytest.raises(AssertionError, match="not a quantized container"):
+        load_container("inputs.zkq")
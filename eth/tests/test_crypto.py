@@ -0,0 +1,51 @@
+# MiMC7 against the circomlib / go-iden3-crypto test vectors, BLAKE-512
+# against the vectors of the BLAKE submission, and Baby Jubjub ECDH against
+# the repo's keypair
+import json
+
+import numpy as np
+
+from conftest import ETH
+from ecdh import A, D, P, blake512, public_key, shared_key
+from mimc7 import mimc7_hash, mimc7_multi_hash
+
+
+def test_mimc7_vectors():
+    assert mimc7_hash(1, 2) == 10594780656576967754230020536574539122676596303354946869887184401991294982664
+    assert mimc7_multi_hash([12]) == 0x237c92644dbddb86d8a259e0e923aaab65a93f1ec5758b8799988894ac0958fd
+    assert mimc7_multi_hash([78, 41]) == 0x067f3202335ea256ae6e6aadcd2d5f7f4b06a00b2d1e0de903980d5ab552dc70
+    assert mimc7_multi_hash([12, 45]) == 0x15ff7fe9793346a17c3150804bcb36d161c8662b110c50f55ccb7113948d8879
+    assert mimc7_multi_hash([12, 45, 78, 41]) == 0x284bc1f34f335933a23a433b6ff3ee179d682cd5e5e2fcdd2d964afa85104beb
+
+
+def test_mimc7_chains_and_vectorizes():
+    assert mimc7_multi_hash([78, 41], mimc7_multi_hash([12, 45])) == mimc7_multi_hash([12, 45, 78, 41])
+    x = np.array([1, 12, 78, P - 1], dtype=object)
+    k = np.array([2, 45, 41, 0], dtype=object)
+    assert list(mimc7_hash(x, k)) == [mimc7_hash(int(a), int(b)) for a, b in zip(x, k)]
+
+
+def test_blake512_vectors():
+    assert blake512(b"").hex() == (
+        "a8cfbbd73726062df0c6864dda65defe58ef0cc52a5625090fa17601e1eecd1b"
+        "628e94f396ae402a00acc9eab77b4d4c2e852aaaa25a636d80af3fc7913ef5b8"
+    )
+    assert blake512(b"\0").hex() == (
+        "97961587f6d970faba6d2478045de6d1fabd09b61ae50932054d52bc29d31be4"
+        "ff9102b9f69e2bbdb83be13d4b9c06091e5fa0b48bd081b634058be0ec49beb3"
+    )
+    assert blake512(bytes(144)).hex() == (
+        "313717d608e9cf758dcb1eb0f0c3cf9fc150b2d500fb33f51c52afc99d358a2f"
+        "1374b8a38bba7974e7f6ef79cab16f22ce1e649d6e01ad9589c213045d545dde"
+    )
+
+
+def test_ecdh_keypair():
+    private = int(json.load(open(f"{ETH}/keys/out_private.json")))
+    public = tuple(int(v) for v in json.load(open(f"{ETH}/keys/out_public.json")))
+    assert public_key(private) == public
+    x, y = public
+    assert (A * x * x + y * y - 1 - D * x * x * y * y) % P == 0
+
+    other = 123456789
+    assert shared_key(private, public_key(other)) == shared_key(other, public)
@@ -0,0 +1,125 @@
+import json
+import os
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from conftest import ETH
+from decrypt import decrypt
+from ecdh import public_key, shared_key
+from mimc7 import C
+from quantize import P, quant_model
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+
+# Runs claimInput from hardhat.config.js on quantize.py's witness inputs. With
+# eth/node_modules installed it uses maci-domainobjs and circomlib; without,
+# stand-ins with the same interface, a MiMC7 on the Python round constants
+# and a Keypair of a fixed claimer key
+CLAIM_INPUT = r"""
+const fs = require("fs");
+const { createRequire } = require("module");
+const [eth, inputs, issuer, stubs] = process.argv.slice(2);
+
+const src = fs.readFileSync(eth + "/hardhat.config.js", "utf8");
+const start = src.indexOf("function claimInput(");
+const source = src.slice(start, src.indexOf("\n}\n", start) + 3);
+
+var load = createRequire(eth + "/hardhat.config.js");
+if (!fs.existsSync(eth + "/node_modules/maci-domainobjs")) {
+  const stub = JSON.parse(fs.readFileSync(stubs));
+  const P = BigInt(stub.P), C = stub.C.map(BigInt);
+  const mod = (x) => ((x % P) + P) % P;
+  const pow7 = (x) => { const x2 = x * x % P, x4 = x2 * x2 % P; return x4 * x2 % P * x % P; };
+  const mimc7 = {
+    hash(x, k) {
+      x = mod(BigInt(x)); k = mod(BigInt(k));
+      let r = 0n;
+      for (let i = 0; i < C.length; i++) r = pow7(i ? r + k + C[i] : x + k);
+      return mod(r + k);
+    },
+    multiHash(arr, key) {
+      let r = mod(BigInt(key));
+      for (const x of arr) r = mod(r + BigInt(x) + mimc7.hash(x, r));
+      return r;
+    },
+  };
+  class Keypair {
+    constructor() {
+      const priv = BigInt(stub.private_key), pub = stub.public_key.map(BigInt);
+      this.privKey = { rawPrivKey: priv, asCircuitInputs: () => priv.toString() };
+      this.pubKey = { rawPubKey: pub, asCircuitInputs: () => pub.map(String) };
+    }
+    static genEcdhSharedKey(privKey, pubKey) {
+      if (privKey.rawPrivKey !== BigInt(stub.private_key) || pubKey.rawPubKey.join() !== stub.issuer.join()) {
+        throw new Error("unexpected keys");
+      }
+      return BigInt(stub.shared_key);
+    }
+  }
+  load = (name) => name === "maci-domainobjs" ? { Keypair } : name.endsWith("mimc7.js") ? mimc7 : require(name);
+}
+
+const claimInput = new Function("require", source + "return claimInput;")(load);
+const { key, input } = claimInput(JSON.parse(fs.readFileSync(inputs)), issuer);
+console.log(JSON.stringify({ input, public_key: key.pubKey.rawPubKey }, (k, v) => typeof v === "bigint" ? v.toString() : v));
+"""
+
+CLAIMER_PRIVATE_KEY = 123456789
+
+
+def claim_input(inputs, workdir):
+    issuer = f"{ETH}/keys/out_public.json"
+    stubs = dict(
+        P=str(P), C=[str(c) for c in C],
+        private_key=str(CLAIMER_PRIVATE_KEY),
+        public_key=[str(v) for v in public_key(CLAIMER_PRIVATE_KEY)],
+        issuer=json.load(open(issuer)),
+        shared_key=str(shared_key(CLAIMER_PRIVATE_KEY, json.load(open(issuer)))),
+    )
+    with open(workdir / "stubs.json", "w") as f:
+        json.dump(stubs, f)
+    with open(workdir / "claim_input.js", "w") as f:
+        f.write(CLAIM_INPUT)
+    out = subprocess.run(["node", str(workdir / "claim_input.js"), ETH, inputs, issuer, str(workdir / "stubs.json")],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+def signed(x):
+    x = np.array(x, dtype=object).astype(object)
+    x = np.vectorize(int, otypes=[object])(x)
+    x[x > P // 2] -= P
+    return x.astype(np.int64)
+
+
+@pytest.mark.parametrize("n", [1, 3])
+def test_claim_input_decrypts(synthetic, workdir, n):
+    model, dataset, setting = synthetic(40, 6, n)
+    quant_model(model, dataset, setting)
+    inputs = "artifacts/quantization/inputs_ml.json"
+    data = json.load(open(inputs))
+    claim = claim_input(inputs, workdir)
+
+    W_q_enc, b_q_enc = claim["input"]["W_q_enc"], claim["input"]["b_q_enc"]
+    assert np.array(W_q_enc).shape == (6, n, 2)
+    assert np.array(b_q_enc).shape == (n, 2)
+
+    # The public signals the circuit outputs: out, hash_input, X_q, W_q_enc,
+    # b_q_enc, public_key, ... reduced mod P; decrypt reads only up to b_q_enc
+    signals = [data["out"], data["hash_input"]] + np.array(data["X_q"], dtype=object).ravel().tolist()
+    signals += [int(v) % P for v in np.array(W_q_enc, dtype=object).ravel()]
+    signals += [int(v) % P for v in np.array(b_q_enc, dtype=object).ravel()]
+    signals += claim["input"]["public_key"]
+    with open("claim.json", "w") as f:
+        json.dump(dict(public_key=claim["public_key"], signals=[str(v) for v in signals]), f)
+
+    [decrypted] = decrypt(["claim.json"], setting, f"{ETH}/keys/out_private.json", "decrypt")
+    assert (decrypted["W_q"] == signed(data["W_q"])).all()
+    assert (decrypted["b_q"] == signed(data["b_q"])).all()
+    assert np.load("decrypt/claim/W.npy").shape == (6, n)
+    assert np.load("decrypt/claim/b.npy").shape == (1, n)
+    assert np.abs(np.load("decrypt/claim/W.npy") - np.load(f"{model}/W.npy")).max() < 0.01
+    assert os.path.exists("decrypt/models.json")
@@ -0,0 +1,40 @@
+import json
+import re
+
+from conftest import ETH
+from estimate import DEFAULT_FIT, constraint_breakdown, estimate, fit_benchmarks, largest_m, load_fit, public_inputs
+
+
+def test_public_inputs_match_the_deployed_verifier():
+    source = open(f"{ETH}/contracts/libraries/BountyManagerV2.sol").read()
+    assert f"uint[{public_inputs(20, 4, 1)}] memory input" in source
+
+
+def test_largest_m_is_the_edge_of_the_ptau():
+    for p, n, power in ((4, 1, 18), (16, 1, 18), (4, 4, 20)):
+        m = largest_m(p, n, ptau_power=power)
+        assert estimate(m, p, n, ptau_power=power)["fits"]
+        assert not estimate(m + 1, p, n, ptau_power=power)["fits"]
+        assert estimate(m + 1, p, n)["constraints"] > estimate(m, p, n)["constraints"]
+
+
+def test_fit_recovers_the_measured_scale():
+    shapes = [(20, 4, 1), (100, 4, 1), (50, 8, 2)]
+    results = []
+    for m, p, n in shapes:
+        constraints = int(1.5 * sum(constraint_breakdown(m, p, n).values()))
+        domain = 2 ** (constraints + public_inputs(m, p, n)).bit_length()
+        results.append(dict(m=m, p=p, n=n, stage="groth16", constraints=constraints, wires=2 * constraints,
+                            public_inputs=public_inputs(m, p, n),
+                            seconds=DEFAULT_FIT["seconds_offset"] + 1e-5 * domain))
+    with open("results.json", "w") as f:
+        json.dump(dict(results=results), f)
+
+    fit = fit_benchmarks("results.json", "fit.json")
+    assert abs(fit["constraint_scale"] - 1.5) < 1e-3 and fit["wire_scale"] == 2
+    assert abs(fit["seconds_per_point"] - 1e-5) < 1e-9
+    assert load_fit("fit.json") == fit
+    assert load_fit("missing.json") == DEFAULT_FIT
+
+    m, p, n = shapes[1]
+    assert estimate(m, p, n, fit)["constraints"] == results[1]["constraints"]
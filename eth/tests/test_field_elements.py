@@ -0,0 +1,60 @@
+import warnings
+
+import numpy as np
+
+from quantize import P, field_bytes, field_elements, proc
+
+VALUES = [0, 1, 7, 2 ** 40, 2 ** 63 - 1]
+NEGATIVE = [-1, -7, -2 ** 40, -2 ** 63]
+
+
+def baseline_proc(l):
+    # proc as it was before field_elements
+    def proc_int(x):
+        if x < 0:
+            return P - x
+        return int(x)
+    if type(l) is int: return proc_int(l)
+    elif type(l[0]) is int: return [proc_int(x) for x in l]
+    return [[proc_int(x) for x in j] for j in l]
+
+
+def test_non_negative_matches_baseline():
+    assert proc(VALUES) == baseline_proc(VALUES)
+    assert proc([VALUES, VALUES[::-1]]) == baseline_proc([VALUES, VALUES[::-1]])
+    assert proc(12888) == baseline_proc(12888)
+
+
+def test_negative_is_x_mod_p():
+    # The baseline wrote P - x, which is |x| mod P: the sign was lost. Negatives
+    # are now P + x, the field element the circuit reads as x
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        new = proc(NEGATIVE)
+        nested = proc([NEGATIVE, VALUES[:4]])
+    old = baseline_proc(NEGATIVE)
+    assert new == [x % P for x in NEGATIVE]
+    assert old == [P - x for x in NEGATIVE]
+    assert [a + b for a, b in zip(new, old)] == [2 * P] * len(NEGATIVE)
+    assert nested == [[x % P for x in NEGATIVE], VALUES[:4]]
+
+
+def test_negative_warns_and_rejects_floats():
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        field_elements(np.array([-1, 2]))
+    assert caught
+    try:
+        field_elements(np.array([0.5]))
+    except AssertionError:
+        return
+    assert False, "floats must be rejected"
+
+
+def test_field_bytes_little_endian():
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        data = field_bytes(np.array([1, -1, 2 ** 63 - 1]))
+    assert len(data) == 96
+    assert [int.from_bytes(data[i:i + 32], "little") for i in range(0, 96, 32)] == [1, P - 1, 2 ** 63 - 1]
+    assert field_bytes(np.array([[3, 4]])) == (3).to_bytes(32, "little") + (4).to_bytes(32, "little")
@@ -0,0 +1,72 @@
+import base64
+import json
+import os
+import subprocess
+import sys
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from conftest import BASELINE, ETH
+from ipfs_gateway import add, handler
+from quantize import IPFS_FILES, dataset_hash, ipfs_dataset, ipfs_dataset_dir
+
+
+def cache(cid, dataset, cache_dir="ipfs"):
+    # The cache entry download_dataset writes: the files and their manifest
+    os.makedirs(f"{cache_dir}/{cid}")
+    files = {}
+    for name in IPFS_FILES:
+        data = open(f"{dataset}/{name}", "rb").read()
+        with open(f"{cache_dir}/{cid}/{name}", "wb") as f:
+            f.write(data)
+        files[name] = dict(size=len(data), sha256=dataset_hash([f"{dataset}/{name}"]))
+    with open(f"{cache_dir}/{cid}/manifest.json", "w") as f:
+        json.dump(dict(cid=cid, files=files), f)
+
+
+def test_gateway_streams_base64_chunks():
+    cid = add(f"{ETH}/dataset", "root")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler(os.path.abspath("root")))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/api/v0/cat?arg={cid}/X.npy"
+        body = urllib.request.urlopen(urllib.request.Request(url, data=b"", method="POST")).read()
+        assert base64.b64decode(body) == open(f"{ETH}/dataset/X.npy", "rb").read()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(urllib.request.Request(url.replace("X.npy", "../../x"), data=b""))
+    finally:
+        server.shutdown()
+
+
+def test_cached_dataset_is_checked_against_its_manifest():
+    cache("bafy", f"{ETH}/dataset")
+    X, Y = ipfs_dataset("bafy", "ipfs", verify=True)
+    assert (X == np.load(f"{ETH}/dataset/X.npy")).all() and (Y == np.load(f"{ETH}/dataset/Y.npy")).all()
+
+    with pytest.raises(AssertionError, match="not cached"):
+        ipfs_dataset_dir("other", "ipfs")
+    with open("ipfs/bafy/Y.npy", "r+b") as f:
+        f.seek(-1, 2)
+        f.write(b"\x7f")
+    ipfs_dataset_dir("bafy", "ipfs")
+    with pytest.raises(AssertionError, match="sha256"):
+        ipfs_dataset_dir("bafy", "ipfs", verify=True)
+    with open("ipfs/bafy/X.npy", "r+b") as f:
+        f.truncate(100)
+    with pytest.raises(AssertionError, match="bytes, expected"):
+        ipfs_dataset_dir("bafy", "ipfs")
+
+
+def test_command_line_reads_datasets_by_cid():
+    cache("bafy", f"{ETH}/dataset")
+    subprocess.run([sys.executable, f"{ETH}/scripts/quantize.py", "--mode", "model", "--model", f"{ETH}/model",
+                    "--dataset", "ipfs:bafy", "--settings", f"{ETH}/settings.json"],
+                   env=dict(os.environ, IPFS_CACHE="ipfs"), check=True, capture_output=True)
+    data = json.load(open("artifacts/quantization/inputs_ml.json"))
+    data.pop("hash_input")
+    assert data == json.load(open(f"{BASELINE}/inputs_ml.json"))
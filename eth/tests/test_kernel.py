@@ -0,0 +1,82 @@
+# The fused blocked kernel against the stepwise functions it replaced and
+# their circuit mirrors
+import json
+
+import numpy as np
+import pytest
+
+from quantize import (
+    ALPHA_Q, BETA_Q, quant_matmul_circuit, quant_mse, quantization_arb, quantization_batch_mse,
+    quantization_constants, quantization_error, quantization_fused_error_sums,
+    quantization_layer_constants, quantization_matrix_multiplication_arb, quantization_squared_error_sum,
+)
+
+
+def quantized(synthetic, m, p, n):
+    model, dataset, setting = synthetic(m, p, n)
+    c = quantization_constants(json.load(open(setting)))
+    return (
+        quantization_arb(x=np.load(f"{dataset}/X.npy"), s=c["s_X"], z=c["z_X"]),
+        quantization_arb(x=np.load(f"{model}/W.npy"), s=c["s_W"], z=c["z_W"]),
+        quantization_arb(x=np.load(f"{model}/b.npy"), s=c["s_b"], z=c["z_b"]),
+        quantization_arb(x=np.load(f"{dataset}/Y.npy"), s=c["s_Yt"], z=c["z_Yt"]),
+        c,
+    )
+
+
+def stepwise(X_q, W_q, b_q, Yt_q, c, dtype=np.int64):
+    Y_q = quantization_matrix_multiplication_arb(
+        X_q, W_q, b_q, c["s_X"], c["z_X"], c["s_W"], c["z_W"], c["s_b"], c["z_b"], c["s_Y"], c["z_Y"], dtype
+    )[0]
+    R_q = quantization_error(Y_q, Yt_q, c["s_R"], c["z_R"], c["s_Y"], c["z_Y"], c["s_Yt"], c["z_Yt"], dtype)[0]
+    return Y_q, R_q, quantization_squared_error_sum(R_q, c["s_R"], c["s_Sq"], c["z_R"], dtype)
+
+
+@pytest.mark.parametrize("block_rows", [1, 7, 64, 4096])
+@pytest.mark.parametrize("dtype", [np.int64, object])
+def test_fused_matches_stepwise(synthetic, block_rows, dtype):
+    X_q, W_q, b_q, Yt_q, c = quantized(synthetic, 301, 6, 3)
+    m, n = Yt_q.shape
+    Y_q, R_q, squared_error_sum = stepwise(X_q, W_q, b_q, Yt_q, c)
+
+    fused = quantization_fused_error_sums(X_q, W_q, b_q, Yt_q, c, block_rows, dtype)
+    assert fused == (int(R_q.sum()), int(squared_error_sum))
+    assert (fused[1] + m * n * c["z_Sq"]) // (m * n) == quant_mse(
+        R_q, c["s_R"], c["s_Sq"], c["z_R"], c["z_Sq"], m, n
+    )
+    assert (Y_q == quant_matmul_circuit(
+        X_q, W_q, b_q, c["z_X"], c["z_W"], c["z_b"], c["z_Y"], m, n, W_q.shape[0],
+        c["sbsY_numerator"], c["sbsY_denominator"], c["sXsWsY_numerator"], c["sXsWsY_denominator"],
+    )).all()
+
+
+def test_batched_models_match_fused(synthetic):
+    X_q, W_q, b_q, Yt_q, c = quantized(synthetic, 120, 5, 2)
+    m, n = Yt_q.shape
+    Ws = np.stack([W_q, W_q[::-1], np.full_like(W_q, c["z_W"])])
+    bs = np.stack([b_q, b_q, b_q])
+    expected = [
+        (quantization_fused_error_sums(X_q, w, b, Yt_q, c)[1] + m * n * c["z_Sq"]) // (m * n)
+        for w, b in zip(Ws, bs)
+    ]
+    assert quantization_batch_mse(X_q, Ws, bs, Yt_q, c).tolist() == expected
+
+
+def test_hidden_layer_is_requantized_between_gemms(synthetic):
+    X_q, W_q, b_q, Yt_q, c = quantized(synthetic, 90, 4, 2)
+    settings = dict(alpha_W=-1, beta_W=1, alpha_b=-1, beta_b=1, alpha_Y=-2, beta_Y=6)
+    lc = quantization_layer_constants(c["s_X"], c["z_X"], settings)
+    rng = np.random.default_rng(1)
+    W1 = quantization_arb(x=rng.normal(0, 0.4, (4, 4)), s=lc["s_W"], z=lc["z_W"])
+    b1 = quantization_arb(x=rng.normal(0, 0.2, (1, 4)), s=lc["s_b"], z=lc["z_b"])
+    H_q = quantization_matrix_multiplication_arb(
+        X_q, W1, b1, lc["s_X"], lc["z_X"], lc["s_W"], lc["z_W"], lc["s_b"], lc["z_b"], lc["s_Y"], lc["z_Y"]
+    )[0]
+    H_q = np.clip(H_q, ALPHA_Q, BETA_Q)
+
+    c = dict(c, **quantization_layer_constants(lc["s_Y"], lc["z_Y"], json.load(open("settings.json"))))
+    _, R_q, squared_error_sum = stepwise(H_q, W_q, b_q, Yt_q, c)
+    for block_rows in (1, 16, 4096):
+        assert quantization_fused_error_sums(X_q, W_q, b_q, Yt_q, c, block_rows, hidden=[(W1, b1, lc)]) == (
+            int(R_q.sum()), int(squared_error_sum)
+        )
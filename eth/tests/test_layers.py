@@ -0,0 +1,47 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from conftest import ETH
+from quantize import preflight, quant_model, quant_model_layers
+
+
+def stacked(model, setting):
+    # model as two layers, an identity first, with the same ranges for both
+    W, b = np.load(f"{model}/W.npy"), np.load(f"{model}/b.npy")
+    shutil.rmtree(model)
+    os.makedirs(model)
+    np.save(f"{model}/W_0.npy", np.eye(W.shape[0]))
+    np.save(f"{model}/b_0.npy", np.zeros((1, W.shape[0])))
+    np.save(f"{model}/W_1.npy", W)
+    np.save(f"{model}/b_1.npy", b)
+    settings = json.load(open(setting))
+    settings["layers"] = [{k: settings[k] for k in settings if k[-2:] in ("_W", "_b") or k in ("alpha_Y", "beta_Y")}]
+    with open(setting, "w") as f:
+        json.dump(settings, f)
+
+
+def test_stacked_layers_are_estimate_only(synthetic):
+    model, dataset, setting = synthetic(30, 4, 2)
+    stacked(model, setting)
+
+    result = quant_model_layers(model, dataset, setting)
+    assert result["estimate_only"]
+    assert result["shapes"] == [[4, 4], [4, 2]]
+    assert json.load(open("artifacts/quantization/layers.json")) == json.loads(json.dumps(result))
+    assert not os.path.exists("artifacts/quantization/inputs_ml.json")
+
+    with pytest.raises(AssertionError, match="stacked layers"):
+        quant_model(model, dataset, setting)
+    with pytest.raises(AssertionError, match="stacked layers"):
+        preflight(model, dataset, setting)
+
+    # The command line fails too, instead of exiting 0 without inputs
+    run = subprocess.run([sys.executable, f"{ETH}/scripts/quantize.py", "--mode", "model", "--model", model,
+                          "--dataset", dataset, "--settings", setting], capture_output=True, text=True)
+    assert run.returncode != 0 and "--mode layers" in run.stderr
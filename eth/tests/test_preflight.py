@@ -0,0 +1,36 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from conftest import ETH
+from quantize import preflight, quant_models
+
+QUANTIZE = os.path.join(ETH, "scripts", "quantize.py")
+
+
+def test_preflight_matches_the_ranking():
+    result = preflight(f"{ETH}/model", f"{ETH}/dataset", f"{ETH}/settings.json")
+    [ranked] = quant_models([f"{ETH}/model"], f"{ETH}/dataset", f"{ETH}/settings.json")
+    assert result["mse_q"] == ranked["mse_q"]
+    assert result["passed"] and result["matches_bounty"]
+    assert preflight(f"{ETH}/model", f"{ETH}/dataset", f"{ETH}/settings.json", verify="full") == result
+
+    # A bounty whose cap the settings do not reproduce cannot be claimed
+    other = preflight(f"{ETH}/model", f"{ETH}/dataset", f"{ETH}/settings.json", result["out"] + 1)
+    assert not other["matches_bounty"] and not other["passed"]
+    assert json.load(open("artifacts/quantization/preflight.json")) == other
+
+
+def test_command_line_exit_status(synthetic):
+    model, dataset, setting = synthetic(60, 3, 1)
+    args = [sys.executable, QUANTIZE, "--mode", "preflight", "--model", model, "--dataset", dataset,
+            "--settings", setting]
+    assert subprocess.run(args, capture_output=True).returncode == 0
+
+    np.save(f"{model}/W.npy", np.load(f"{model}/W.npy") * 10)
+    assert subprocess.run(args, capture_output=True).returncode == 1
+    report = json.load(open("artifacts/quantization/preflight.json"))
+    assert report["margin"] < 0 and not report["passed"]
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from prepare import ingest
+
+
+@pytest.fixture
+def sources(workdir):
+    rng = np.random.default_rng(0)
+    data = rng.random((500, 4))
+    np.save("data.npy", data)
+    with open("data.csv", "w") as f:
+        f.write("a,b,c,target\n")
+        for row in data:
+            f.write(",".join(repr(float(v)) for v in row) + "\n")
+    np.save("head.npy", data[:123])
+    np.save("tail.npy", data[123:])
+    return data
+
+
+def split(path):
+    return np.load(f"{path}/X.npy"), np.load(f"{path}/Y.npy")
+
+
+def test_split_does_not_depend_on_chunking(sources):
+    sizes = ingest(["data.npy"], "test", "train")
+    assert sizes["test"] + sizes["train"] == 500 and (sizes["p"], sizes["n"]) == (3, 1)
+    expected = split("test") + split("train")
+    X, Y = expected[0], expected[1]
+    assert X.shape == (sizes["test"], 3) and 0.05 < sizes["test"] / 500 < 0.25
+    assert {tuple(r) for r in np.hstack([X, Y])} <= {tuple(r) for r in sources}
+
+    for args, chunk_rows in ((["data.npy"], 1), (["data.npy"], 7), (["data.csv"], 64), (["head.npy", "tail.npy"], 50)):
+        assert ingest(args, "test", "train", chunk_rows=chunk_rows) == sizes
+        for a, b in zip(split("test") + split("train"), expected):
+            assert (a == b).all()
+
+
+def test_columns_by_name(sources):
+    ingest(["data.csv"], "test", features=["c", "a"], targets=["b"])
+    X, Y = split("test")
+    rows = {tuple(r) for r in sources[:, [2, 0, 1]]}
+    assert {tuple(r) for r in np.hstack([X, Y])} <= rows
+    with pytest.raises(AssertionError, match="unknown column"):
+        ingest(["data.csv"], "test", targets=["nope"])
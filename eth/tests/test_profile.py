@@ -0,0 +1,42 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ETH
+from quantize import profiling, quant_dataset, quant_model
+
+# The stages benchmark comparisons key on
+MODEL_STAGES = ["load", "quantize", "reference", "gemm_check", "error_check", "gemm", "error", "mse", "hash",
+                "serialize", "other"]
+
+
+@pytest.mark.parametrize("block_rows", [None, 7])
+def test_model_stages(synthetic, block_rows):
+    model, dataset, setting = synthetic(20, 4, 1)
+    with profiling("trace.json", tools=[], mode="model"):
+        quant_model(model, dataset, setting, block_rows=block_rows)
+    stages = json.load(open("trace.json"))["stages"]
+    assert [s["stage"] for s in stages] == MODEL_STAGES
+    calls = {s["stage"]: s["calls"] for s in stages}
+    assert calls["gemm"] == calls["error"] == (3 if block_rows else 1)
+
+
+def test_dataset_stages(synthetic):
+    _, dataset, setting = synthetic(20, 4, 1)
+    with profiling("trace.json", tools=[], mode="dataset"):
+        quant_dataset(dataset, setting)
+    stages = json.load(open("trace.json"))["stages"]
+    assert [s["stage"] for s in stages] == ["load", "quantize", "hash", "serialize", "other"]
+
+
+def test_script_traces_split_modes(synthetic):
+    # Run as a script, quantize.py is loaded as __main__ and again by
+    # shard.py; the shard stages still reach the trace
+    model, dataset, setting = synthetic(20, 4, 1)
+    subprocess.run([sys.executable, f"{ETH}/scripts/quantize.py", "--mode", "shard", "--model", model,
+                    "--dataset", dataset, "--settings", setting, "--shard-rows", "8", "--profile", "trace.json"],
+                   check=True, capture_output=True)
+    calls = {s["stage"]: s["calls"] for s in json.load(open("trace.json"))["stages"]}
+    assert calls["shard"] == 3
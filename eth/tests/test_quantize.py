@@ -0,0 +1,131 @@
+# quant_model and quant_dataset against the witness inputs written by the
+# baseline scripts for the repo's model/, dataset/ and settings.json
+# (tests/data/baseline), whatever the arithmetic backend. The baseline had
+# no hash_input
+import json
+import os
+
+import numpy as np
+import pytest
+
+import quantize
+from conftest import BASELINE, ETH
+from mimc7 import mimc7_multi_hash
+from quantize import (
+    CIRCUIT_MAX_ABS, HASH_SCALARS, INT64_MAX, bound_for, preflight, quant_dataset, quant_model,
+    quantization_constants, quantization_dtype,
+)
+
+
+def written(name):
+    data = json.load(open(f"artifacts/quantization/{name}.json"))
+    data.pop("hash_input")
+    return data
+
+
+def baseline(name):
+    return json.load(open(f"{BASELINE}/{name}.json"))
+
+
+@pytest.mark.parametrize("verify", ["full", "sample", "skip"])
+@pytest.mark.parametrize("block_rows", [None, 3, 7])
+def test_model_matches_the_baseline(verify, block_rows):
+    quant_model(f"{ETH}/model", f"{ETH}/dataset", f"{ETH}/settings.json", verify, block_rows)
+    assert written("inputs_ml") == baseline("inputs_ml")
+
+
+@pytest.mark.parametrize("block_rows", [None, 3, 7])
+def test_dataset_matches_the_baseline(block_rows):
+    quant_dataset(f"{ETH}/dataset", f"{ETH}/settings.json", block_rows)
+    assert written("inputs_dataset") == baseline("inputs_dataset")
+
+
+def test_dtype_from_the_bound():
+    assert quantization_dtype(INT64_MAX) is np.int64
+    assert quantization_dtype(INT64_MAX + 1) is object
+    with pytest.warns(UserWarning, match="circuit range proof"):
+        quantization_dtype(CIRCUIT_MAX_ABS + 1)
+
+    c = quantization_constants(json.load(open(f"{ETH}/settings.json")))
+    assert quantization_dtype(bound_for(c, 20, 4, 1)) is np.int64
+    assert quantization_dtype(bound_for(c, 10 ** 12, 4, 1)) is object
+
+
+def test_object_dtype_matches_int64(synthetic, monkeypatch):
+    model, dataset, setting = synthetic(300, 6, 3)
+    expected = preflight(model, dataset, setting, verify="full")
+
+    monkeypatch.setattr(quantize, "quantization_dtype", lambda bound: object)
+    assert preflight(model, dataset, setting, verify="full") == expected
+    quant_model(f"{ETH}/model", f"{ETH}/dataset", f"{ETH}/settings.json")
+    assert written("inputs_ml") == baseline("inputs_ml")
+
+
+def read_binary(path):
+    # Entries of a --format binary file as nested lists of ints, by its
+    # shapes sidecar
+    shapes = json.load(open(f"{path}.shapes.json"))
+    raw = open(f"{path}.bin", "rb").read()
+    data, offset = {}, 0
+    for key, shape in shapes.items():
+        size = int(np.prod(shape))
+        values = [int.from_bytes(raw[offset + 32 * i:offset + 32 * (i + 1)], "little") for i in range(size)]
+        data[key] = np.array(values, dtype=object).reshape(shape).tolist()
+        offset += 32 * size
+    assert offset == len(raw)
+    return data
+
+
+@pytest.mark.parametrize("block_rows", [None, 7])
+def test_compact_and_binary_formats(block_rows):
+    for fmt in ("compact", "binary"):
+        quant_model(f"{ETH}/model", f"{ETH}/dataset", f"{ETH}/settings.json", "full", block_rows, fmt)
+    assert "\n" not in open("artifacts/quantization/inputs_ml.json").read()
+    assert written("inputs_ml") == baseline("inputs_ml")
+
+    data = read_binary("artifacts/quantization/inputs_ml")
+    data.pop("hash_input")
+    assert data == baseline("inputs_ml")
+
+
+def test_cached_dataset_matches_the_baseline():
+    quant_model(f"{ETH}/model", f"{ETH}/dataset", f"{ETH}/settings.json")
+    hash_input = json.load(open("artifacts/quantization/inputs_ml.json"))["hash_input"]
+
+    # A cold run fills the cache, a warm one memory-maps it
+    for _ in range(2):
+        quant_model(f"{ETH}/model", f"{ETH}/dataset", f"{ETH}/settings.json", cache_dir="cache")
+        assert json.load(open("artifacts/quantization/inputs_ml.json"))["hash_input"] == hash_input
+        assert written("inputs_ml") == baseline("inputs_ml")
+        quant_dataset(f"{ETH}/dataset", f"{ETH}/settings.json", cache_dir="cache")
+        assert json.load(open("artifacts/quantization/inputs_dataset.json"))["hash_input"] == hash_input
+        assert written("inputs_dataset") == baseline("inputs_dataset")
+    assert len(os.listdir("cache")) == 1
+
+
+def test_hash_input_is_one_multihash_over_the_inputs():
+    # The circuit hashes X_q, Yt_q and HASH_SCALARS in one MultiMiMC7 chain
+    inputs = baseline("inputs_ml")
+    expected = mimc7_multi_hash(
+        np.ravel(inputs["X_q"]).tolist() + np.ravel(inputs["Yt_q"]).tolist() + [inputs[k] for k in HASH_SCALARS], 0
+    )
+    for block_rows in (None, 3):
+        quant_model(f"{ETH}/model", f"{ETH}/dataset", f"{ETH}/settings.json", block_rows=block_rows)
+        quant_dataset(f"{ETH}/dataset", f"{ETH}/settings.json", block_rows)
+        for name in ("inputs_ml", "inputs_dataset"):
+            assert int(json.load(open(f"artifacts/quantization/{name}.json"))["hash_input"]) == expected
+
+
+@pytest.mark.parametrize("block_rows", [None, 3])
+def test_process_pool_writes_the_same_bytes(block_rows):
+    for name, run in (
+        ("inputs_ml", lambda **kw: quant_model(f"{ETH}/model", f"{ETH}/dataset", f"{ETH}/settings.json",
+                                               block_rows=block_rows, **kw)),
+        ("inputs_dataset", lambda **kw: quant_dataset(f"{ETH}/dataset", f"{ETH}/settings.json", block_rows, **kw)),
+    ):
+        run()
+        serial = open(f"artifacts/quantization/{name}.json").read()
+        for cache_dir in (None, "cache"):
+            run(workers=2, cache_dir=cache_dir)
+            assert open(f"artifacts/quantization/{name}.json").read() == serial
+        assert written(name) == baseline(name)
@@ -0,0 +1,38 @@
+import io
+import json
+import sys
+
+from conftest import BASELINE, ETH
+from service import handle_request, serve
+
+PARAMS = dict(model=f"{ETH}/model", dataset=f"{ETH}/dataset", settings=f"{ETH}/settings.json")
+
+
+def result(line):
+    response = json.loads(line)
+    response["result"].pop("hash_input")
+    return response
+
+
+def test_model_and_dataset_match_the_baseline():
+    for method, name in (("model", "inputs_ml"), ("dataset", "inputs_dataset")):
+        response = result(handle_request(dict(id=3, method=method, params=PARAMS)))
+        assert response == dict(id=3, result=json.load(open(f"{BASELINE}/{name}.json")))
+
+
+def test_serve_over_stdin(monkeypatch, capsys):
+    requests = [
+        dict(id=0, method="ping"),
+        dict(id=1, method="model", params=dict(PARAMS, cache="cache")),
+        dict(id=2, method="nope"),
+    ]
+    lines = "\n".join(json.dumps(r) for r in requests) + "\nnot json\n"
+    monkeypatch.setattr(sys, "stdin", io.StringIO(lines))
+    serve()
+
+    responses = capsys.readouterr().out.splitlines()
+    assert json.loads(responses[0]) == dict(id=0, result={})
+    assert result(responses[1])["result"] == json.load(open(f"{BASELINE}/inputs_ml.json"))
+    assert json.loads(responses[2])["id"] == 2 and "unknown method" in json.loads(responses[2])["error"]
+    assert json.loads(responses[3])["id"] is None
+    assert len(responses) == 4
@@ -0,0 +1,37 @@
+import glob
+import json
+import os
+
+import pytest
+
+from quantize import preflight, quant_models
+from shard import combine_shards, quant_model_shards
+
+
+@pytest.mark.parametrize("shard_rows", [7, 50, 200])
+def test_shards_combine_to_the_full_run(synthetic, shard_rows):
+    model, dataset, setting = synthetic(200, 6, 5)
+    full = preflight(model, dataset, setting)
+    [ranked] = quant_models([model], dataset, setting)
+    assert ranked["mse_q"] == full["mse_q"]
+
+    result = quant_model_shards(model, dataset, setting, shard_rows)
+    assert result["mse_q"] == full["mse_q"]
+    assert result["out"] == full["out"]
+    assert result["shards"] == -(-200 // shard_rows)
+    assert not glob.glob("artifacts/quantization/shards/inputs_ml*")
+
+
+def test_shards_run_separately(synthetic):
+    model, dataset, setting = synthetic(120, 4, 2)
+    full = preflight(model, dataset, setting)
+    for k in (2, 0, 1):
+        [part] = quant_model_shards(model, dataset, setting, 50, [k])
+        assert part["index"] == k
+    paths = sorted(glob.glob("artifacts/quantization/shards/shard_*.json"))
+    assert combine_shards(paths)["mse_q"] == full["mse_q"]
+    assert json.load(open("artifacts/quantization/shards.json"))["rows"] == [[0, 50], [50, 100], [100, 120]]
+
+    os.remove(paths[1])
+    with pytest.raises(AssertionError):
+        combine_shards(paths[:1] + paths[2:])